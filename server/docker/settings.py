@@ -104,6 +104,7 @@ REDIS_SLAVE_PORT = get_env("REDIS_SLAVE_PORT", 6379, int)
 REDIS_ADDRESS = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 REDIS_READ_ONLY_ADDRESS = f"redis://{REDIS_SLAVE_HOST}:{REDIS_SLAVE_PORT}/0"
 CONNECTION_POOL_LIMIT = get_env("CONNECTION_POOL_LIMIT", 100, int)
+CONNECTION_POOL_IDLE_CHECK = get_env("CONNECTION_POOL_IDLE_CHECK", 30, int)
 
 # Session backend
 SESSION_ENGINE = "redis_sessions.session"
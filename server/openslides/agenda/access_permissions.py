@@ -1,7 +1,7 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from ..utils.access_permissions import BaseAccessPermissions
-from ..utils.auth import async_has_perm
+from ..utils.auth import PermissionContext, async_has_perm
 
 
 class ItemAccessPermissions(BaseAccessPermissions):
@@ -10,11 +10,30 @@ class ItemAccessPermissions(BaseAccessPermissions):
     """
 
     base_permission = "agenda.can_see"
+    group_restricted = True
+
+    async def async_is_unrestricted(
+        self, user_id: int, permission_context: Optional[PermissionContext] = None
+    ) -> bool:
+        """
+        Users with all agenda permissions see all items unchanged.
+        """
+        for permission in (
+            "agenda.can_see",
+            "agenda.can_manage",
+            "agenda.can_see_internal_items",
+        ):
+            if not await async_has_perm(user_id, permission, permission_context):
+                return False
+        return True
 
     # TODO: In the following method we use full_data['is_hidden'] and
     # full_data['is_internal'] but this can be out of date.
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Returns the restricted serialized data for the instance prepared
@@ -36,21 +55,27 @@ class ItemAccessPermissions(BaseAccessPermissions):
             return {key: full_data[key] for key in whitelist}
 
         # Parse data.
-        if full_data and await async_has_perm(user_id, "agenda.can_see"):
+        if full_data and await async_has_perm(
+            user_id, "agenda.can_see", permission_context
+        ):
             # Assume the user has all permissions. Restrict this below.
             data = full_data
 
             blocked_keys: List[str] = []
 
             # Restrict data for non managers
-            if not await async_has_perm(user_id, "agenda.can_manage"):
+            if not await async_has_perm(
+                user_id, "agenda.can_manage", permission_context
+            ):
                 data = [
                     full for full in data if not full["is_hidden"]
                 ]  # filter hidden items
                 blocked_keys.append("comment")
 
             # Restrict data for users without can_see_internal_items
-            if not await async_has_perm(user_id, "agenda.can_see_internal_items"):
+            if not await async_has_perm(
+                user_id, "agenda.can_see_internal_items", permission_context
+            ):
                 data = [full for full in data if not full["is_internal"]]
                 blocked_keys.append("duration")
 
@@ -70,3 +95,4 @@ class ListOfSpeakersAccessPermissions(BaseAccessPermissions):
     """
 
     base_permission = "agenda.can_see_list_of_speakers"
+    group_restricted = True
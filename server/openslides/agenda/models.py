@@ -481,6 +481,7 @@ class Speaker(RESTModelMixin, models.Model):
     """
 
     objects = SpeakerManager()
+    sub_element_key = "speakers"
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=CASCADE_AND_AUTOUPDATE)
     """
@@ -533,6 +534,7 @@ class Speaker(RESTModelMixin, models.Model):
         Set the weight to None and the time to now. If anyone is still
         speaking, end his speech.
         """
+        changed_speakers = [self]
         try:
             current_speaker = (
                 Speaker.objects.filter(
@@ -544,12 +546,15 @@ class Speaker(RESTModelMixin, models.Model):
         except Speaker.DoesNotExist:
             pass
         else:
-            # Do not send an autoupdate for the countdown and the list_of_speakers. This is done
-            # by saving the list_of_speakers and countdown later.
+            # Do not send an autoupdate for the countdown and the speaker. This is done
+            # by informing about the changed speakers and saving the countdown later.
             current_speaker.end_speech(skip_autoupdate=True)
+            changed_speakers.append(current_speaker)
         self.weight = None
         self.begin_time = timezone.now()
-        self.save()  # Here, the list_of_speakers is saved and causes an autoupdate.
+        self.save(skip_autoupdate=True)
+        # Here, the changed speakers of the list_of_speakers cause an autoupdate.
+        inform_changed_data(changed_speakers)
         if config["agenda_couple_countdown_and_speakers"]:
             countdown, created = Countdown.objects.get_or_create(
                 pk=1,
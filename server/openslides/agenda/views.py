@@ -540,7 +540,7 @@ class ListOfSpeakersViewSet(
                 weight += 1
 
         # send autoupdate
-        inform_changed_data(list_of_speakers)
+        inform_changed_data(valid_speakers)
 
         # Initiate response.
         return Response({"detail": "List of speakers successfully sorted."})
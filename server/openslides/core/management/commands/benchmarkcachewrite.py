@@ -0,0 +1,78 @@
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from openslides.utils.cache_providers import RedisCacheProvider
+from openslides.utils.redis import get_connection, use_redis
+
+
+class BenchmarkCacheProvider(RedisCacheProvider):
+    """
+    Cache provider with own keys, so the benchmark does not touch the cache.
+    """
+
+    full_data_cache_key = "benchmark_full_data"
+    collections_cache_key = "benchmark_full_data_collections"
+    change_id_cache_key = "benchmark_change_id"
+    change_id_counter_key = "benchmark_change_id_counter"
+    schema_cache_key = "benchmark_schema"
+    cache_ready_key = "benchmark_cache_ready"
+
+
+class Command(BaseCommand):
+    """
+    Command to compare the lua script and the transaction to write changed
+    elements into redis.
+    """
+
+    help = (
+        "Compares writing changed elements into redis with the lua script and "
+        "with a transaction. Select the transaction with the setting "
+        "REDIS_PIPELINED_WRITES."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+        parser.add_argument("--rounds", type=int, default=20)
+
+    def handle(self, *args, **options):
+        if not use_redis:
+            raise CommandError("Redis is not configured.")
+
+        async def ensure_cache():
+            raise CommandError("The benchmark data was deleted during the benchmark.")
+
+        cache_provider = BenchmarkCacheProvider(ensure_cache)
+        try:
+            async_to_sync(cache_provider.reset_full_cache)(
+                {"benchmark/element:0": "{}"}, 1
+            )
+            for size in options["sizes"]:
+                changed_elements = []
+                for id in range(1, size + 1):
+                    changed_elements.append(f"benchmark/element:{id}")
+                    changed_elements.append(f'{{"id":{id},"text":"{"x" * 500}"}}')
+                for name, add_changed_elements in (
+                    ("lua script", cache_provider.add_changed_elements_script),
+                    ("transaction", cache_provider.add_changed_elements_pipelined),
+                ):
+                    start = time.perf_counter()
+                    for _ in range(options["rounds"]):
+                        async_to_sync(add_changed_elements)(changed_elements, [])
+                    duration = (time.perf_counter() - start) / options["rounds"]
+                    self.stdout.write(
+                        f"{size} elements, {name}: {duration * 1000:.2f} ms"
+                    )
+        finally:
+            async_to_sync(self.delete_keys)(cache_provider)
+
+    async def delete_keys(self, cache_provider):
+        async with get_connection() as redis:
+            await redis.delete(
+                cache_provider.get_collection_cache_key("benchmark/element"),
+                cache_provider.collections_cache_key,
+                cache_provider.change_id_cache_key,
+                cache_provider.change_id_counter_key,
+                cache_provider.cache_ready_key,
+            )
@@ -0,0 +1,128 @@
+import random
+import time
+from typing import Any, Dict, List
+
+from django.core.management.base import BaseCommand
+
+from openslides.utils.json_codec import JsonCodec, codec_classes
+
+
+def generate_meeting(
+    motions: int, users: int, items: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Generates full data like in a big meeting: motions with long html texts,
+    delegates, agenda items and polls with many votes.
+    """
+    paragraph = (
+        "<p>" + "Lorem ipsum dolor sit amet, consetetur sadipscing. " * 20 + "</p>"
+    )
+    data: Dict[str, List[Dict[str, Any]]] = {
+        "users/user": [
+            {
+                "id": id,
+                "username": f"delegate{id}",
+                "first_name": "First",
+                "last_name": f"Delegate {id}",
+                "structure_level": "Structure level",
+                "groups_id": [3],
+                "is_present": bool(id % 2),
+                "vote_delegated_from_users_id": [],
+                "about_me": paragraph,
+            }
+            for id in range(1, users + 1)
+        ],
+        "motions/motion": [
+            {
+                "id": id,
+                "identifier": f"A{id}",
+                "title": f"Motion {id}",
+                "text": paragraph * 10,
+                "reason": paragraph * 3,
+                "amendment_paragraphs": None,
+                "state_id": 1,
+                "submitters": [
+                    {"id": id, "user_id": random.randint(1, users), "weight": 1}
+                ],
+                "supporters_id": random.sample(range(1, users + 1), min(10, users)),
+                "comments": [],
+                "polls_id": [id],
+            }
+            for id in range(1, motions + 1)
+        ],
+        "motions/motion-poll": [
+            {
+                "id": id,
+                "motion_id": id,
+                "state": 4,
+                "pollmethod": "YNA",
+                "votesvalid": "1000.000000",
+                "votesinvalid": "0.000000",
+                "votescast": "1000.000000",
+                "voted_id": list(range(1, users + 1)),
+            }
+            for id in range(1, motions + 1)
+        ],
+        "agenda/item": [
+            {
+                "id": id,
+                "item_number": str(id),
+                "title_information": {"title": f"Item {id}"},
+                "comment": None,
+                "is_hidden": False,
+                "is_internal": False,
+                "duration": None,
+                "weight": id,
+                "parent_id": None,
+            }
+            for id in range(1, items + 1)
+        ],
+    }
+    return data
+
+
+class Command(BaseCommand):
+    """
+    Command to compare the installed JSON codecs.
+    """
+
+    help = (
+        "Compares the speed of all installed JSON codecs on a generated meeting. "
+        "Select the codec with the setting JSON_CODEC."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--motions", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=3000)
+        parser.add_argument("--items", type=int, default=1000)
+        parser.add_argument("--rounds", type=int, default=3)
+
+    def handle(self, *args, **options):
+        data = generate_meeting(options["motions"], options["users"], options["items"])
+        elements = [element for collection in data.values() for element in collection]
+        self.stdout.write(f"Generated {len(elements)} elements.")
+
+        for name, codec_class in codec_classes.items():
+            try:
+                codec: JsonCodec = codec_class()
+            except ImportError:
+                self.stdout.write(f"{name}: not installed")
+                continue
+
+            dumps_time = loads_time = 0.0
+            for _ in range(options["rounds"]):
+                start = time.perf_counter()
+                encoded = [codec.dumps_bytes(element) for element in elements]
+                dumps_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                for encoded_element in encoded:
+                    codec.loads(encoded_element)
+                loads_time += time.perf_counter() - start
+
+            size = sum(len(encoded_element) for encoded_element in encoded)
+            self.stdout.write(
+                f"{name}: dumps {dumps_time / options['rounds'] * 1000:.1f} ms, "
+                f"loads {loads_time / options['rounds'] * 1000:.1f} ms, "
+                f"{size / 1024 / 1024:.1f} MiB"
+            )
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import make_aware
+
+from openslides.core.models import (
+    HISTORY_SNAPSHOT_INTERVAL,
+    HISTORY_SNAPSHOT_MINUTES,
+    History,
+)
+
+
+class Command(BaseCommand):
+    """
+    Command to create history snapshots and to compact the history.
+    """
+
+    help = (
+        "Creates history snapshots, so the history data has not to be replayed from "
+        "the beginning. With --before, all history entries until this date are "
+        "deleted. Their state is kept as a snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=HISTORY_SNAPSHOT_INTERVAL or 10000,
+            help="Amount of history entries between two snapshots.",
+        )
+        parser.add_argument(
+            "--minutes",
+            type=int,
+            default=HISTORY_SNAPSHOT_MINUTES,
+            help="Minutes of history between two snapshots. 0 disables it.",
+        )
+        parser.add_argument(
+            "--before",
+            help="Delete all history entries until this date (ISO 8601 format).",
+        )
+
+    def handle(self, *args, **options):
+        if options["interval"] < 1:
+            raise CommandError("The interval has to be positive.")
+        if options["minutes"] < 0:
+            raise CommandError("The minutes must not be negative.")
+        created = History.objects.create_snapshots(
+            options["interval"], options["minutes"]
+        )
+        self.stdout.write(f"Created {created} history snapshots.")
+
+        if options["before"]:
+            try:
+                before = parse_datetime(options["before"])
+            except ValueError:
+                before = None
+            if before is None:
+                raise CommandError(f"Invalid date {options['before']}.")
+            if before.tzinfo is None:
+                before = make_aware(before)
+            deleted = History.objects.compact(before)
+            self.stdout.write(f"Deleted {deleted} history entries.")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
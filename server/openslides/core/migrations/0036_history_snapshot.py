@@ -0,0 +1,44 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:57
+
+import jsonfield.encoder
+import jsonfield.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0035_autopilot_permission"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HistorySnapshot",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_history_id", models.PositiveIntegerField(unique=True)),
+                ("now", models.DateTimeField()),
+                (
+                    "full_data",
+                    jsonfield.fields.JSONField(
+                        dump_kwargs={
+                            "cls": jsonfield.encoder.JSONEncoder,
+                            "separators": (",", ":"),
+                        },
+                        load_kwargs={},
+                    ),
+                ),
+            ],
+            options={
+                "default_permissions": (),
+            },
+        ),
+    ]
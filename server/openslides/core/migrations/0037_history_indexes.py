@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0036_history_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="history",
+            index=models.Index(
+                fields=["element_id", "now"], name="core_histor_element_224ae1_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="history",
+            index=models.Index(fields=["now"], name="core_histor_now_0802db_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="history",
+            index=models.Index(
+                fields=["user", "now"], name="core_histor_user_id_4db82a_idx"
+            ),
+        ),
+    ]
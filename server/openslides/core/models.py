@@ -1,16 +1,19 @@
-from typing import Iterable
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
-from django.db import models, transaction
+from django.db import IntegrityError, connections, models, transaction
 from django.utils.timezone import now
 from jsonfield import JSONField
 
 from openslides.utils.autoupdate import AutoupdateElement
 from openslides.utils.cache import element_cache, get_element_id
-from openslides.utils.locking import locking
+from openslides.utils.locking import Lock
 from openslides.utils.manager import BaseManager
 from openslides.utils.models import SET_NULL_AND_AUTOUPDATE, RESTModelMixin
+from openslides.utils.utils import split_element_id
 
 from .access_permissions import (
     ConfigAccessPermissions,
@@ -22,6 +25,10 @@ from .access_permissions import (
 )
 
 
+HISTORY_SNAPSHOT_INTERVAL = getattr(settings, "HISTORY_SNAPSHOT_INTERVAL", 10000)
+HISTORY_SNAPSHOT_MINUTES = getattr(settings, "HISTORY_SNAPSHOT_MINUTES", 60)
+
+
 class ProjectorManager(BaseManager):
     """
     Customized model manager to support our get_prefetched_queryset method.
@@ -264,20 +271,41 @@ class HistoryManager(BaseManager):
     Customized model manager for the history model.
     """
 
-    def add_elements(self, elements: Iterable[AutoupdateElement]):
+    def add_elements(
+        self,
+        elements: Iterable[AutoupdateElement],
+        history_time: Optional[datetime] = None,
+    ):
         """
         Method to add elements to the history. This does not trigger autoupdate.
+
+        The history entries are inserted with bulk inserts. If history_time is
+        not given, the current time is used.
         """
-        with transaction.atomic():
-            instances = []
+        if history_time is None:
             history_time = now()
-            for element in elements:
-                if element.get("disable_history"):
-                    # Do not update history if history is disabled.
-                    continue
-                # HistoryData is not a root rest element so there is no autoupdate and not history saving here.
-                data = HistoryData.objects.create(full_data=element.get("full_data"))
-                instance = self.model(
+        # Do not update history if history is disabled.
+        elements = [
+            element for element in elements if not element.get("disable_history")
+        ]
+        if not elements:
+            return []
+
+        with transaction.atomic():
+            # HistoryData is not a root rest element so there is no autoupdate and not history saving here.
+            history_data = [
+                HistoryData(full_data=element.get("full_data")) for element in elements
+            ]
+            if connections[self.db].features.can_return_ids_from_bulk_insert:
+                HistoryData.objects.bulk_create(history_data)
+            else:
+                # The ids of the history data are required for the history
+                # instances. Without returned ids of bulk inserts, they have
+                # to be saved one by one.
+                for data in history_data:
+                    data.save()
+            instances = [
+                self.model(
                     element_id=get_element_id(
                         element["collection_string"], element["id"]
                     ),
@@ -286,8 +314,9 @@ class HistoryManager(BaseManager):
                     user_id=element.get("user_id"),
                     full_data=data,
                 )
-                instance.save()
-                instances.append(instance)
+                for element, data in zip(elements, history_data)
+            ]
+            self.bulk_create(instances)
         return instances
 
     def build_history(self):
@@ -297,24 +326,179 @@ class HistoryManager(BaseManager):
         async_to_sync(self.async_build_history)()
 
     async def async_build_history(self):
-        lock_name = "build_cache"
-        if await locking.set(lock_name):
+        lock = Lock("build_cache")
+        if await lock.acquire(blocking=False):
             try:
-                if self.all().count() == 0:
-                    elements = []
-                    all_full_data = await element_cache.get_all_data_list()
-                    for collection_string, data in all_full_data.items():
-                        for full_data in data:
-                            elements.append(
-                                AutoupdateElement(
-                                    id=full_data["id"],
-                                    collection_string=collection_string,
-                                    full_data=full_data,
-                                )
-                            )
-                    self.add_elements(elements)
+                # The database is used in a thread, so the event loop can still
+                # renew the lock.
+                await sync_to_async(self._build_history)()
             finally:
-                await locking.delete(lock_name)
+                await lock.release()
+
+    def _build_history(self) -> None:
+        if self.all().count() == 0:
+            # Add the history collection by collection, so only the data of one
+            # collection is held in memory.
+            with transaction.atomic():
+                for collection_string in element_cache.cachables.keys():
+                    collection_data = async_to_sync(element_cache.get_collection_data)(
+                        collection_string
+                    )
+                    self.add_elements(
+                        AutoupdateElement(
+                            id=full_data["id"],
+                            collection_string=collection_string,
+                            full_data=full_data,
+                        )
+                        for full_data in collection_data.values()
+                    )
+
+    def get_dataset(
+        self, until: Optional[datetime] = None, save_snapshot: bool = True
+    ) -> Dict[str, Dict[int, Dict[str, Any]]]:
+        """
+        Returns all elements of the history until (including) the given time as
+        dict: collection <--> id <--> full_data
+
+        Starts with the newest snapshot before the given time and replays only the
+        history entries after it. If save_snapshot is True and at least
+        HISTORY_SNAPSHOT_INTERVAL entries or HISTORY_SNAPSHOT_MINUTES minutes of
+        history had to be replayed, the result is saved as a new snapshot.
+        """
+        snapshots = HistorySnapshot.objects.order_by("-last_history_id")
+        queryset = self.select_related("full_data").order_by("pk")
+        if until is not None:
+            # The history is replayed in the order of the ids. Entries, that are
+            # saved later, can have an earlier time, so everything until the last
+            # entry with this time is used.
+            last_history_id = self.filter(now__lte=until).aggregate(
+                last_id=models.Max("pk")
+            )["last_id"]
+            if last_history_id is None:
+                # The history until this time is empty or compacted.
+                snapshots = snapshots.filter(now__lte=until)
+                queryset = queryset.none()
+            else:
+                snapshots = snapshots.filter(last_history_id__lte=last_history_id)
+                queryset = queryset.filter(pk__lte=last_history_id)
+        snapshot = snapshots.first()
+        start: Optional[datetime] = None
+        if snapshot is None:
+            dataset: Dict[str, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+        else:
+            dataset = snapshot.get_dataset()
+            queryset = queryset.filter(pk__gt=snapshot.last_history_id)
+            start = snapshot.now
+
+        last_instance = None
+        replayed = 0
+        for last_instance in queryset.iterator():
+            if start is None:
+                start = last_instance.now
+            replay_history(dataset, last_instance)
+            replayed += 1
+
+        if (
+            save_snapshot
+            and last_instance is not None
+            and start is not None
+            and needs_snapshot(
+                replayed,
+                last_instance.now - start,
+                HISTORY_SNAPSHOT_INTERVAL,
+                HISTORY_SNAPSHOT_MINUTES,
+            )
+        ):
+            HistorySnapshot.objects.create_from_dataset(dataset, last_instance)
+        return dataset
+
+    def create_snapshots(
+        self,
+        interval: int = HISTORY_SNAPSHOT_INTERVAL,
+        minutes: int = HISTORY_SNAPSHOT_MINUTES,
+    ) -> int:
+        """
+        Saves a snapshot after every interval history entries or minutes of
+        history after the newest snapshot. Returns the amount of created
+        snapshots.
+        """
+        snapshot = HistorySnapshot.objects.order_by("-last_history_id").first()
+        queryset = self.select_related("full_data").order_by("pk")
+        if snapshot is None:
+            dataset: Dict[str, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+            start: Optional[datetime] = None
+        else:
+            dataset = snapshot.get_dataset()
+            queryset = queryset.filter(pk__gt=snapshot.last_history_id)
+            start = snapshot.now
+
+        created = 0
+        count = 0
+        for instance in queryset.iterator():
+            replay_history(dataset, instance)
+            count += 1
+            if start is None:
+                start = instance.now
+            if needs_snapshot(count, instance.now - start, interval, minutes):
+                HistorySnapshot.objects.create_from_dataset(dataset, instance)
+                created += 1
+                count = 0
+                start = instance.now
+        return created
+
+    def compact(self, before: datetime) -> int:
+        """
+        Deletes all history entries until (including) the given time. Their
+        state is kept as a snapshot, so the history data after this time is still
+        complete. Returns the amount of deleted history entries.
+        """
+        last_instance = self.filter(now__lte=before).order_by("pk").last()
+        if last_instance is None:
+            return 0
+        with transaction.atomic():
+            if not HistorySnapshot.objects.filter(
+                last_history_id=last_instance.pk
+            ).exists():
+                HistorySnapshot.objects.create_from_dataset(
+                    self.get_dataset(last_instance.now, save_snapshot=False),
+                    last_instance,
+                )
+            HistorySnapshot.objects.filter(
+                last_history_id__lt=last_instance.pk
+            ).delete()
+            # Deletes the history via CASCADE.
+            _, deleted = HistoryData.objects.filter(
+                history__pk__lte=last_instance.pk
+            ).delete()
+        return deleted.get("core.History", 0)
+
+
+def needs_snapshot(
+    replayed: int, duration: timedelta, interval: int, minutes: int
+) -> bool:
+    """
+    Returns True, if a snapshot should be saved after replaying the given amount
+    of history entries, that span the given duration. 0 disables the interval
+    or minutes.
+    """
+    return bool(
+        (interval and replayed >= interval)
+        or (minutes and replayed and duration >= timedelta(minutes=minutes))
+    )
+
+
+def replay_history(
+    dataset: Dict[str, Dict[int, Dict[str, Any]]], instance: "History"
+) -> None:
+    """
+    Applies the history entry to the dataset.
+    """
+    collection, id = split_element_id(instance.element_id)
+    full_data = instance.full_data.full_data
+    if full_data:
+        dataset[collection][id] = full_data
+    elif id in dataset[collection]:
+        del dataset[collection][id]
 
 
 class History(models.Model):
@@ -342,3 +526,65 @@ class History(models.Model):
     class Meta:
         default_permissions = ()
         permissions = (("can_see_history", "Can see history"),)
+        indexes = [
+            models.Index(fields=["element_id", "now"]),
+            models.Index(fields=["now"]),
+            models.Index(fields=["user", "now"]),
+        ]
+
+
+class HistorySnapshotManager(models.Manager):
+    """
+    Customized model manager for the history snapshot model.
+    """
+
+    def create_from_dataset(
+        self, dataset: Dict[str, Dict[int, Dict[str, Any]]], last_history: History
+    ) -> "HistorySnapshot":
+        """
+        Saves the dataset as snapshot after the given history entry. If another
+        request saved this snapshot in the meantime, the existing one is returned.
+        """
+        try:
+            with transaction.atomic():
+                return self.create(
+                    last_history_id=last_history.pk,
+                    now=last_history.now,
+                    full_data={
+                        collection: list(elements.values())
+                        for collection, elements in dataset.items()
+                    },
+                )
+        except IntegrityError:
+            return self.get(last_history_id=last_history.pk)
+
+
+class HistorySnapshot(models.Model):
+    """
+    Django model to save all elements of the history at one point in time, so
+    the history does not have to be replayed from the beginning.
+
+    last_history_id is the id of the last history entry included in the
+    snapshot. It is not a foreign key, because the history entries up to a
+    snapshot can be compacted.
+    """
+
+    objects = HistorySnapshotManager()
+
+    last_history_id = models.PositiveIntegerField(unique=True)
+
+    now = models.DateTimeField()
+
+    full_data = JSONField()
+
+    class Meta:
+        default_permissions = ()
+
+    def get_dataset(self) -> Dict[str, Dict[int, Dict[str, Any]]]:
+        """
+        Returns the elements as dict: collection <--> id <--> full_data
+        """
+        dataset: Dict[str, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+        for collection, elements in self.full_data.items():
+            dataset[collection] = {element["id"]: element for element in elements}
+        return dataset
@@ -7,6 +7,7 @@ urlpatterns = [
     url(r"^servertime/$", views.ServertimeView.as_view(), name="core_servertime"),
     url(r"^constants/$", views.ConstantsView.as_view(), name="core_constants"),
     url(r"^version/$", views.VersionView.as_view(), name="core_version"),
+    url(r"^all-data/$", views.AllDataView.as_view(), name="core_all_data"),
     url(
         r"^history/information/$",
         views.HistoryInformationView.as_view(),
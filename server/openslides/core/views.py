@@ -1,26 +1,23 @@
 import datetime
 import os
-from collections import defaultdict
 from typing import Any, Dict
 
 from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.contrib.staticfiles import finders
 from django.contrib.staticfiles.views import serve
-from django.db.models import F
-from django.http import Http404, HttpResponse
+from django.db.models import F, Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils.timezone import now
 from django.views import static
 from django.views.generic.base import View
 
-from openslides.utils.utils import split_element_id
-
 from .. import __license__ as license, __url__ as url, __version__ as version
 from ..users.models import User
 from ..utils import views as utils_views
 from ..utils.arguments import arguments
 from ..utils.auth import GROUP_ADMIN_PK, anonymous_is_enabled, has_perm, in_some_groups
-from ..utils.autoupdate import inform_changed_data
+from ..utils.autoupdate import inform_changed_data, stream_all_data
 from ..utils.cache import element_cache
 from ..utils.constants import get_constants
 from ..utils.plugins import (
@@ -55,6 +52,7 @@ from .models import (
     Countdown,
     History,
     HistoryData,
+    HistorySnapshot,
     ProjectionDefault,
     Projector,
     ProjectorMessage,
@@ -63,6 +61,9 @@ from .models import (
 from .serializers import elements_array_validator, elements_validator
 
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
 # Special Django views
 
 
@@ -624,6 +625,24 @@ class VersionView(utils_views.APIView):
         return result
 
 
+class AllDataView(View):
+    """
+    Returns all data restricted for the request user in the autoupdate format.
+
+    The response is streamed, so the data is never held completely in memory.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        user_id = request.user.pk or 0
+        if not user_id and not anonymous_is_enabled():
+            return HttpResponse(status=403)
+        return StreamingHttpResponse(
+            stream_all_data(user_id), content_type="application/json"
+        )
+
+
 class HistoryInformationView(utils_views.APIView):
     """
     View to retrieve information about OpenSlides history.
@@ -635,6 +654,15 @@ class HistoryInformationView(utils_views.APIView):
 
         /?type=element&value=motions%2Fmotion%3A42 if your search for motion 42
 
+        /?type=range&from=1600000000&to=1600003600&user_id=3 for all changes of
+        user 3 in this hour. All three parameters are optional.
+
+    The newest entries are returned first. If the query parameter 'limit' is
+    given, only this amount of entries is returned together with a cursor for
+    the next entries: {"results": [...], "cursor": "..."}. Use the query
+    parameter 'cursor' to get them. The cursor is null, if there are no more
+    entries.
+
     Use DELETE to clear the history.
     """
 
@@ -647,31 +675,108 @@ class HistoryInformationView(utils_views.APIView):
         if not has_perm(self.request.user, "core.can_see_history"):
             self.permission_denied(self.request)
         type = self.request.query_params.get("type")
-        value = self.request.query_params.get("value")
-        if type not in ("element"):
+        if type == "element":
+            queryset = self.get_element_queryset(self.request.query_params.get("value"))
+        elif type == "range":
+            queryset = self.get_range_queryset()
+        else:
             raise ValidationError(
-                {"detail": "Invalid input. Type should be 'element' or 'text'."}
+                {"detail": "Invalid input. Type should be 'element' or 'range'."}
             )
-        # We currently just support searching by element id.
-        data = self.get_data_element_search(value)
-        return data
-
-    def get_data_element_search(self, value):
-        """
-        Retrieves history information for element search.
-        """
-        data = []
-        for instance in History.objects.filter(element_id=value).order_by("-now"):
-            if instance.information:
-                data.append(
-                    {
-                        "element_id": instance.element_id,
-                        "timestamp": instance.now.timestamp(),
-                        "information": instance.information,
-                        "user_id": instance.user.pk if instance.user else None,
-                    }
+        queryset = queryset.exclude(information=[]).order_by("-now", "-pk")
+
+        limit = self.get_int_query_param("limit")
+        if limit is None:
+            return [self.get_entry(instance) for instance in queryset]
+        if limit < 1:
+            raise ValidationError({"detail": "Invalid input. Limit must be positive."})
+
+        cursor = self.request.query_params.get("cursor")
+        if cursor:
+            cursor_now, cursor_pk = self.parse_cursor(cursor)
+            queryset = queryset.filter(
+                Q(now__lt=cursor_now) | Q(now=cursor_now, pk__lt=cursor_pk)
+            )
+        instances = list(queryset[: limit + 1])
+        if len(instances) > limit:
+            last = instances[limit - 1]
+            next_cursor = self.get_cursor(last)
+        else:
+            next_cursor = None
+        return {
+            "results": [self.get_entry(instance) for instance in instances[:limit]],
+            "cursor": next_cursor,
+        }
+
+    def get_element_queryset(self, value):
+        """
+        Returns the history of one element.
+        """
+        return History.objects.filter(element_id=value)
+
+    def get_range_queryset(self):
+        """
+        Returns the history between the UNIX timestamps 'from' and 'to' (both
+        including), optional of only one user.
+        """
+        queryset = History.objects.all()
+        from_timestamp = self.get_int_query_param("from")
+        if from_timestamp is not None:
+            queryset = queryset.filter(
+                now__gte=datetime.datetime.fromtimestamp(
+                    from_timestamp, datetime.timezone.utc
                 )
-        return data
+            )
+        to_timestamp = self.get_int_query_param("to")
+        if to_timestamp is not None:
+            queryset = queryset.filter(
+                now__lte=datetime.datetime.fromtimestamp(
+                    to_timestamp, datetime.timezone.utc
+                )
+            )
+        user_id = self.get_int_query_param("user_id")
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
+
+    def get_int_query_param(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError(
+                {"detail": f"Invalid input. {name} should be an integer."}
+            )
+
+    def get_cursor(self, instance):
+        """
+        Returns the cursor after the given entry. It consists of the UNIX time in
+        microseconds and the id, so it can be used in URLs without encoding.
+        """
+        microseconds = (instance.now - EPOCH) // datetime.timedelta(microseconds=1)
+        return f"{microseconds}_{instance.pk}"
+
+    def parse_cursor(self, cursor):
+        try:
+            microseconds, cursor_pk = cursor.split("_")
+            cursor_datetime = EPOCH + datetime.timedelta(microseconds=int(microseconds))
+            cursor_id = int(cursor_pk)
+        except (ValueError, OverflowError):
+            raise ValidationError({"detail": "Invalid input. Invalid cursor."})
+        return cursor_datetime, cursor_id
+
+    def get_entry(self, instance):
+        """
+        Returns the information of one history entry.
+        """
+        return {
+            "element_id": instance.element_id,
+            "timestamp": instance.now.timestamp(),
+            "information": instance.information,
+            "user_id": instance.user_id,
+        }
 
     def delete(self, request, *args, **kwargs):
         """
@@ -681,8 +786,9 @@ class HistoryInformationView(utils_views.APIView):
         if not in_some_groups(request.user.pk or 0, [GROUP_ADMIN_PK]):
             self.permission_denied(request)
 
-        # Delete history data and history (via CASCADE)
+        # Delete history data and history (via CASCADE) and all snapshots
         HistoryData.objects.all().delete()
+        HistorySnapshot.objects.all().delete()
 
         # Rebuild history.
         History.objects.build_history()
@@ -704,6 +810,8 @@ class HistoryDataView(utils_views.APIView):
         """
         Checks if user is in admin group. If yes, all history data until
         (including) timestamp are collected to build a valid dataset for the client.
+        The dataset is replayed from the newest history snapshot before the
+        timestamp.
         """
         if not in_some_groups(self.request.user.pk or 0, [GROUP_ADMIN_PK]):
             self.permission_denied(self.request)
@@ -713,21 +821,10 @@ class HistoryDataView(utils_views.APIView):
             raise ValidationError(
                 {"detail": "Invalid input. Timestamp should be an integer."}
             )
-        queryset = History.objects.select_related("full_data")
-        if timestamp:
-            queryset = queryset.filter(
-                now__lte=datetime.datetime.fromtimestamp(timestamp)
-            )
-
         # collection <--> id <--> full_data
-        dataset: Dict[str, Dict[int, Any]] = defaultdict(dict)
-        for instance in queryset:
-            collection, id = split_element_id(instance.element_id)
-            full_data = instance.full_data.full_data
-            if full_data:
-                dataset[collection][id] = full_data
-            elif id in dataset[collection]:
-                del dataset[collection][id]
+        dataset = History.objects.get_dataset(
+            datetime.datetime.fromtimestamp(timestamp) if timestamp else None
+        )
 
         # Ensure, that newer configs than the requested timepoint are also
         # included, so the client is happy and doesn't miss any config variables.
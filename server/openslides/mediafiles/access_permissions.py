@@ -1,7 +1,12 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from ..utils.access_permissions import BaseAccessPermissions
-from ..utils.auth import async_has_perm, async_in_some_groups, async_is_superadmin
+from ..utils.auth import (
+    PermissionContext,
+    async_has_perm,
+    async_in_some_groups,
+    async_is_superadmin,
+)
 
 
 class MediafileAccessPermissions(BaseAccessPermissions):
@@ -12,17 +17,20 @@ class MediafileAccessPermissions(BaseAccessPermissions):
     base_permission = "mediafiles.can_see"
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Returns the restricted serialized data for the instance prepared
         for the user. Removes hidden mediafiles for some users.
         """
-        if not await async_has_perm(user_id, "mediafiles.can_see"):
+        if not await async_has_perm(user_id, "mediafiles.can_see", permission_context):
             return []
 
         # This allows to see everything, which is important for inherited_access_groups=False.
-        if await async_is_superadmin(user_id):
+        if await async_is_superadmin(user_id, permission_context):
             return full_data
 
         data = []
@@ -30,7 +38,9 @@ class MediafileAccessPermissions(BaseAccessPermissions):
             access_groups = full["inherited_access_groups_id"]
             if (isinstance(access_groups, bool) and access_groups) or (
                 isinstance(access_groups, list)
-                and await async_in_some_groups(user_id, access_groups)
+                and await async_in_some_groups(
+                    user_id, access_groups, permission_context=permission_context
+                )
             ):
                 data.append(full)
 
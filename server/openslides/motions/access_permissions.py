@@ -1,13 +1,12 @@
-import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from ..poll.access_permissions import (
     BaseOptionAccessPermissions,
     BasePollAccessPermissions,
     BaseVoteAccessPermissions,
 )
-from ..utils.access_permissions import BaseAccessPermissions
-from ..utils.auth import async_has_perm, async_in_some_groups
+from ..utils.access_permissions import BaseAccessPermissions, restricted_copy
+from ..utils.auth import PermissionContext, async_has_perm, async_in_some_groups
 
 
 class MotionAccessPermissions(BaseAccessPermissions):
@@ -18,7 +17,10 @@ class MotionAccessPermissions(BaseAccessPermissions):
     base_permission = "motions.can_see"
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Returns the restricted serialized data for the instance prepared for
@@ -28,7 +30,7 @@ class MotionAccessPermissions(BaseAccessPermissions):
         personal notes.
         """
         # Parse data.
-        if await async_has_perm(user_id, "motions.can_see"):
+        if await async_has_perm(user_id, "motions.can_see", permission_context):
             # TODO: Refactor this after personal_notes system is refactored.
             data = []
             for full in full_data:
@@ -45,7 +47,9 @@ class MotionAccessPermissions(BaseAccessPermissions):
                 restriction = full["state_restriction"]
 
                 # Managers can see all motions.
-                permission = await async_has_perm(user_id, "motions.can_manage")
+                permission = await async_has_perm(
+                    user_id, "motions.can_manage", permission_context
+                )
                 # If restriction field is an empty list, everybody can see the motion.
                 permission = permission or not restriction
 
@@ -53,15 +57,11 @@ class MotionAccessPermissions(BaseAccessPermissions):
                     # Parse values of restriction field.
                     # If at least one restriction is ok, permissions are granted.
                     for value in restriction:
-                        if (
-                            value
-                            in (
-                                "motions.can_see_internal",
-                                "motions.can_manage_metadata",
-                                "motions.can_manage",
-                            )
-                            and await async_has_perm(user_id, value)
-                        ):
+                        if value in (
+                            "motions.can_see_internal",
+                            "motions.can_manage_metadata",
+                            "motions.can_manage",
+                        ) and await async_has_perm(user_id, value, permission_context):
                             permission = True
                             break
                         elif value == "is_submitter" and is_submitter:
@@ -70,14 +70,15 @@ class MotionAccessPermissions(BaseAccessPermissions):
 
                 # Parse single motion.
                 if permission:
-                    full_copy = json.loads(json.dumps(full))
-                    full_copy["comments"] = []
+                    comments = []
                     for comment in full["comments"]:
                         if await async_in_some_groups(
-                            user_id, comment["read_groups_id"]
+                            user_id,
+                            comment["read_groups_id"],
+                            permission_context=permission_context,
                         ):
-                            full_copy["comments"].append(comment)
-                    data.append(full_copy)
+                            comments.append(comment)
+                    data.append(restricted_copy(full, update={"comments": comments}))
         else:
             data = []
         return data
@@ -91,7 +92,10 @@ class MotionChangeRecommendationAccessPermissions(BaseAccessPermissions):
     base_permission = "motions.can_see"
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Removes change recommendations if they are internal and the user has
@@ -99,8 +103,10 @@ class MotionChangeRecommendationAccessPermissions(BaseAccessPermissions):
         the can_see permission.
         """
         # Parse data.
-        if await async_has_perm(user_id, self.base_permission):
-            has_manage_perms = await async_has_perm(user_id, "motions.can_manage")
+        if await async_has_perm(user_id, self.base_permission, permission_context):
+            has_manage_perms = await async_has_perm(
+                user_id, "motions.can_manage", permission_context
+            )
             data = []
             for full in full_data:
                 if not full["internal"] or has_manage_perms:
@@ -119,19 +125,24 @@ class MotionCommentSectionAccessPermissions(BaseAccessPermissions):
     base_permission = "motions.can_see"
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         If the user has manage rights, he can see all sections. If not all sections
         will be removed, when the user is not in at least one of the read_groups.
         """
         data: List[Dict[str, Any]] = []
-        if await async_has_perm(user_id, "motions.can_manage"):
+        if await async_has_perm(user_id, "motions.can_manage", permission_context):
             data = full_data
-        elif await async_has_perm(user_id, self.base_permission):
+        elif await async_has_perm(user_id, self.base_permission, permission_context):
             for full in full_data:
                 read_groups = full.get("read_groups_id", [])
-                if await async_in_some_groups(user_id, read_groups):
+                if await async_in_some_groups(
+                    user_id, read_groups, permission_context=permission_context
+                ):
                     data.append(full)
         else:
             data = []
@@ -160,17 +171,29 @@ class MotionBlockAccessPermissions(BaseAccessPermissions):
     """
 
     base_permission = "motions.can_see"
+    group_restricted = True
+
+    async def async_is_unrestricted(
+        self, user_id: int, permission_context: Optional[PermissionContext] = None
+    ) -> bool:
+        """
+        Managers see all blocks unchanged.
+        """
+        return await async_has_perm(user_id, "motions.can_manage", permission_context)
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Users without `motions.can_manage` cannot see internal blocks.
         """
         data: List[Dict[str, Any]] = []
-        if await async_has_perm(user_id, "motions.can_manage"):
+        if await async_has_perm(user_id, "motions.can_manage", permission_context):
             data = full_data
-        elif await async_has_perm(user_id, self.base_permission):
+        elif await async_has_perm(user_id, self.base_permission, permission_context):
             data = [full for full in full_data if not full["internal"]]
         else:
             data = []
@@ -1,13 +1,15 @@
+from collections import defaultdict
 from decimal import Decimal
-from typing import List, Set
+from typing import Dict, List, Set, Tuple
 
 import jsonschema
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import Case, When
+from django.db.models import Case, Q, When
 from django.db.models.deletion import ProtectedError
 from django.db.utils import IntegrityError
 from django.http.request import QueryDict
+from django.utils.timezone import now
 from rest_framework import status
 
 from openslides.poll.views import BaseOptionViewSet, BasePollViewSet, BaseVoteViewSet
@@ -540,6 +542,75 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
         # Initiate response.
         return Response({"detail": message})
 
+    def get_multiple_motions(self, motions, schema, queryset):
+        """
+        Validates the request data of the manage_multiple views with the schema
+        and loads all given motions of the queryset with one query.
+
+        Returns a list of tuples of each motion and its item of the request
+        data.
+        """
+        try:
+            jsonschema.validate(motions, schema)
+        except jsonschema.ValidationError as err:
+            raise ValidationError({"detail": str(err)})
+
+        motion_dict = queryset.in_bulk(list({item["id"] for item in motions}))
+        motion_items = []
+        for item in motions:
+            try:
+                motion_items.append((motion_dict[item["id"]], item))
+            except KeyError:
+                raise ValidationError(
+                    {"detail": "Motion {0} does not exist", "args": [item["id"]]}
+                )
+        return motion_items
+
+    def get_related_objects(self, model, ids, name):
+        """
+        Loads the objects of the model with the given ids with one query.
+
+        Returns a dict from the id to the object. Raises a ValidationError for
+        the first id, that does not exist.
+        """
+        objects = model.objects.in_bulk(list(set(ids)))
+        for id in ids:
+            if id not in objects:
+                raise ValidationError(
+                    {"detail": f"{name} {{0}} does not exist", "args": [id]}
+                )
+        return objects
+
+    def save_multiple_motions(self, motion_information, update_fields, user_id):
+        """
+        Saves the update_fields of all motions with one query and informs the
+        autoupdate with the history information.
+
+        motion_information is a list of tuples of each motion and its history
+        information. If a motion is given more than once, the last information
+        wins.
+        """
+        motions = {
+            motion.pk: (motion, information)
+            for motion, information in motion_information
+        }
+        timestamp = now()
+        for motion, _ in motions.values():
+            motion.last_modified = timestamp
+        Motion.objects.bulk_update(
+            [motion for motion, _ in motions.values()],
+            update_fields + ["last_modified"],
+        )
+
+        # Motions with the same information are informed together.
+        motions_per_information: Dict[Tuple[str, ...], List[Motion]] = defaultdict(list)
+        for motion, information in motions.values():
+            motions_per_information[tuple(information)].append(motion)
+        for information, information_motions in motions_per_information.items():
+            inform_changed_data(
+                information_motions, information=list(information), user_id=user_id
+            )
+
     @list_route(methods=["post"])
     @transaction.atomic
     def manage_multiple_category(self, request):
@@ -548,8 +619,6 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
 
         Send POST {"motions": [... see schema ...]} to changed the categories.
         """
-        motions = request.data.get("motions")
-
         schema = {
             "$schema": "http://json-schema.org/draft-07/schema#",
             "title": "Motion manage multiple categories schema",
@@ -569,61 +638,35 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
             "uniqueItems": True,
         }
 
-        # Validate request data.
-        try:
-            jsonschema.validate(motions, schema)
-        except jsonschema.ValidationError as err:
-            raise ValidationError({"detail": str(err)})
-
-        motion_result = []
-        for item in motions:
-            # Get motion.
-            try:
-                motion = Motion.objects.get(pk=item["id"])
-            except Motion.DoesNotExist:
-                raise ValidationError(
-                    {"detail": "Motion {0} does not exist", "args": [item["id"]]}
-                )
-
-            # Get category
-            category = None
-            if item["category"] is not None:
-                try:
-                    category = Category.objects.get(pk=item["category"])
-                except Category.DoesNotExist:
-                    raise ValidationError(
-                        {
-                            "detail": "Category {0} does not exist",
-                            "args": [item["category"]],
-                        }
-                    )
+        motion_items = self.get_multiple_motions(
+            request.data.get("motions"), schema, Motion.objects.all()
+        )
+        categories = self.get_related_objects(
+            Category,
+            [item["category"] for _, item in motion_items if item["category"]],
+            "Category",
+        )
 
+        motion_information = []
+        for motion, item in motion_items:
             # Set category
+            category = categories.get(item["category"])
             motion.category = category
-
-            # Save motion.
-            motion.save(
-                update_fields=["category", "last_modified"], skip_autoupdate=True
-            )
-
-            # Fire autoupdate again to save information to OpenSlides history.
             information = (
                 ["Category removed"]
                 if category is None
                 else ["Category set to {arg1}", category.name]
             )
-            inform_changed_data(
-                motion, information=information, user_id=request.user.pk
-            )
+            motion_information.append((motion, information))
 
-            # Finish motion.
-            motion_result.append(motion)
+        # Save motions and save information to OpenSlides history.
+        self.save_multiple_motions(motion_information, ["category"], request.user.pk)
 
         # Send response.
         return Response(
             {
                 "detail": "Category of {0} motions successfully set.",
-                "args": [len(motion_result)],
+                "args": [len(motion_items)],
             }
         )
 
@@ -635,8 +678,6 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
 
         Send POST {"motions": [... see schema ...]} to changed the motion blocks.
         """
-        motions = request.data.get("motions")
-
         schema = {
             "$schema": "http://json-schema.org/draft-07/schema#",
             "title": "Motion manage multiple motion blocks schema",
@@ -656,68 +697,48 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
             "uniqueItems": True,
         }
 
-        # Validate request data.
-        try:
-            jsonschema.validate(motions, schema)
-        except jsonschema.ValidationError as err:
-            raise ValidationError({"detail": str(err)})
-
-        motion_result = []
-        for item in motions:
-            # Get motion.
-            try:
-                motion = Motion.objects.get(pk=item["id"])
-            except Motion.DoesNotExist:
-                raise ValidationError(
-                    {"detail": "Motion {0} does not exist", "args": [item["id"]]}
-                )
+        motion_items = self.get_multiple_motions(
+            request.data.get("motions"),
+            schema,
+            Motion.objects.select_related("motion_block"),
+        )
+        motion_blocks = self.get_related_objects(
+            MotionBlock,
+            [item["motion_block"] for _, item in motion_items if item["motion_block"]],
+            "MotionBlock",
+        )
 
-            # Get motion block
-            motion_block = None
-            if item["motion_block"] is not None:
-                try:
-                    motion_block = MotionBlock.objects.get(pk=item["motion_block"])
-                except MotionBlock.DoesNotExist:
-                    raise ValidationError(
-                        {
-                            "detail": "MotionBlock {0} does not exist",
-                            "args": [item["motion_block"]],
-                        }
-                    )
+        motion_information = []
+        changed_motion_blocks = set()
+        for motion, item in motion_items:
+            motion_block = motion_blocks.get(item["motion_block"])
 
-            # inform old motion block
+            # Inform old and new motion block.
             if motion.motion_block:
-                inform_changed_data(motion.motion_block)
-            # inform new motion block
+                changed_motion_blocks.add(motion.motion_block)
             if motion_block:
-                inform_changed_data(motion_block)
+                changed_motion_blocks.add(motion_block)
 
             # Set motion bock
             motion.motion_block = motion_block
-
-            # Save motion.
-            motion.save(
-                update_fields=["motion_block", "last_modified"], skip_autoupdate=True
-            )
-
-            # Fire autoupdate again to save information to OpenSlides history.
             information = (
                 ["Motion block removed"]
                 if motion_block is None
                 else ["Motion block set to {arg1}", motion_block.title]
             )
-            inform_changed_data(
-                motion, information=information, user_id=request.user.pk
-            )
+            motion_information.append((motion, information))
 
-            # Finish motion.
-            motion_result.append(motion)
+        # Save motions and save information to OpenSlides history.
+        self.save_multiple_motions(
+            motion_information, ["motion_block"], request.user.pk
+        )
+        inform_changed_data(changed_motion_blocks)
 
         # Send response.
         return Response(
             {
                 "detail": "Motion block of {0} motions successfully set.",
-                "args": [len(motion_result)],
+                "args": [len(motion_items)],
             }
         )
 
@@ -788,8 +809,6 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
 
         Send POST {"motions": [... see schema ...]} to changed the states.
         """
-        motions = request.data.get("motions")
-
         schema = {
             "$schema": "http://json-schema.org/draft-07/schema#",
             "title": "Motion manage multiple state schema",
@@ -810,63 +829,60 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
             "uniqueItems": True,
         }
 
-        # Validate request data.
-        try:
-            jsonschema.validate(motions, schema)
-        except jsonschema.ValidationError as err:
-            raise ValidationError({"detail": str(err)})
-
-        motion_result = []
-        for item in motions:
-            # Get motion.
-            try:
-                motion = Motion.objects.get(pk=item["id"])
-            except Motion.DoesNotExist:
-                raise ValidationError(
-                    {"detail": "Motion {0} does not exist", "args": [item["id"]]}
-                )
+        motion_items = self.get_multiple_motions(
+            request.data.get("motions"), schema, Motion.objects.select_related("state")
+        )
+        states = State.objects.in_bulk(
+            list({item["state"] for _, item in motion_items})
+        )
 
-            # Set or reset state.
-            state_id = item["state"]
-            valid_states = State.objects.filter(workflow=motion.workflow_id)
-            if state_id not in [item.id for item in valid_states]:
+        motion_information = []
+        for motion, item in motion_items:
+            # Set state.
+            state = states.get(item["state"])
+            if state is None or state.workflow_id != motion.state.workflow_id:
                 # States of different workflows are not allowed.
                 raise ValidationError(
-                    {"detail": "You can not set the state to {0}.", "args": [state_id]}
+                    {
+                        "detail": "You can not set the state to {0}.",
+                        "args": [item["state"]],
+                    }
                 )
-            motion.set_state(state_id)
-
-            # Save motion.
-            motion.save(
-                update_fields=[
-                    "state",
-                    "identifier",
-                    "identifier_number",
-                    "last_modified",
-                ],
-                skip_autoupdate=True,
-            )
+            identifier = motion.identifier
+            motion.set_state(state)
+            if motion.identifier != identifier:
+                # The identifier number of the next motion is calculated from
+                # the saved motions, so a new identifier is saved at once.
+                motion.save(
+                    update_fields=["identifier", "identifier_number"],
+                    skip_autoupdate=True,
+                )
+            motion_information.append((motion, ["State set to {arg1}", state.name]))
 
-            # Send submitters and supporters via autoupdate because users without
-            # users.can_see may see them now.
-            inform_changed_data(map(lambda s: s.user, motion.submitters.all()))
-            inform_changed_data(motion.supporters.all())
+        # Save motions and save information to OpenSlides history.
+        self.save_multiple_motions(
+            motion_information,
+            ["state", "identifier", "identifier_number"],
+            request.user.pk,
+        )
 
-            # Fire autoupdate again to save information to OpenSlides history.
-            inform_changed_data(
-                motion,
-                information=["State set to {arg1}", motion.state.name],
-                user_id=request.user.pk,
+        # Send submitters and supporters via autoupdate because users without
+        # users.can_see may see them now.
+        motion_ids = [motion.pk for motion, _ in motion_items]
+        inform_changed_data(
+            get_user_model()
+            .objects.filter(
+                Q(submitter__motion__in=motion_ids)
+                | Q(motion_supporters__in=motion_ids)
             )
-
-            # Finish motion.
-            motion_result.append(motion)
+            .distinct()
+        )
 
         # Send response.
         return Response(
             {
                 "detail": "State of {0} motions successfully set.",
-                "args": [len(motion_result)],
+                "args": [len(motion_items)],
             }
         )
 
@@ -940,8 +956,6 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
 
         Send POST {"motions": [... see schema ...]} to changed the recommendations.
         """
-        motions = request.data.get("motions")
-
         schema = {
             "$schema": "http://json-schema.org/draft-07/schema#",
             "title": "Motion manage multiple recommendations schema",
@@ -961,68 +975,48 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
             "uniqueItems": True,
         }
 
-        # Validate request data.
-        try:
-            jsonschema.validate(motions, schema)
-        except jsonschema.ValidationError as err:
-            raise ValidationError({"detail": str(err)})
-
-        motion_result = []
-        for item in motions:
-            # Get motion.
-            try:
-                motion = Motion.objects.get(pk=item["id"])
-            except Motion.DoesNotExist:
-                raise ValidationError(
-                    {"detail": "Motion {0} does not exist", "args": [item["id"]]}
-                )
+        motion_items = self.get_multiple_motions(
+            request.data.get("motions"), schema, Motion.objects.select_related("state")
+        )
+        recommendable_states = State.objects.filter(
+            recommendation_label__isnull=False
+        ).in_bulk(list({item["recommendation"] for _, item in motion_items}))
 
+        motion_information = []
+        for motion, item in motion_items:
             # Set or reset recommendation.
             recommendation_state_id = item["recommendation"]
             if recommendation_state_id == 0:
                 # Reset recommendation.
                 motion.recommendation = None
+                label = "None"
             else:
                 # Check data and set recommendation.
-                recommendable_states = State.objects.filter(
-                    workflow=motion.workflow_id, recommendation_label__isnull=False
-                )
-                if recommendation_state_id not in [
-                    item.id for item in recommendable_states
-                ]:
+                recommendation = recommendable_states.get(recommendation_state_id)
+                if (
+                    recommendation is None
+                    or recommendation.workflow_id != motion.state.workflow_id
+                ):
                     raise ValidationError(
                         {
                             "detail": "You can not set the recommendation to {0}.",
                             "args": [recommendation_state_id],
                         }
                     )
-                motion.set_recommendation(recommendation_state_id)
+                motion.set_recommendation(recommendation)
+                label = recommendation.recommendation_label
+            motion_information.append((motion, ["Recommendation set to {arg1}", label]))
 
-            # Save motion.
-            motion.save(
-                update_fields=["recommendation", "last_modified"], skip_autoupdate=True
-            )
-            label = (
-                motion.recommendation.recommendation_label
-                if motion.recommendation
-                else "None"
-            )
-
-            # Fire autoupdate and save information to OpenSlides history.
-            inform_changed_data(
-                motion,
-                information=["Recommendation set to {arg1}", label],
-                user_id=request.user.pk,
-            )
-
-            # Finish motion.
-            motion_result.append(motion)
+        # Save motions and save information to OpenSlides history.
+        self.save_multiple_motions(
+            motion_information, ["recommendation"], request.user.pk
+        )
 
         # Send response.
         return Response(
             {
                 "detail": "{0} motions successfully updated.",
-                "args": [len(motion_result)],
+                "args": [len(motion_items)],
             }
         )
 
@@ -1062,8 +1056,6 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
 
         Send POST {"motions": [... see schema ...]} to changed the tags.
         """
-        motions = request.data.get("motions")
-
         schema = {
             "$schema": "http://json-schema.org/draft-07/schema#",
             "title": "Motion manage multiple tags schema",
@@ -1085,41 +1077,31 @@ class MotionViewSet(TreeSortMixin, ModelViewSet):
             "uniqueItems": True,
         }
 
-        # Validate request data.
-        try:
-            jsonschema.validate(motions, schema)
-        except jsonschema.ValidationError as err:
-            raise ValidationError({"detail": str(err)})
-
-        motion_result = []
-        for item in motions:
-            # Get motion.
-            try:
-                motion = Motion.objects.get(pk=item["id"])
-            except Motion.DoesNotExist:
-                raise ValidationError(
-                    {"detail": "Motion {0} does not exist", "args": [item["id"]]}
-                )
-
-            # Set new tags
-            for tag_id in item["tags"]:
-                if not Tag.objects.filter(pk=tag_id).exists():
-                    raise ValidationError(
-                        {"detail": "Tag {0} does not exist", "args": [tag_id]}
-                    )
-            motion.tags.set(item["tags"])
+        motion_items = self.get_multiple_motions(
+            request.data.get("motions"), schema, Motion.objects.all()
+        )
+        self.get_related_objects(
+            Tag, [tag_id for _, item in motion_items for tag_id in item["tags"]], "Tag"
+        )
 
-            # Finish motion.
-            motion_result.append(motion)
+        # Set new tags. If a motion is given more then once, the last tags win.
+        motion_tags = {motion.pk: item["tags"] for motion, item in motion_items}
+        MotionTag = Motion.tags.through
+        MotionTag.objects.filter(motion_id__in=list(motion_tags)).delete()
+        MotionTag.objects.bulk_create(
+            MotionTag(motion_id=motion_id, tag_id=tag_id)
+            for motion_id, tag_ids in motion_tags.items()
+            for tag_id in tag_ids
+        )
 
         # Now inform all clients.
-        inform_changed_data(motion_result)
+        inform_changed_data(motion for motion, _ in motion_items)
 
         # Send response.
         return Response(
             {
                 "detail": "{0} motions successfully updated.",
-                "args": [len(motion_result)],
+                "args": [len(motion_items)],
             }
         )
 
@@ -1,10 +1,9 @@
-import json
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional, Set
 
 from ..poll.views import BasePoll
 from ..utils import logging
-from ..utils.access_permissions import BaseAccessPermissions
-from ..utils.auth import async_has_perm, user_collection_string
+from ..utils.access_permissions import BaseAccessPermissions, restricted_copy
+from ..utils.auth import PermissionContext, async_has_perm, user_collection_string
 from ..utils.cache import element_cache
 
 
@@ -15,7 +14,10 @@ class BaseVoteAccessPermissions(BaseAccessPermissions):
     manage_permission = ""  # set by subclass
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Poll-managers have full access, even during an active poll.
@@ -23,9 +25,9 @@ class BaseVoteAccessPermissions(BaseAccessPermissions):
         If the pollstate is published, everyone can see the votes.
         """
 
-        if await async_has_perm(user_id, self.manage_permission):
+        if await async_has_perm(user_id, self.manage_permission, permission_context):
             data = full_data
-        elif await async_has_perm(user_id, self.base_permission):
+        elif await async_has_perm(user_id, self.base_permission, permission_context):
             data = [
                 vote
                 for vote in full_data
@@ -42,21 +44,19 @@ class BaseOptionAccessPermissions(BaseAccessPermissions):
     manage_permission = ""  # set by subclass
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
 
-        if await async_has_perm(user_id, self.manage_permission):
+        if await async_has_perm(user_id, self.manage_permission, permission_context):
             data = full_data
-        elif await async_has_perm(user_id, self.base_permission):
+        elif await async_has_perm(user_id, self.base_permission, permission_context):
             data = []
             for option in full_data:
                 if option["pollstate"] != BasePoll.STATE_PUBLISHED:
-                    option = json.loads(
-                        json.dumps(option)
-                    )  # copy, so we can remove some fields.
-                    del option["yes"]
-                    del option["no"]
-                    del option["abstain"]
+                    option = restricted_copy(option, remove=("yes", "no", "abstain"))
                 data.append(option)
         else:
             data = []
@@ -69,8 +69,43 @@ class BasePollAccessPermissions(BaseAccessPermissions):
     additional_fields: List[str] = []
     """ Add fields to be removed from each unpublished poll """
 
+    def __init__(self) -> None:
+        # The voted ids of the polls as sets for the change id voted_ids_change_id.
+        self.voted_ids: Dict[int, Set[int]] = {}
+        self.voted_ids_change_id = 0
+        element_cache.add_local_cache_listener(self.on_local_cache_change)
+
+    def on_local_cache_change(self, element_ids: Optional[Iterable[str]]) -> None:
+        """
+        Listener for the local element cache. Forgets the voted ids, if the
+        cache was cleared, because the change ids start again after a rebuild.
+        """
+        if element_ids is None:
+            self.voted_ids = {}
+            self.voted_ids_change_id = 0
+
+    def get_voted_ids(self, poll: Dict[str, Any], change_id: Optional[int]) -> Set[int]:
+        """
+        Returns the ids of the users, that have voted for the poll, as set.
+
+        If the change id of the data is known, the set is built once per change
+        id and shared between all users.
+        """
+        if change_id is None or change_id < self.voted_ids_change_id:
+            return set(poll["voted_id"])
+        if change_id > self.voted_ids_change_id:
+            self.voted_ids = {}
+            self.voted_ids_change_id = change_id
+        voted_ids = self.voted_ids.get(poll["id"])
+        if voted_ids is None:
+            voted_ids = self.voted_ids[poll["id"]] = set(poll["voted_id"])
+        return voted_ids
+
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Poll-managers have full access, even during an active poll.
@@ -78,7 +113,22 @@ class BasePollAccessPermissions(BaseAccessPermissions):
          - Remove votes* values from the poll
          - Remove yes/no/abstain fields from options
          - Remove fields given in self.assitional_fields from the poll
+
+        Every returned poll is a copy with the personal fields user_has_voted and
+        user_has_voted_for_delegations. full_data is not altered.
         """
+        if await async_has_perm(user_id, self.manage_permission, permission_context):
+            removed_fields: List[str] = []
+        elif await async_has_perm(user_id, self.base_permission, permission_context):
+            removed_fields = [
+                "votesvalid",
+                "votesinvalid",
+                "votescast",
+                "voted_id",
+                *self.additional_fields,
+            ]
+        else:
+            return []
 
         # add has_voted for all users to check whether op has voted
         # also fill user_has_voted_for_delegations with all users for which he has
@@ -88,34 +138,22 @@ class BasePollAccessPermissions(BaseAccessPermissions):
         )
         if user_data is None:
             logger.error(f"Could not find userdata for {user_id}")
-            vote_delegated_from_ids = set()
+            vote_delegated_from_ids: List[int] = []
         else:
-            vote_delegated_from_ids = set(user_data["vote_delegated_from_users_id"])
+            vote_delegated_from_ids = user_data["vote_delegated_from_users_id"]
 
+        change_id = None if permission_context is None else permission_context.change_id
+        data = []
         for poll in full_data:
-            poll["user_has_voted"] = user_id in poll["voted_id"]
-            voted_ids = set(poll["voted_id"])
-            voted_for_delegations = list(
-                vote_delegated_from_ids.intersection(voted_ids)
-            )
-            poll["user_has_voted_for_delegations"] = voted_for_delegations
-
-        if await async_has_perm(user_id, self.manage_permission):
-            data = full_data
-        elif await async_has_perm(user_id, self.base_permission):
-            data = []
-            for poll in full_data:
-                if poll["state"] != BasePoll.STATE_PUBLISHED:
-                    poll = json.loads(
-                        json.dumps(poll)
-                    )  # copy, so we can remove some fields.
-                    del poll["votesvalid"]
-                    del poll["votesinvalid"]
-                    del poll["votescast"]
-                    del poll["voted_id"]
-                    for field in self.additional_fields:
-                        del poll[field]
-                data.append(poll)
-        else:
-            data = []
+            voted_ids = self.get_voted_ids(poll, change_id)
+            overlay = {
+                "user_has_voted": user_id in voted_ids,
+                "user_has_voted_for_delegations": [
+                    id for id in vote_delegated_from_ids if id in voted_ids
+                ],
+            }
+            if poll["state"] != BasePoll.STATE_PUBLISHED:
+                data.append(restricted_copy(poll, removed_fields, overlay))
+            else:
+                data.append(restricted_copy(poll, update=overlay))
         return data
@@ -1,7 +1,7 @@
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Optional, Set
 
 from ..utils.access_permissions import BaseAccessPermissions, required_user
-from ..utils.auth import async_has_perm
+from ..utils.auth import PermissionContext, async_has_perm
 from ..utils.utils import get_model_from_collection_string
 
 
@@ -11,7 +11,10 @@ class UserAccessPermissions(BaseAccessPermissions):
     """
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Returns the restricted serialized data for the instance prepared
@@ -62,10 +65,14 @@ class UserAccessPermissions(BaseAccessPermissions):
         own_data_fields.add("vote_delegated_from_users_id")
 
         # Check user permissions.
-        if await async_has_perm(user_id, "users.can_see_name"):
+        if await async_has_perm(user_id, "users.can_see_name", permission_context):
             whitelist_operator = None
-            if await async_has_perm(user_id, "users.can_see_extra_data"):
-                if await async_has_perm(user_id, "users.can_manage"):
+            if await async_has_perm(
+                user_id, "users.can_see_extra_data", permission_context
+            ):
+                if await async_has_perm(
+                    user_id, "users.can_manage", permission_context
+                ):
                     whitelist = all_data_fields
                 else:
                     whitelist = many_data_fields
@@ -76,8 +83,10 @@ class UserAccessPermissions(BaseAccessPermissions):
             # for managing {motion, assignment} polls the users needs to know
             # the vote delegation structure.
             if await async_has_perm(
-                user_id, "motion.can_manage_polls"
-            ) or await async_has_perm(user_id, "assignments.can_manage"):
+                user_id, "motion.can_manage_polls", permission_context
+            ) or await async_has_perm(
+                user_id, "assignments.can_manage", permission_context
+            ):
                 whitelist.add("vote_delegated_to_id")
                 whitelist.add("vote_delegated_from_users_id")
 
@@ -98,6 +107,7 @@ class UserAccessPermissions(BaseAccessPermissions):
                     get_model_from_collection_string(
                         collection_string
                     ).can_see_permission,
+                    permission_context,
                 ):
                     can_see_collection_strings.add(collection_string)
 
@@ -139,7 +149,10 @@ class PersonalNoteAccessPermissions(BaseAccessPermissions):
     """
 
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Returns the restricted serialized data for the instance prepared
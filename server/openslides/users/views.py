@@ -1,6 +1,6 @@
 import smtplib
 import textwrap
-from typing import Iterable, List, Set, Union
+from typing import Iterable, Set, Union
 
 from asgiref.sync import async_to_sync
 from django.conf import settings
@@ -33,7 +33,7 @@ from ..utils.auth import (
     anonymous_is_enabled,
     has_perm,
 )
-from ..utils.autoupdate import AutoupdateElement, inform_changed_data, inform_elements
+from ..utils.autoupdate import inform_changed_data, inform_changed_restrictions
 from ..utils.cache import element_cache
 from ..utils.rest_api import (
     APIException,
@@ -723,9 +723,10 @@ class GroupViewSet(ModelViewSet):
         changed_permissions: Union[None, Permission, Iterable[Permission]],
     ) -> None:
         """
-        Updates every users, if some permission changes. For this, every affected collection
-        is fetched via the permission_change signal and every object of the collection passed
-        into the cache/autoupdate system.
+        Updates the users of the group, if some permission changes. For this,
+        every affected collection is fetched via the permission_change signal.
+        The users of the group get all elements of these collections again with
+        their new permissions. The elements itself are not changed.
         """
         if isinstance(changed_permissions, Permission):
             changed_permissions = [changed_permissions]
@@ -733,23 +734,13 @@ class GroupViewSet(ModelViewSet):
         if not changed_permissions:
             return  # either None or empty list.
 
-        elements: List[AutoupdateElement] = []
         signal_results = permission_change.send(None, permissions=changed_permissions)
-        all_full_data = async_to_sync(element_cache.get_all_data_list)()
-        for _, signal_collections in signal_results:
-            for cachable in signal_collections:
-                for full_data in all_full_data.get(
-                    cachable.get_collection_string(), {}
-                ):
-                    elements.append(
-                        AutoupdateElement(
-                            id=full_data["id"],
-                            collection_string=cachable.get_collection_string(),
-                            full_data=full_data,
-                            disable_history=True,
-                        )
-                    )
-        inform_elements(elements)
+        collections = set(
+            cachable.get_collection_string()
+            for _, signal_collections in signal_results
+            for cachable in signal_collections
+        )
+        inform_changed_restrictions([group.pk], collections)
 
 
 class PersonalNoteViewSet(ModelViewSet):
@@ -1,9 +1,16 @@
-from typing import Any, Callable, Coroutine, Dict, List, Set
+from collections import Counter
+from typing import Any, Callable, Coroutine, Dict, Iterable, List, Optional, Set
 
 from asgiref.sync import async_to_sync
 
-from .auth import async_anonymous_is_enabled, async_has_perm, user_to_user_id
+from .auth import (
+    PermissionContext,
+    async_anonymous_is_enabled,
+    async_has_perm,
+    user_to_user_id,
+)
 from .cache import element_cache
+from .utils import split_element_id
 
 
 class BaseAccessPermissions:
@@ -21,6 +28,13 @@ class BaseAccessPermissions:
     If this string is empty, all users can see it.
     """
 
+    group_restricted = False
+    """
+    Set to True, if the restricted data only depends on the groups of the user
+    and not on the user itself (e.g. only on permissions). Then the element cache
+    shares the restricted data between all users with the same groups.
+    """
+
     def check_permissions(self, user_id: int) -> bool:
         """
         Returns True if the user has read access to model instances.
@@ -30,17 +44,46 @@ class BaseAccessPermissions:
         user_id = user_to_user_id(user_id)
         return async_to_sync(self.async_check_permissions)(user_id)
 
-    async def async_check_permissions(self, user_id: int) -> bool:
+    async def async_check_permissions(
+        self, user_id: int, permission_context: Optional[PermissionContext] = None
+    ) -> bool:
         """
         Returns True if the user has read access to model instances.
         """
         if self.base_permission:
-            return await async_has_perm(user_id, self.base_permission)
+            return await async_has_perm(
+                user_id, self.base_permission, permission_context
+            )
+        elif permission_context is not None and permission_context.user_id == user_id:
+            if user_id:
+                return True
+            await permission_context.resolve()
+            return permission_context.anonymous_enabled
         else:
             return bool(user_id) or await async_anonymous_is_enabled()
 
+    async def async_is_unrestricted(
+        self, user_id: int, permission_context: Optional[PermissionContext] = None
+    ) -> bool:
+        """
+        Returns True, if get_restricted_data returns all elements unchanged for
+        the user. Then the elements can be sent without decoding them.
+
+        This is only known, if get_restricted_data is not overridden. Subclasses
+        overriding get_restricted_data should override this method, too.
+        """
+        if (
+            type(self).get_restricted_data
+            is not BaseAccessPermissions.get_restricted_data
+        ):
+            return False
+        return await self.async_check_permissions(user_id, permission_context)
+
     async def get_restricted_data(
-        self, full_data: List[Dict[str, Any]], user_id: int
+        self,
+        full_data: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Returns the restricted serialized data for the instance prepared
@@ -50,17 +93,62 @@ class BaseAccessPermissions:
         the return is the same. Returns an empty list if the user has no read
         access. Returns reduced data if the user has limited access. Default:
         Returns full data if the user has read access to model instances.
+
+        The optional permission_context of the user speeds up permission checks.
         """
-        return full_data if await self.async_check_permissions(user_id) else []
+        return (
+            full_data
+            if await self.async_check_permissions(user_id, permission_context)
+            else []
+        )
+
+
+def restricted_copy(
+    element: Dict[str, Any],
+    remove: Iterable[str] = (),
+    update: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Returns a shallow copy of the element without the keys in remove and with the
+    values from update. The element itself is not altered.
+
+    All other values are shared with the element. Do not alter them in place but
+    replace them via update.
+    """
+    if remove:
+        remove = set(remove)
+        copy = {key: value for key, value in element.items() if key not in remove}
+    else:
+        copy = dict(element)
+    if update:
+        copy.update(update)
+    return copy
 
 
 class RequiredUsers:
     """
     Helper class to find all users that are required by another element.
+
+    The required users of all elements are kept in a process local index, that
+    is built per collection on first use. It follows the invalidations of the local
+    element cache, so only changed elements are evaluated again.
     """
 
     callables: Dict[str, Callable[[Dict[str, Any]], Coroutine[Any, Any, Set[int]]]] = {}
 
+    def __init__(self) -> None:
+        # collection_string -> element id -> required user ids
+        self.index: Dict[str, Dict[int, Set[int]]] = {}
+        # collection_string -> user id -> number of elements requiring the user
+        self.user_counts: Dict[str, Counter] = {}
+        # Element ids, that have to be evaluated again.
+        self.outdated_element_ids: Set[str] = set()
+        # Collections, that are currently loaded into the index.
+        self.building: Set[str] = set()
+        # Incremented each time the index is cleared.
+        self.generation = 0
+        element_cache.add_local_cache_listener(self.on_local_cache_change)
+
     def get_collection_strings(self) -> Set[str]:
         """
         Returns all collection strings for elements that could have required users.
@@ -77,6 +165,25 @@ class RequiredUsers:
         elements.
         """
         self.callables[collection_string] = callable
+        self.index.pop(collection_string, None)
+        self.user_counts.pop(collection_string, None)
+
+    def on_local_cache_change(self, element_ids: Optional[Iterable[str]]) -> None:
+        """
+        Listener for the local element cache. Marks the elements as outdated or
+        clears the index, if element_ids is None.
+        """
+        if element_ids is None:
+            self.generation += 1
+            self.index = {}
+            self.user_counts = {}
+            self.outdated_element_ids = set()
+            return
+
+        for element_id in element_ids:
+            collection_string, _ = split_element_id(element_id)
+            if collection_string in self.index or collection_string in self.building:
+                self.outdated_element_ids.add(element_id)
 
     async def get_required_users(self, collection_strings: Set[str]) -> Set[int]:
         """
@@ -85,20 +192,76 @@ class RequiredUsers:
         Returns only user ids required by elements with a collection_string
         in the argument collection_strings.
         """
-        user_ids: Set[int] = set()
+        # if the collection_string is unknown, do nothing
+        collection_strings = collection_strings & self.callables.keys()
 
+        await element_cache.validate_local_cache_if_outdated()
         for collection_string in collection_strings:
+            if collection_string not in self.index:
+                await self.build_index(collection_string)
+        await self.update_index()
+
+        user_ids: Set[int] = set()
+        for collection_string in collection_strings:
+            user_ids.update(self.user_counts.get(collection_string, {}).keys())
+        return user_ids
+
+    async def build_index(self, collection_string: str) -> None:
+        """
+        Loads the required users of all elements of the collection into the index.
+        """
+        generation = self.generation
+        self.building.add(collection_string)
+        try:
             collection_data = await element_cache.get_collection_data(collection_string)
-            # Get the callable for the collection_string
-            get_user_ids = self.callables.get(collection_string)
-            if not (get_user_ids and collection_data):
-                # if the collection_string is unknown or it has no data, do nothing
+            get_user_ids = self.callables[collection_string]
+            collection_index = {}
+            for id, element in collection_data.items():
+                collection_index[id] = set(await get_user_ids(element))
+        finally:
+            self.building.discard(collection_string)
+
+        if generation != self.generation:
+            # The index was cleared in the meantime, so the data may be outdated.
+            return
+
+        user_counts: Counter = Counter()
+        for user_ids in collection_index.values():
+            user_counts.update(user_ids)
+        self.index[collection_string] = collection_index
+        self.user_counts[collection_string] = user_counts
+
+    async def update_index(self) -> None:
+        """
+        Evaluates all outdated elements again.
+        """
+        while self.outdated_element_ids:
+            element_id = self.outdated_element_ids.pop()
+            collection_string, id = split_element_id(element_id)
+            if collection_string not in self.index:
+                # The collection is not loaded yet. build_index will handle it.
                 continue
 
-            for element in collection_data.values():
-                user_ids.update(await get_user_ids(element))
+            generation = self.generation
+            element = await element_cache.get_element_data(collection_string, id)
+            if element is None:
+                user_ids: Set[int] = set()
+            else:
+                user_ids = set(await self.callables[collection_string](element))
+            if generation != self.generation:
+                # The index was cleared in the meantime.
+                continue
 
-        return user_ids
+            collection_index = self.index[collection_string]
+            user_counts = self.user_counts[collection_string]
+            old_user_ids = collection_index.pop(id, set())
+            user_counts.subtract(old_user_ids)
+            user_counts.update(user_ids)
+            if user_ids:
+                collection_index[id] = user_ids
+            for user_id in old_user_ids - user_ids:
+                if user_counts[user_id] <= 0:
+                    del user_counts[user_id]
 
 
 required_user = RequiredUsers()
@@ -1,4 +1,4 @@
-from typing import List, Union
+from typing import List, Optional, Set, Tuple, Union
 
 from asgiref.sync import async_to_sync
 from django.apps import apps
@@ -43,14 +43,120 @@ def get_group_model() -> Model:
         )
 
 
-async def async_is_superadmin(user_id: int) -> bool:
+class PermissionContext:
+    """
+    The resolved permissions and groups of one user.
+
+    async_has_perm and async_in_some_groups load the user, his groups and the
+    anonymous config from the element cache on every call. When many checks are
+    done for the same user in a row (e.g. while restricting all data), create one
+    context with `PermissionContext(user_id)` and give it to these functions. The
+    data is loaded once on the first check. All other checks are answered from the
+    context without any cache access.
+
+    A context is a snapshot of the data. Do not keep it longer than one
+    restriction pass.
+
+    change_id is the change id of the data, that is currently restricted with
+    this context, if it is known. Restricters can use it to share precomputed
+    values of the same data between users.
+
+    user_id 0 means anonymous user.
+    """
+
+    def __init__(self, user_id: int) -> None:
+        self.user_id = user_id
+        self.change_id: Optional[int] = None
+        self.resolved = False
+        self.anonymous_enabled = False
+        self.is_admin = False
+        self.group_ids: List[int] = []
+        self.permissions: Set[str] = set()
+
+    async def resolve(self) -> None:
+        """
+        Loads the groups and permissions of the user, if this was not done yet.
+
+        Raises UserDoesNotExist, if the user does not exist.
+        """
+        if self.resolved:
+            return
+
+        if not self.user_id:
+            self.anonymous_enabled = await async_anonymous_is_enabled()
+            if self.anonymous_enabled:
+                # Use the permissions from the default group.
+                default_group = await element_cache.get_element_data(
+                    group_collection_string, GROUP_DEFAULT_PK
+                )
+                if default_group is None:
+                    raise RuntimeError("Default Group does not exist.")
+                self.group_ids = [GROUP_DEFAULT_PK]
+                self.permissions = set(default_group["permissions"])
+        else:
+            user_data = await element_cache.get_element_data(
+                user_collection_string, self.user_id
+            )
+            if user_data is None:
+                raise UserDoesNotExist()
+
+            # If the user has no groups, then use the default group.
+            self.group_ids = user_data["groups_id"] or [GROUP_DEFAULT_PK]
+            # User in admin group (pk 2) grants all permissions.
+            self.is_admin = GROUP_ADMIN_PK in self.group_ids
+            if not self.is_admin:
+                for group_id in self.group_ids:
+                    group = await element_cache.get_element_data(
+                        group_collection_string, group_id
+                    )
+                    if group is None:
+                        raise RuntimeError(
+                            f"User {self.user_id} is in non existing group {group_id}."
+                        )
+                    self.permissions.update(group["permissions"])
+        self.resolved = True
+
+    async def get_group_profile(self) -> Optional[Tuple[bool, Tuple[int, ...]]]:
+        """
+        Returns a hashable value that is equal for all users with the same groups.
+        Anonymous is handled like a user without groups, that is only in the
+        default group, if anonymous is enabled.
+
+        Returns None, if the user does not exist.
+        """
+        try:
+            await self.resolve()
+        except UserDoesNotExist:
+            return None
+        return (bool(self.user_id), tuple(sorted(self.group_ids)))
+
+    async def has_perm(self, perm: str) -> bool:
+        """
+        Like async_has_perm.
+        """
+        await self.resolve()
+        return self.is_admin or perm in self.permissions
+
+    async def in_some_groups(self, groups: List[int], exact: bool = False) -> bool:
+        """
+        Like async_in_some_groups.
+        """
+        await self.resolve()
+        if not exact and self.is_admin:
+            return True
+        return any(group_id in groups for group_id in self.group_ids)
+
+
+async def async_is_superadmin(
+    user_id: int, permission_context: Optional[PermissionContext] = None
+) -> bool:
     """
     Checks, if the user is a superadmin (in the admin group).
 
     This is done by querying a non existing permission, becuase has_perm
     should always return true, if the user is in the admin group.
     """
-    return await async_has_perm(user_id, "superadmin")
+    return await async_has_perm(user_id, "superadmin", permission_context)
 
 
 def has_perm(user_id: int, perm: str) -> bool:
@@ -65,13 +171,20 @@ def has_perm(user_id: int, perm: str) -> bool:
     return async_to_sync(async_has_perm)(user_id, perm)
 
 
-async def async_has_perm(user_id: int, perm: str) -> bool:
+async def async_has_perm(
+    user_id: int, perm: str, permission_context: Optional[PermissionContext] = None
+) -> bool:
     """
     Checks that user has a specific permission.
 
+    If a permission context for the user is given, it is used instead of the
+    element cache.
+
     user_id 0 means anonymous user.
     """
-    if not user_id and not await async_anonymous_is_enabled():
+    if permission_context is not None and permission_context.user_id == user_id:
+        has_perm = await permission_context.has_perm(perm)
+    elif not user_id and not await async_anonymous_is_enabled():
         has_perm = False
     elif not user_id:
         # Use the permissions from the default group.
@@ -132,16 +245,24 @@ def in_some_groups(user_id: int, groups: List[int], exact: bool = False) -> bool
 
 
 async def async_in_some_groups(
-    user_id: int, groups: List[int], exact: bool = False
+    user_id: int,
+    groups: List[int],
+    exact: bool = False,
+    permission_context: Optional[PermissionContext] = None,
 ) -> bool:
     """
     Checks that user is in at least one given group. Groups can be given as a list
     of ids or a QuerySet. If the user is in the admin group (pk = 2) the result
     is always true, even if no groups are given.
 
+    If a permission context for the user is given, it is used instead of the
+    element cache.
+
     user_id 0 means anonymous user.
     """
-    if not user_id and not await async_anonymous_is_enabled():
+    if permission_context is not None and permission_context.user_id == user_id:
+        in_some_groups = await permission_context.in_some_groups(groups, exact)
+    elif not user_id and not await async_anonymous_is_enabled():
         in_some_groups = False
     elif not user_id:
         # Use the permissions from the default group.
@@ -1,19 +1,35 @@
-import json
+import atexit
+import queue
 import threading
+import time
 from collections import defaultdict
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
 from django.db.models import Model
+from django.utils.timezone import now
 from mypy_extensions import TypedDict
 
+from . import json_codec, logging
 from .auth import UserDoesNotExist
 from .cache import ChangeIdTooLowError, element_cache, get_element_id
+from .cache_providers import ElementsChanged
 from .stream import stream
 from .timing import Timing
 from .utils import get_model_from_collection_string, is_iterable, split_element_id
 
 
+logger = logging.getLogger(__name__)
+
+HISTORY_WRITE_ASYNC = getattr(settings, "HISTORY_WRITE_ASYNC", False)
+logger.info(f"History write async {HISTORY_WRITE_ASYNC}")
+AUTOUPDATE_COALESCE_WINDOW = getattr(settings, "AUTOUPDATE_COALESCE_WINDOW", None)
+logger.info(f"Autoupdate coalesce window {AUTOUPDATE_COALESCE_WINDOW}")
+
+
 AutoupdateFormat = TypedDict(
     "AutoupdateFormat",
     {
@@ -26,6 +42,12 @@ AutoupdateFormat = TypedDict(
 )
 
 
+# Mapping from the key of a list in the full_data of a root rest element to the
+# ids of the changed sub elements in this list and their full_data. None means
+# that the sub element was deleted.
+SubElementChanges = Dict[str, Dict[int, Optional[Dict[str, Any]]]]
+
+
 class AutoupdateElementBase(TypedDict):
     id: int
     collection_string: str
@@ -53,6 +75,12 @@ class AutoupdateElement(AutoupdateElementBase, total=False):
     as the _no_delete_on_restriction key. If this is true, there should neither be an
     entry for one specific model in the changed *nor the deleted* part of the
     autoupdate, if the model was restricted.
+
+    changed_sub_elements: If this is given instead of full_data, only these sub
+    elements (e.g. the speakers of a list of speakers) are updated in the cached
+    full_data. So the element is not loaded from the DB again. If the element is
+    not in the cache or is changed by someone else before it is written, it is
+    loaded from the DB.
     """
 
     information: List[str]
@@ -60,6 +88,7 @@ class AutoupdateElement(AutoupdateElementBase, total=False):
     disable_history: bool
     no_delete_on_restriction: bool
     full_data: Optional[Dict[str, Any]]
+    changed_sub_elements: SubElementChanges
 
 
 class AutoupdateBundle:
@@ -72,24 +101,48 @@ class AutoupdateBundle:
         self.autoupdate_elements: Dict[str, Dict[int, AutoupdateElement]] = defaultdict(
             dict
         )
+        self.restriction_group_ids: Set[int] = set()
+        self.restriction_collections: Set[str] = set()
 
     def add(self, elements: Iterable[AutoupdateElement]) -> None:
         """ Adds the elements to the bundle """
         for element in elements:
-            self.autoupdate_elements[element["collection_string"]][
-                element["id"]
-            ] = element
+            collection_elements = self.autoupdate_elements[element["collection_string"]]
+            existing_element = collection_elements.get(element["id"])
+            if existing_element is not None and "changed_sub_elements" in element:
+                element = merge_sub_element_changes(existing_element, element)
+            collection_elements[element["id"]] = element
+
+    def add_restrictions(
+        self, group_ids: Iterable[int], collections: Iterable[str]
+    ) -> None:
+        """Adds changed restrictions of the collections for the groups"""
+        self.restriction_group_ids.update(group_ids)
+        self.restriction_collections.update(collections)
 
     def done(self) -> Optional[int]:
         """
         Finishes the bundle by resolving all missing data and passing it to
         the history and element cache.
 
-        Returns the change id, if there are autoupdate elements. Otherwise none.
+        Returns the change id, if there are autoupdate elements or changed
+        restrictions. Otherwise none.
         """
-        if not self.autoupdate_elements:
-            return None
+        change_id = self._done_elements() if self.autoupdate_elements else None
+        if self.restriction_group_ids and self.restriction_collections:
+            # The restrictions are changed after the elements, so the restricters
+            # use the changed elements (e.g. the permissions of a group).
+            change_id = async_to_sync(send_changed_restrictions)(
+                sorted(self.restriction_group_ids), sorted(self.restriction_collections)
+            )
+        return change_id
 
+    def _done_elements(self) -> int:
+        """
+        Resolves the missing data of the elements and passes them to the history
+        and element cache. Returns the change id.
+        """
+        read_change_id, changed_sub_elements = self.resolve_changed_sub_elements()
         for collection, elements in self.autoupdate_elements.items():
             # Get all ids, that do not have a full_data key
             # (element["full_data"]=None will not be resolved again!)
@@ -104,14 +157,53 @@ class AutoupdateBundle:
                 # for the element, the data will be interpreted as None, which
                 # is correct for deleted elements.
                 model_class = get_model_from_collection_string(collection)
-                for full_data in model_class.get_elements(ids):
+                for full_data in model_class.iter_elements(ids):
                     elements[full_data["id"]]["full_data"] = full_data
 
         # Save histroy here using sync code.
         save_history(self.element_iterator)
 
+        if AUTOUPDATE_COALESCE_WINDOW:
+            # Update cache and send autoupdate together with other bundles.
+            cache_elements = async_to_sync(self.get_data_for_cache)()
+            return autoupdate_dispatcher.dispatch(
+                cache_elements, changed_sub_elements, read_change_id
+            )
+
         # Update cache and send autoupdate using async code.
-        return async_to_sync(self.dispatch_autoupdate)()
+        return async_to_sync(self.dispatch_autoupdate)(
+            list(changed_sub_elements.keys()), read_change_id
+        )
+
+    def resolve_changed_sub_elements(
+        self,
+    ) -> Tuple[int, Dict[str, SubElementChanges]]:
+        """
+        Sets the full_data of the elements with changed sub elements by updating
+        the current cached full_data. Elements, that are not in the cache, are
+        loaded from the DB afterwards.
+
+        Returns the change id, until which the cached elements were read, and
+        the changed sub elements of the updated elements per element id. If
+        another worker changes these elements before they are written, they
+        are loaded from the DB instead (see send_autoupdate).
+        """
+        read_change_id = 0
+        changed_sub_elements: Dict[str, SubElementChanges] = {}
+        for element in self.element_iterator:
+            if "changed_sub_elements" not in element:
+                continue
+            changes = element.pop("changed_sub_elements")
+            change_id, full_data = async_to_sync(
+                element_cache.get_current_element_data
+            )(element["collection_string"], element["id"])
+            if full_data is not None:
+                element["full_data"] = update_sub_elements(full_data, changes)
+                element_id = get_element_id(element["collection_string"], element["id"])
+                changed_sub_elements[element_id] = changes
+                if not read_change_id:
+                    read_change_id = change_id
+        return read_change_id, changed_sub_elements
 
     @property
     def element_iterator(self) -> Iterable[AutoupdateElement]:
@@ -136,21 +228,281 @@ class AutoupdateBundle:
             cache_elements[element_id] = full_data
         return cache_elements
 
-    async def dispatch_autoupdate(self) -> int:
+    async def dispatch_autoupdate(
+        self, unchanged_element_ids: List[str], unchanged_since: int
+    ) -> int:
         """
         Async helper function to update cache and send autoupdate.
 
         Return the change_id
         """
-        # Update cache
-        cache_elements = await self.get_data_for_cache()
+        return await send_autoupdate(
+            await self.get_data_for_cache(), unchanged_element_ids, unchanged_since
+        )
+
+
+def update_sub_elements(
+    full_data: Dict[str, Any], changes: SubElementChanges
+) -> Dict[str, Any]:
+    """
+    Returns a copy of the full_data with the changed sub elements. Changed sub
+    elements replace the old ones, new sub elements are appended and deleted
+    ones are removed. The full_data is not altered.
+    """
+    full_data = dict(full_data)
+    for key, changed in changes.items():
+        changed = dict(changed)
+        sub_elements = []
+        for sub_element in full_data.get(key, []):
+            if sub_element["id"] in changed:
+                sub_element = changed.pop(sub_element["id"])
+                if sub_element is None:
+                    continue
+            sub_elements.append(sub_element)
+        sub_elements.extend(
+            sub_element for sub_element in changed.values() if sub_element is not None
+        )
+        full_data[key] = sub_elements
+    return full_data
+
+
+def merge_sub_element_changes(
+    existing_element: AutoupdateElement, element: AutoupdateElement
+) -> AutoupdateElement:
+    """
+    Merges an element with changed sub elements into an element of the same root
+    rest element, that was added to the bundle before.
+
+    If the existing element is loaded from the DB, it already contains the
+    changes. If it has a full_data, the changes are applied to it.
+    """
+    merged_element = existing_element.copy()
+    merged_element.update(element)
+    changes = merged_element.pop("changed_sub_elements")
+    if "changed_sub_elements" in existing_element:
+        merged_changes = {
+            key: dict(changed)
+            for key, changed in existing_element["changed_sub_elements"].items()
+        }
+        for key, changed in changes.items():
+            merged_changes.setdefault(key, {}).update(changed)
+        merged_element["changed_sub_elements"] = merged_changes
+    else:
+        full_data = existing_element.get("full_data")
+        if full_data is not None:
+            merged_element["full_data"] = update_sub_elements(full_data, changes)
+    return merged_element
+
+
+async def send_autoupdate(
+    cache_elements: Dict[str, Optional[Dict[str, Any]]],
+    unchanged_element_ids: Optional[List[str]] = None,
+    unchanged_since: int = 0,
+) -> int:
+    """
+    Updates the cache and sends the autoupdate.
+
+    The elements with the unchanged_element_ids were updated from the cache at
+    the change id unchanged_since. If another worker changed one of them since
+    then, they are loaded from the DB instead.
+
+    Returns the change_id
+    """
+    # Update cache
+    try:
+        change_id = await element_cache.change_elements(
+            cache_elements, unchanged_element_ids, unchanged_since
+        )
+    except ElementsChanged:
+        assert unchanged_element_ids is not None
+        logger.info("Cached elements were changed by another worker, load them.")
+        await sync_to_async(load_elements)(cache_elements, unchanged_element_ids)
         change_id = await element_cache.change_elements(cache_elements)
 
-        # Send autoupdate
-        autoupdate_payload = {"elements": cache_elements, "change_id": change_id}
-        await stream.send("autoupdate", autoupdate_payload)
+    # Send autoupdate
+    autoupdate_payload = {"elements": cache_elements, "change_id": change_id}
+    await stream.send("autoupdate", autoupdate_payload)
 
-        return change_id
+    return change_id
+
+
+def load_elements(
+    cache_elements: Dict[str, Optional[Dict[str, Any]]], element_ids: List[str]
+) -> None:
+    """
+    Replaces the elements with the element_ids by the full_data from the DB.
+    """
+    ids: Dict[str, List[int]] = defaultdict(list)
+    for element_id in element_ids:
+        collection, id = split_element_id(element_id)
+        ids[collection].append(id)
+    for collection, collection_ids in ids.items():
+        loaded = {
+            full_data["id"]: full_data
+            for full_data in get_model_from_collection_string(collection).iter_elements(
+                collection_ids
+            )
+        }
+        for id in collection_ids:
+            element_id = get_element_id(collection, id)
+            old_full_data = cache_elements[element_id]
+            full_data = loaded.get(id)
+            if full_data is not None and old_full_data is not None:
+                full_data["_no_delete_on_restriction"] = old_full_data[
+                    "_no_delete_on_restriction"
+                ]
+            cache_elements[element_id] = full_data
+
+
+async def send_changed_restrictions(
+    group_ids: List[int], collections: List[str]
+) -> int:
+    """
+    Informs the cache about changed restrictions and sends the autoupdate.
+
+    Returns the change_id
+    """
+    change_id = await element_cache.change_restrictions(group_ids, collections)
+
+    # Send autoupdate
+    autoupdate_payload = {
+        "elements": {},
+        "change_id": change_id,
+        "restrictions": {"group_ids": group_ids, "collections": collections},
+    }
+    await stream.send("autoupdate", autoupdate_payload)
+
+    return change_id
+
+
+class CoalescedAutoupdate:
+    """
+    Elements of all bundles, that are sent together.
+    """
+
+    def __init__(self) -> None:
+        self.elements: Dict[str, Optional[Dict[str, Any]]] = {}
+        # The elements, that were updated from the cache, and the lowest change
+        # id, until which they were read.
+        self.unchanged_element_ids: Set[str] = set()
+        self.unchanged_since = 0
+        self.done = threading.Event()
+        self.change_id: Optional[int] = None
+        self.error: Optional[BaseException] = None
+
+
+class AutoupdateDispatcher:
+    """
+    Sends the elements of all bundles, that are done within the window (in
+    seconds), with one change of the cache and one autoupdate.
+
+    The elements are sent by one background thread, which waits for the
+    window after the first bundle. So the autoupdates are written into the
+    cache in the order of the bundles. The bundles wait until their elements
+    are sent. All bundles of one autoupdate get the same change id.
+    """
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self.lock = threading.Lock()
+        self.pending_added = threading.Condition(self.lock)
+        self.pending: Optional[CoalescedAutoupdate] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def dispatch(
+        self,
+        cache_elements: Dict[str, Optional[Dict[str, Any]]],
+        changed_sub_elements: Optional[Dict[str, SubElementChanges]] = None,
+        read_change_id: int = 0,
+    ) -> int:
+        """
+        Do NOT call this in an asynchronous context!
+
+        The elements, whose full_data was updated with changed sub elements,
+        have to be given with their changes in changed_sub_elements and the
+        change id, until which they were read from the cache.
+
+        Returns the change_id of the autoupdate, that contains the elements.
+        """
+        changed_sub_elements = changed_sub_elements or {}
+        with self.lock:
+            autoupdate = self.pending
+            if autoupdate is None:
+                autoupdate = self.pending = CoalescedAutoupdate()
+                self.pending_added.notify()
+            for element_id, full_data in cache_elements.items():
+                changes = changed_sub_elements.get(element_id)
+                if changes is None:
+                    # The element was loaded from the DB.
+                    autoupdate.unchanged_element_ids.discard(element_id)
+                elif element_id in autoupdate.elements:
+                    # The full_data was updated from the cache. So apply the
+                    # changes to the element of an earlier bundle instead,
+                    # which is newer.
+                    pending_full_data = autoupdate.elements[element_id]
+                    if pending_full_data is not None and full_data is not None:
+                        cache_elements[element_id] = {
+                            **update_sub_elements(pending_full_data, changes),
+                            "_no_delete_on_restriction": full_data[
+                                "_no_delete_on_restriction"
+                            ],
+                        }
+                    else:
+                        # The element was deleted by the earlier bundle.
+                        cache_elements[element_id] = None
+                else:
+                    autoupdate.unchanged_element_ids.add(element_id)
+                    if (
+                        not autoupdate.unchanged_since
+                        or read_change_id < autoupdate.unchanged_since
+                    ):
+                        autoupdate.unchanged_since = read_change_id
+            # Elements of later bundles overwrite the ones of earlier bundles.
+            autoupdate.elements.update(cache_elements)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="autoupdate dispatcher", daemon=True
+                )
+                self.thread.start()
+
+        autoupdate.done.wait()
+        if autoupdate.error is not None:
+            raise autoupdate.error
+        assert autoupdate.change_id is not None
+        return autoupdate.change_id
+
+    def run(self) -> None:
+        while True:
+            self.send_pending()
+
+    def send_pending(self) -> None:
+        """
+        Waits for pending elements and sends them after the window.
+        """
+        with self.lock:
+            while self.pending is None:
+                self.pending_added.wait()
+        time.sleep(self.window)
+        with self.lock:
+            autoupdate = self.pending
+            self.pending = None
+        assert autoupdate is not None
+        try:
+            autoupdate.change_id = async_to_sync(send_autoupdate)(
+                autoupdate.elements,
+                sorted(autoupdate.unchanged_element_ids),
+                autoupdate.unchanged_since,
+            )
+        except Exception as error:
+            # The error is raised in the waiting bundles.
+            autoupdate.error = error
+        finally:
+            autoupdate.done.set()
+            # Elements may be loaded from the DB in this thread.
+            close_old_connections()
+
+
+autoupdate_dispatcher = AutoupdateDispatcher(AUTOUPDATE_COALESCE_WINDOW or 0)
 
 
 def inform_changed_data(
@@ -167,6 +519,10 @@ def inform_changed_data(
 
     The argument instances can be one instance or an iterable over instances.
 
+    Instances, that are included in the full_data of their root rest element
+    with a sub_element_key (e.g. speakers), only update their entry in the
+    cached root element instead of loading the root element from the DB.
+
     History creation is enabled.
     """
     if information is None:
@@ -174,9 +530,28 @@ def inform_changed_data(
     if not is_iterable(instances):
         instances = (instances,)
 
-    root_instances = set(instance.get_root_rest_element() for instance in instances)
-
     elements = []
+    root_instances = set()
+    for instance in instances:
+        root_instance = instance.get_root_rest_element()
+        sub_element_key = getattr(instance, "sub_element_key", None)
+        if sub_element_key is None or final_data or root_instance == instance:
+            root_instances.add(root_instance)
+            continue
+        elements.append(
+            AutoupdateElement(
+                id=root_instance.get_rest_pk(),
+                collection_string=root_instance.get_collection_string(),
+                disable_history=disable_history,
+                information=information,
+                user_id=user_id,
+                no_delete_on_restriction=no_delete_on_restriction,
+                changed_sub_elements={
+                    sub_element_key: {instance.pk: instance.get_full_data()}
+                },
+            )
+        )
+
     for root_instance in root_instances:
         element = AutoupdateElement(
             id=root_instance.get_rest_pk(),
@@ -238,6 +613,24 @@ def inform_elements(elements: Iterable[AutoupdateElement]) -> None:
         bundle.done()
 
 
+def inform_changed_restrictions(
+    group_ids: Iterable[int], collections: Iterable[str]
+) -> None:
+    """
+    Informs the autoupdate system, that the restriction of the collections has
+    changed for the users of the groups, e.g. because the permissions of the
+    groups have changed. The elements are not written again. The users of the
+    groups get all elements of the collections with their next autoupdate.
+    """
+    bundle = autoupdate_bundle.get(threading.get_ident())
+    if bundle is not None:
+        bundle.add_restrictions(group_ids, collections)
+    else:
+        bundle = AutoupdateBundle()
+        bundle.add_restrictions(group_ids, collections)
+        bundle.done()
+
+
 """
 Global container for autoupdate bundles
 """
@@ -257,6 +650,9 @@ class AutoupdateBundleMiddleware:
         thread_id = threading.get_ident()
         autoupdate_bundle[thread_id] = AutoupdateBundle()
 
+        # Remove elements from the local cache that were changed by other workers.
+        async_to_sync(element_cache.validate_local_cache)()
+
         timing = Timing("request")
 
         response = self.get_response(request)
@@ -279,7 +675,7 @@ class AutoupdateBundleMiddleware:
                 content = {"change_id": change_id, "data": response.data}
                 # Note: autoupdate may be none on skipped ones (which should not happen
                 # since the user has made the request....)
-                response.content = json.dumps(content)
+                response.content = json_codec.dumps_bytes(content)
 
         timing(True)
         return response
@@ -339,12 +735,146 @@ async def _get_autoupdate_data(
         )
 
 
+def stream_all_data(user_id: int) -> Iterator[bytes]:
+    """
+    Yields all data restricted for the user as JSON in the autoupdate format
+    with all_data set to True. Can be used as streaming content of a django
+    StreamingHttpResponse.
+
+    Only one collection is decoded and restricted at a time. Elements of
+    collections that are not restricted for the user are not decoded at all.
+    """
+    async_to_sync(element_cache.validate_local_cache)()
+    (
+        max_change_id,
+        all_data,
+    ) = async_to_sync(element_cache.get_all_encoded_data_with_max_change_id)()
+    permission_context = element_cache.get_permission_context(user_id)
+
+    yield b'{"changed":{'
+    separator = b""
+    while all_data:
+        # Remove each collection from all_data, so it can be freed after sending.
+        collection, encoded_elements = all_data.popitem()
+        restricted_json = async_to_sync(element_cache.get_restricted_collection_json)(
+            collection, encoded_elements, user_id, permission_context, max_change_id
+        )
+        yield separator + json_codec.dumps_bytes(collection) + b":" + restricted_json
+        separator = b","
+    yield (
+        f'}},"deleted":{{}},"from_change_id":0,'
+        f'"to_change_id":{max_change_id},"all_data":true}}'
+    ).encode()
+
+
+class HistoryWriter:
+    """
+    Saves the history in a background thread, so the requests do not have to
+    wait for it.
+
+    The elements are queued together with the time of the change. The thread
+    saves everything that was queued since its last run in one transaction.
+    """
+
+    def __init__(self) -> None:
+        self.queue: "queue.Queue[Tuple[datetime, List[AutoupdateElement]]]" = (
+            queue.Queue()
+        )
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def add(self, elements: List[AutoupdateElement]) -> None:
+        """
+        Queues the elements to be saved in the history and starts the thread.
+        """
+        self.put(elements)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="history-writer", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def put(self, elements: List[AutoupdateElement]) -> None:
+        """
+        Queues copies of the elements. The full_data is copied by encoding it,
+        so later changes of the elements (e.g. by the element cache) do not
+        reach the history. Data, that can not be encoded, raises here and not
+        in the thread.
+        """
+        copies = []
+        for element in elements:
+            copy = element.copy()
+            full_data = element.get("full_data")
+            if full_data is not None:
+                copy["full_data"] = json_codec.loads(json_codec.dumps_bytes(full_data))
+            copies.append(copy)
+        self.queue.put((now(), copies))
+
+    def flush(self) -> None:
+        """
+        Blocks until all queued elements are saved.
+        """
+        self.queue.join()
+
+    def run(self) -> None:
+        while True:
+            self.save_queued()
+            close_old_connections()
+
+    def save_queued(self) -> None:
+        """
+        Waits for queued elements and saves everything that is queued in one
+        transaction.
+
+        If the transaction fails, the queued entries are saved one by one, so
+        only the failing entries are lost.
+        """
+        from ..core.models import History
+
+        batch = [self.queue.get()]
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with transaction.atomic():
+                for history_time, elements in batch:
+                    History.objects.add_elements(elements, history_time)
+        except Exception:
+            logger.exception(
+                f"Could not save {len(batch)} history entries in one transaction"
+            )
+            for history_time, elements in batch:
+                try:
+                    with transaction.atomic():
+                        History.objects.add_elements(elements, history_time)
+                except Exception:
+                    logger.exception(
+                        f"Could not save history entry for {len(elements)} elements"
+                    )
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+
+history_writer = HistoryWriter()
+
+
 def save_history(element_iterator: Iterable[AutoupdateElement]) -> Iterable:
     """
     Thin wrapper around the call of history saving manager method.
 
     This is separated to patch it during tests.
+
+    If HISTORY_WRITE_ASYNC is set, the elements are saved by the history writer
+    in the background and an empty list is returned.
     """
     from ..core.models import History
 
+    if HISTORY_WRITE_ASYNC:
+        history_writer.add(list(element_iterator))
+        return []
     return History.objects.add_elements(element_iterator)
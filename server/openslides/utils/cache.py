@@ -1,27 +1,85 @@
-import json
+import asyncio
+import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from time import sleep
-from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from time import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
 
 from asgiref.sync import async_to_sync, sync_to_async
 from django.apps import apps
+from django.conf import settings
+from django.db import connections
 
-from . import logging
+from . import json_codec, logging
 from .cache_providers import (
     Cachable,
     ElementCacheProvider,
     MemoryCacheProvider,
     RedisCacheProvider,
 )
-from .locking import locking
+from .locking import Lock
+from .lru_cache import LRUCache
 from .redis import use_redis
 from .schema_version import SchemaVersion, schema_version_handler
 from .utils import get_element_id, split_element_id
 
 
+if TYPE_CHECKING:
+    # Dependency cycle
+    from .auth import PermissionContext
+
 logger = logging.getLogger(__name__)
 
+ELEMENT_CACHE_LOCAL_SIZE = getattr(settings, "ELEMENT_CACHE_LOCAL_SIZE", 10000)
+logger.info(f"Element cache local size {ELEMENT_CACHE_LOCAL_SIZE}")
+ELEMENT_CACHE_RESTRICTED_SIZE = getattr(settings, "ELEMENT_CACHE_RESTRICTED_SIZE", 1000)
+logger.info(f"Element cache restricted size {ELEMENT_CACHE_RESTRICTED_SIZE}")
+CACHE_BUILD_THREADS = getattr(settings, "CACHE_BUILD_THREADS", 1)
+CACHE_BUILD_CHUNK_SIZE = getattr(settings, "CACHE_BUILD_CHUNK_SIZE", 1000)
+logger.info(
+    f"Cache build threads {CACHE_BUILD_THREADS}, chunk size {CACHE_BUILD_CHUNK_SIZE}"
+)
+CHANGE_ID_MAX_COUNT = getattr(settings, "CHANGE_ID_MAX_COUNT", 0)
+CHANGE_ID_MAX_AGE = getattr(settings, "CHANGE_ID_MAX_AGE", 0)
+CHANGE_ID_TRIM_INTERVAL = getattr(settings, "CHANGE_ID_TRIM_INTERVAL", 60)
+logger.info(
+    f"Change ids max count {CHANGE_ID_MAX_COUNT}, max age {CHANGE_ID_MAX_AGE}, "
+    f"trim interval {CHANGE_ID_TRIM_INTERVAL}"
+)
+
+
+# The special field _no_delete_on_restriction is always the last key of an encoded
+# element, because it is added after the full_data was created.
+NO_DELETE_ON_RESTRICTION_REGEX = re.compile(
+    rb',\s*"_no_delete_on_restriction":\s*(?:true|false)\}$'
+)
+
+
+def strip_no_delete_on_restriction(encoded_element: bytes) -> bytes:
+    """
+    Removes the special field _no_delete_on_restriction from an encoded element
+    without decoding it, if possible.
+    """
+    if b'"_no_delete_on_restriction"' not in encoded_element:
+        return encoded_element
+    stripped, count = NO_DELETE_ON_RESTRICTION_REGEX.subn(b"}", encoded_element)
+    if count:
+        return stripped
+    element = json_codec.loads(encoded_element)
+    element.pop("_no_delete_on_restriction", False)
+    return json_codec.dumps_bytes(element)
+
 
 class ChangeIdTooLowError(Exception):
     pass
@@ -50,25 +108,54 @@ class ElementCache:
 
     Saves the full_data
 
-    There is one redis Hash (simular to python dict) for the full_data
+    There is one redis Hash (simular to python dict) per collection for the
+    full_data. The key of the hash is full_data:COLLECTIONSTRING where
+    COLLECTIONSTRING is the collection of the elements. The keys inside the hash
+    are the ids of the elements. All collections are registered in a redis set.
 
-    The key of the Hashes is COLLECTIONSTRING:ID where COLLECTIONSTRING is the
-    collection of a collection and id the id of an element.
+    Elements are identified by COLLECTIONSTRING:ID (the element_id).
 
     There is an sorted set in redis with the change id as score. The values are
     COLLETIONSTRING:ID for the elements that have been changed with that change
     id. With this key it is possible, to get all elements as full_data
     that are newer then a specific change id.
 
+    Decoded elements requested with get_element_data are kept in a process local
+    LRU cache (the local cache). The local cache is valid for the change id
+    local_cache_change_id. It is validated with validate_local_cache, which removes
+    all elements that have been changed since then. This is done at the beginning
+    of every request, every autoupdate and at least every local_cache_max_age
+    seconds. Other process local indexes can follow the invalidations of the local
+    cache with add_local_cache_listener.
+
+    Cachables can declare with is_group_restricted, that their restricted data only
+    depends on the groups of the user. Their restricted collections are kept in a
+    second process local LRU cache (the restricted cache) with the collection, the
+    change ids and the groups of the user as key. So users with the same groups
+    share one restriction. The restricted cache is cleared when the change id
+    advances.
+
     All method of this class are async. You either have to call them with
     await in an async environment or use asgiref.sync.async_to_sync().
     """
 
+    local_cache_max_age = 1.0
+    """
+    Seconds after which the local cache is validated again on the next access.
+    """
+
     def __init__(
         self,
         cache_provider_class: Type[ElementCacheProvider] = RedisCacheProvider,
         cachable_provider: Callable[[], List[Cachable]] = get_all_cachables,
         default_change_id: Optional[int] = None,
+        local_cache_size: int = ELEMENT_CACHE_LOCAL_SIZE,
+        restricted_cache_size: int = ELEMENT_CACHE_RESTRICTED_SIZE,
+        build_threads: int = CACHE_BUILD_THREADS,
+        build_chunk_size: int = CACHE_BUILD_CHUNK_SIZE,
+        change_id_max_count: int = CHANGE_ID_MAX_COUNT,
+        change_id_max_age: int = CHANGE_ID_MAX_AGE,
+        change_id_trim_interval: float = CHANGE_ID_TRIM_INTERVAL,
     ) -> None:
         """
         Initializes the cache.
@@ -77,6 +164,25 @@ class ElementCache:
         self.cachable_provider = cachable_provider
         self._cachables: Optional[Dict[str, Cachable]] = None
         self.default_change_id: Optional[int] = default_change_id
+        self.build_threads = build_threads
+        self.build_chunk_size = build_chunk_size
+        self.change_id_max_count = change_id_max_count
+        self.change_id_max_age = change_id_max_age
+        self.change_id_trim_interval = change_id_trim_interval
+        self.change_ids_trimmed = 0.0
+
+        self.local_cache: LRUCache[str, Dict[str, Any]] = LRUCache(local_cache_size)
+        self.local_cache_change_id: Optional[int] = None
+        self.local_cache_validated = 0.0
+        # Incremented each time elements are removed from the local cache. Used to
+        # detect elements that were loaded before they got invalidated.
+        self.local_cache_generation = 0
+        self.local_cache_listeners: List[Callable[[Optional[Iterable[str]]], None]] = []
+
+        self.restricted_cache: LRUCache[Tuple, List[Dict[str, Any]]] = LRUCache(
+            restricted_cache_size
+        )
+        self.restricted_cache_change_id = 0
 
     @property
     def cachables(self) -> Dict[str, Cachable]:
@@ -127,20 +233,22 @@ class ElementCache:
         default_change_id: Optional[int] = None,
         schema_version: Optional[SchemaVersion] = None,
     ) -> None:
-        lock_name = "build_cache"
         # Set a lock so only one process builds the cache
-        if await locking.set(lock_name):
-            try:
-                await self._build_cache(
-                    default_change_id=default_change_id, schema_version=schema_version
-                )
-            finally:
-                await locking.delete(lock_name)
-        else:
+        lock = Lock("build_cache")
+        while not await lock.acquire(blocking=False):
             logger.info("Wait for another process to build up the cache...")
-            while await locking.get(lock_name):
-                sleep(0.01)
-            logger.info("Cache is ready (built by another process).")
+            await lock.wait()
+            if await self.cache_provider.data_exists():
+                logger.info("Cache is ready (built by another process).")
+                return
+            # The lock expired, because the other process died.
+            logger.warning("The cache was not built by the other process.")
+        try:
+            await self._build_cache(
+                default_change_id=default_change_id, schema_version=schema_version
+            )
+        finally:
+            await lock.release()
 
     async def _build_cache(
         self,
@@ -148,6 +256,7 @@ class ElementCache:
         schema_version: Optional[SchemaVersion] = None,
     ) -> None:
         logger.info("Building config data and resetting cache...")
+        self.clear_local_cache()
         config_mapping = await sync_to_async(
             self._build_cache_get_elementid_model_mapping
         )(config_only=True)
@@ -157,15 +266,77 @@ class ElementCache:
             await self.cache_provider.set_schema_version(schema_version)
         logger.info("Done building and resetting.")
 
-        logger.info("Building up the cache data...")
-        mapping = await sync_to_async(self._build_cache_get_elementid_model_mapping)()
-        logger.info("Done building the cache data.")
-        logger.info("Saving cache data into the cache...")
-        await self.cache_provider.add_to_full_data(mapping)
-        logger.info("Done saving the cache data.")
+        logger.info("Building up and saving the cache data...")
+        await self._build_cache_add_collections()
+        logger.info("Done building and saving the cache data.")
         await self.cache_provider.set_cache_ready()
         logger.info("Done: Cache is ready now.")
 
+    async def _build_cache_add_collections(self) -> None:
+        """
+        Loads all collections except the config and saves them into the cache.
+
+        Each collection is saved in chunks of build_chunk_size elements as soon
+        as they are serialized, so the whole data is never held in memory. With
+        more than one build thread, the collections are loaded concurrently with
+        one database connection per thread.
+        """
+        loop = asyncio.get_event_loop()
+        collections = [
+            collection
+            for collection in self.cachables.keys()
+            if collection != "core/config"
+        ]
+        if self.build_threads <= 1:
+            for collection in collections:
+                await sync_to_async(self._build_cache_add_collection)(collection, loop)
+            return
+
+        def add_collection(collection: str) -> None:
+            try:
+                self._build_cache_add_collection(collection, loop)
+            finally:
+                # Each thread uses its own database connection.
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.build_threads) as executor:
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(executor, add_collection, collection)
+                    for collection in collections
+                )
+            )
+
+    def _build_cache_add_collection(
+        self, collection: str, loop: asyncio.AbstractEventLoop
+    ) -> None:
+        """
+        Do NOT call this in an asynchronous context!
+        This accesses the django's model system which requires a synchronous context.
+
+        Serializes all elements of the collection and saves them into the cache in
+        chunks. The chunks are saved with the given event loop.
+        """
+        chunk: Dict[str, str] = {}
+        count = 0
+        for element in self.cachables[collection].iter_elements():
+            chunk[get_element_id(collection, element["id"])] = json_codec.dumps(element)
+            if len(chunk) >= self.build_chunk_size:
+                count += len(chunk)
+                self._build_cache_save_chunk(chunk, loop)
+                chunk = {}
+        if chunk:
+            count += len(chunk)
+            self._build_cache_save_chunk(chunk, loop)
+        logger.info(f"    Saved {count} elements of {collection}")
+
+    def _build_cache_save_chunk(
+        self, chunk: Dict[str, str], loop: asyncio.AbstractEventLoop
+    ) -> None:
+        asyncio.run_coroutine_threadsafe(
+            self.cache_provider.add_to_full_data(chunk), loop
+        ).result()
+
     def _build_cache_get_elementid_model_mapping(
         self, config_only: bool = False
     ) -> Dict[str, str]:
@@ -183,9 +354,13 @@ class ElementCache:
                 not config_only and collection == config_collection
             ):
                 continue
-            for element in cachable.get_elements():
+            for element in cachable.iter_elements():
                 mapping.update(
-                    {get_element_id(collection, element["id"]): json.dumps(element)}
+                    {
+                        get_element_id(collection, element["id"]): json_codec.dumps(
+                            element
+                        )
+                    }
                 )
         return mapping
 
@@ -206,7 +381,10 @@ class ElementCache:
         return change_id
 
     async def change_elements(
-        self, elements: Dict[str, Optional[Dict[str, Any]]]
+        self,
+        elements: Dict[str, Optional[Dict[str, Any]]],
+        unchanged_element_ids: Optional[List[str]] = None,
+        unchanged_since: int = 0,
     ) -> int:
         """
         Changes elements in the cache.
@@ -214,6 +392,9 @@ class ElementCache:
         elements is a dict with element_id <-> changed element. When the value is None,
         it is interpreded as deleted.
 
+        If one of the unchanged_element_ids was changed after the change id
+        unchanged_since, nothing is changed and ElementsChanged is raised.
+
         Returns the new generated change_id.
         """
         # Split elements into changed and deleted.
@@ -223,13 +404,128 @@ class ElementCache:
             if data:
                 # The arguments for redis.hset is pairs of key value
                 changed_elements.append(element_id)
-                changed_elements.append(json.dumps(data))
+                changed_elements.append(json_codec.dumps(data))
             else:
                 deleted_elements.append(element_id)
 
-        return await self.cache_provider.add_changed_elements(
-            changed_elements, deleted_elements
+        change_id = await self.cache_provider.add_changed_elements(
+            changed_elements, deleted_elements, unchanged_element_ids, unchanged_since
         )
+        self.remove_from_local_cache(elements.keys())
+        await self.trim_change_ids()
+        return change_id
+
+    async def change_restrictions(
+        self, group_ids: List[int], collections: List[str]
+    ) -> int:
+        """
+        Informs the cache, that the restriction of the collections has changed
+        for the users of the groups. The elements are not changed.
+
+        get_data_since returns all elements of these collections to users of
+        the groups. Returns the new generated change_id.
+        """
+        change_id = await self.cache_provider.add_restriction_changes(
+            group_ids, collections
+        )
+        await self.trim_change_ids()
+        return change_id
+
+    async def trim_change_ids(self, force: bool = False) -> None:
+        """
+        Removes old element ids from the change id cache, so it does not grow
+        forever. See the settings CHANGE_ID_MAX_COUNT and CHANGE_ID_MAX_AGE.
+
+        Each worker does this at most every change_id_trim_interval seconds,
+        unless force is True. Clients with a change id lower than the new
+        lowest change id get a ChangeIdTooLowError and have to load all data.
+        """
+        if not self.change_id_max_count and not self.change_id_max_age:
+            return
+        now = time()
+        if not force and now < self.change_ids_trimmed + self.change_id_trim_interval:
+            return
+        self.change_ids_trimmed = now
+        lowest_change_id = await self.cache_provider.trim_change_ids(
+            self.change_id_max_count, self.change_id_max_age
+        )
+        logger.debug(f"Trimmed the change ids, lowest change id {lowest_change_id}")
+
+    def add_local_cache_listener(
+        self, listener: Callable[[Optional[Iterable[str]]], None]
+    ) -> None:
+        """
+        Registers a callable, that is called with the element ids that are removed
+        from the local cache. It is called with None, if the local cache is
+        cleared.
+        """
+        self.local_cache_listeners.append(listener)
+
+    def remove_from_local_cache(self, element_ids: Iterable[str]) -> None:
+        """
+        Removes the elements from the local cache and informs the listeners.
+        """
+        self.local_cache_generation += 1
+        self.local_cache.pop_many(element_ids)
+        for listener in self.local_cache_listeners:
+            listener(element_ids)
+
+    def clear_local_cache(self) -> None:
+        """
+        Removes all elements from the local cache and the restricted cache.
+        """
+        self.local_cache_generation += 1
+        self.local_cache.clear()
+        self.local_cache_change_id = None
+        self.restricted_cache.clear()
+        self.restricted_cache_change_id = 0
+        for listener in self.local_cache_listeners:
+            listener(None)
+
+    async def validate_local_cache(self) -> None:
+        """
+        Removes all elements from the local cache, that have been changed since
+        the local cache was validated the last time.
+
+        Elements are only read from a redis replica again, if it has all
+        changes until the validated change id. Else a lagging replica could put
+        an old element into the local cache.
+        """
+        if not self.local_cache.max_size and not self.local_cache_listeners:
+            return
+
+        self.local_cache_validated = time()
+        if self.local_cache_change_id is None:
+            self.clear_local_cache()
+            self.local_cache_change_id = await self.get_current_change_id()
+            self.cache_provider.require_change_id(self.local_cache_change_id)
+            return
+
+        (
+            max_change_id,
+            lowest_change_id,
+            element_ids,
+        ) = await self.cache_provider.get_element_ids_since(
+            self.local_cache_change_id + 1
+        )
+        if (
+            max_change_id < self.local_cache_change_id
+            or self.local_cache_change_id < lowest_change_id
+        ):
+            # The cache was rebuild since the last validation.
+            self.clear_local_cache()
+        elif element_ids:
+            self.remove_from_local_cache(element_ids)
+        self.local_cache_change_id = max_change_id
+        self.cache_provider.require_change_id(max_change_id)
+
+    async def validate_local_cache_if_outdated(self) -> None:
+        """
+        Validates the local cache, if this was not done in the last
+        local_cache_max_age seconds.
+        """
+        if time() - self.local_cache_validated > self.local_cache_max_age:
+            await self.validate_local_cache()
 
     async def get_all_data_list(
         self, user_id: Optional[int] = None
@@ -247,30 +543,110 @@ class ElementCache:
     async def get_all_data_list_with_max_change_id(
         self, user_id: Optional[int] = None
     ) -> Tuple[int, Dict[str, List[Dict[str, Any]]]]:
+        if user_id is not None:
+            await self.validate_local_cache()
         (
             max_change_id,
             all_data,
         ) = await self.cache_provider.get_all_data_with_max_change_id()
-        return max_change_id, await self.format_all_data(all_data, user_id)
+        return (
+            max_change_id,
+            await self.format_all_data(all_data, user_id, max_change_id),
+        )
 
     async def format_all_data(
-        self, all_data_bytes: Dict[bytes, bytes], user_id: Optional[int]
+        self,
+        all_data_bytes: Dict[bytes, bytes],
+        user_id: Optional[int],
+        change_id: Optional[int] = None,
     ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Decodes all data and restricts it, if the user id is given.
+
+        If change_id is the change id of all_data_bytes, the restricted cache is
+        used for group restricted cachables.
+        """
         all_data: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
         for element_id, data in all_data_bytes.items():
             collection, _ = split_element_id(element_id)
-            element = json.loads(data.decode())
+            element = json_codec.loads(data)
             element.pop(
                 "_no_delete_on_restriction", False
             )  # remove special field for get_data_since
             all_data[collection].append(element)
 
         if user_id is not None:
+            permission_context = self.get_permission_context(user_id)
             for collection in all_data.keys():
-                restricter = self.cachables[collection].restrict_elements
-                all_data[collection] = await restricter(user_id, all_data[collection])
+                all_data[collection] = await self.restrict_collection_data(
+                    collection,
+                    all_data[collection],
+                    user_id,
+                    permission_context,
+                    None if change_id is None else (0, change_id),
+                )
         return dict(all_data)
 
+    async def get_all_encoded_data_with_max_change_id(
+        self,
+    ) -> Tuple[int, Dict[str, List[bytes]]]:
+        """
+        Returns the max change id and all encoded elements with a list per
+        collection. The elements are not decoded.
+        """
+        (
+            max_change_id,
+            all_data_bytes,
+        ) = await self.cache_provider.get_all_data_with_max_change_id()
+        all_data: Dict[str, List[bytes]] = defaultdict(list)
+        for element_id, data in all_data_bytes.items():
+            collection, _ = split_element_id(element_id)
+            all_data[collection].append(data)
+        return max_change_id, dict(all_data)
+
+    async def get_restricted_collection_json(
+        self,
+        collection: str,
+        encoded_elements: List[bytes],
+        user_id: int,
+        permission_context: "PermissionContext",
+        change_id: Optional[int] = None,
+    ) -> bytes:
+        """
+        Returns the encoded elements of one collection restricted for the user
+        as JSON list.
+
+        If the cachable passes all elements unchanged for the user, the encoded
+        elements are spliced together without decoding them.
+
+        change_id is the change id of the encoded elements. It is used for the
+        restricted cache.
+        """
+        cachable = self.cachables[collection]
+        if await cachable.is_unrestricted(user_id, permission_context):
+            return (
+                b"["
+                + b",".join(
+                    strip_no_delete_on_restriction(encoded_element)
+                    for encoded_element in encoded_elements
+                )
+                + b"]"
+            )
+
+        elements = []
+        for encoded_element in encoded_elements:
+            element = json_codec.loads(encoded_element)
+            element.pop("_no_delete_on_restriction", False)
+            elements.append(element)
+        restricted_elements = await self.restrict_collection_data(
+            collection,
+            elements,
+            user_id,
+            permission_context,
+            None if change_id is None else (0, change_id),
+        )
+        return json_codec.dumps_bytes(restricted_elements)
+
     async def get_collection_data(self, collection: str) -> Dict[int, Dict[str, Any]]:
         """
         Returns the data for one collection as dict: {id: <element>}
@@ -280,41 +656,164 @@ class ElementCache:
         )
         collection_data = {}
         for id in encoded_collection_data.keys():
-            collection_data[id] = json.loads(encoded_collection_data[id].decode())
+            collection_data[id] = json_codec.loads(encoded_collection_data[id])
             collection_data[id].pop(
                 "_no_delete_on_restriction", False
             )  # remove special field for get_data_since
         return collection_data
 
+    async def get_collection_restricted_data(
+        self, collection: str, user_id: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the data for one collection as list restricted for the given user.
+
+        Only the elements of this collection are loaded from the cache and only
+        the restricter of this collection is called.
+        """
+        collection_data = await self.get_collection_data(collection)
+        restricter = self.cachables[collection].restrict_elements
+        return await restricter(
+            user_id,
+            list(collection_data.values()),
+            self.get_permission_context(user_id),
+        )
+
     async def get_element_data(
         self, collection: str, id: int, user_id: Optional[int] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Returns one element or None, if the element does not exist.
         If the user id is given the data will be restricted for this user.
+
+        The element is taken from the local cache, if possible. Unrestricted
+        elements are shared with the local cache and must not be altered.
         """
-        encoded_element = await self.cache_provider.get_element_data(
-            get_element_id(collection, id)
-        )
+        await self.validate_local_cache_if_outdated()
 
-        if encoded_element is None:
-            return None
-        element = json.loads(encoded_element.decode())  # type: ignore
-        element.pop(
-            "_no_delete_on_restriction", False
-        )  # remove special field for get_data_since
+        element_id = get_element_id(collection, id)
+        element = self.local_cache.get(element_id)
+        if element is None:
+            generation = self.local_cache_generation
+            encoded_element = await self.cache_provider.get_element_data(element_id)
+
+            if encoded_element is None:
+                return None
+            element = json_codec.loads(encoded_element)  # type: ignore
+            element.pop(
+                "_no_delete_on_restriction", False
+            )  # remove special field for get_data_since
+            if generation == self.local_cache_generation:
+                self.local_cache.set(element_id, element)
 
         if user_id is not None:
-            element = await self.restrict_element_data(element, collection, user_id)
+            # Restrict a copy, so the restricter can not alter the local cache.
+            element = await self.restrict_element_data(
+                dict(element), collection, user_id
+            )
         return element
 
+    async def get_current_element_data(
+        self, collection: str, id: int
+    ) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Returns the current change id and the element or None, if the element
+        does not exist. The element is read from the main cache without the
+        local cache, so it contains all changes until the change id.
+        """
+        change_id = await self.get_current_change_id()
+        encoded_element = await self.cache_provider.get_element_data(
+            get_element_id(collection, id), read_only=False
+        )
+        if encoded_element is None:
+            return change_id, None
+        element = json_codec.loads(encoded_element)
+        element.pop("_no_delete_on_restriction", False)
+        return change_id, element
+
     async def restrict_element_data(
         self, element: Dict[str, Any], collection: str, user_id: int
     ) -> Optional[Dict[str, Any]]:
         restricter = self.cachables[collection].restrict_elements
-        restricted_elements = await restricter(user_id, [element])
+        restricted_elements = await restricter(
+            user_id, [element], self.get_permission_context(user_id)
+        )
         return restricted_elements[0] if restricted_elements else None
 
+    async def restrict_collection_data(
+        self,
+        collection: str,
+        elements: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: "PermissionContext",
+        change_ids: Optional[Tuple[int, int]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Restricts the elements of one collection for the user.
+
+        change_ids is the tuple (from_change_id, to_change_id), that identifies
+        the elements (from_change_id is 0 for all elements of the collection). If
+        it is given and the cachable is group restricted, the restricted data is
+        taken from or saved into the restricted cache. The returned data is
+        shared with other users in this case and must not be altered.
+        """
+        # The restricters can share values between users restricting the same
+        # data, if the change id of the data is known.
+        permission_context.change_id = None if change_ids is None else change_ids[1]
+        try:
+            return await self._restrict_collection_data(
+                collection, elements, user_id, permission_context, change_ids
+            )
+        finally:
+            permission_context.change_id = None
+
+    async def _restrict_collection_data(
+        self,
+        collection: str,
+        elements: List[Dict[str, Any]],
+        user_id: int,
+        permission_context: "PermissionContext",
+        change_ids: Optional[Tuple[int, int]],
+    ) -> List[Dict[str, Any]]:
+        cachable = self.cachables[collection]
+        if change_ids is None or not cachable.is_group_restricted():
+            return await cachable.restrict_elements(
+                user_id, elements, permission_context
+            )
+
+        change_id = change_ids[1]
+        if change_id > self.restricted_cache_change_id:
+            # The data has changed. All restricted data is outdated.
+            self.restricted_cache.clear()
+            self.restricted_cache_change_id = change_id
+
+        profile = await permission_context.get_group_profile()
+        if profile is None or change_id < self.restricted_cache_change_id:
+            return await cachable.restrict_elements(
+                user_id, elements, permission_context
+            )
+
+        key = (collection, change_ids, profile)
+        restricted_elements = self.restricted_cache.get(key)
+        if restricted_elements is None:
+            restricted_elements = await cachable.restrict_elements(
+                user_id, elements, permission_context
+            )
+            if change_id == self.restricted_cache_change_id:
+                self.restricted_cache.set(key, restricted_elements)
+        return restricted_elements
+
+    def get_permission_context(self, user_id: int) -> "PermissionContext":
+        """
+        Returns a new permission context for the user. Use one context for all
+        restricters of one restriction pass, so the groups and permissions of the
+        user are only loaded once.
+        """
+        # Dependency cycle
+        from .auth import PermissionContext
+
+        return PermissionContext(user_id)
+
     async def get_data_since(
         self, user_id: Optional[int] = None, change_id: int = 0
     ) -> Tuple[int, Dict[str, List[Dict[str, Any]]], List[str]]:
@@ -334,6 +833,8 @@ class ElementCache:
         change_id=0. This is importend because there could be deleted elements
         that the cache does not know about.
         """
+        await self.validate_local_cache()
+
         if change_id == 0:
             (
                 max_change_id,
@@ -355,9 +856,26 @@ class ElementCache:
             max_change_id,
             raw_changed_elements,
             deleted_elements,
+            restrictions,
         ) = await self.cache_provider.get_data_since(change_id)
+        if user_id is not None:
+            permission_context = self.get_permission_context(user_id)
+            for collection, group_ids in restrictions.items():
+                # The restriction of the collection has changed for the groups.
+                # Users in one of these groups get all elements again.
+                if (
+                    collection in self.cachables
+                    and await permission_context.in_some_groups(
+                        list(group_ids), exact=True
+                    )
+                ):
+                    raw_changed_elements[collection] = list(
+                        (
+                            await self.cache_provider.get_collection_data(collection)
+                        ).values()
+                    )
         changed_elements = {
-            collection: [json.loads(value.decode()) for value in value_list]
+            collection: [json_codec.loads(value) for value in value_list]
             for collection, value_list in raw_changed_elements.items()
         }
 
@@ -380,8 +898,12 @@ class ElementCache:
                         unrestricted_ids.add(element["id"])
 
                 cacheable = self.cachables[collection]
-                restricted_elements = await cacheable.restrict_elements(
-                    user_id, elements
+                restricted_elements = await self.restrict_collection_data(
+                    collection,
+                    elements,
+                    user_id,
+                    permission_context,
+                    (change_id, max_change_id),
                 )
 
                 # If the model is personalized, it must not be deleted for other users
@@ -1,28 +1,67 @@
 import functools
 import hashlib
 from collections import defaultdict
+from itertools import islice
 from textwrap import dedent
-from typing import Any, Callable, Coroutine, Dict, List, Optional, Set, Tuple
-
+from time import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from typing_extensions import Protocol
 
 from . import logging
-from .redis import use_redis
+from .redis import use_read_only_redis, use_redis
 from .schema_version import SchemaVersion
 from .utils import split_element_id, str_dict_to_bytes
 
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Prefix of the entries of the change id cache for changed restrictions.
+RESTRICTION_PREFIX = "_restriction:"
+
+REDIS_PIPELINED_WRITES = getattr(settings, "REDIS_PIPELINED_WRITES", False)
+REDIS_WRITE_CHUNK_SIZE = getattr(settings, "REDIS_WRITE_CHUNK_SIZE", 1000)
+logger.info(
+    f"Redis pipelined writes {REDIS_PIPELINED_WRITES}, "
+    f"chunk size {REDIS_WRITE_CHUNK_SIZE}"
+)
+
 if use_redis:
     from .redis import aioredis, get_connection
 
+if TYPE_CHECKING:
+    # Dependency cycle
+    from .auth import PermissionContext
+
 
 class CacheReset(Exception):
     pass
 
 
+class ElementsChanged(Exception):
+    """
+    Raised by add_changed_elements, if elements, that have to be unchanged, were
+    changed in the meantime. Nothing is written then.
+    """
+
+
 class ElementCacheProvider(Protocol):
     """
     Base class for cache provider.
@@ -36,6 +75,9 @@ class ElementCacheProvider(Protocol):
     async def ensure_cache(self) -> None:
         ...
 
+    def require_change_id(self, change_id: int) -> None:
+        ...
+
     async def clear_cache(self) -> None:
         ...
 
@@ -62,17 +104,31 @@ class ElementCacheProvider(Protocol):
     async def get_collection_data(self, collection: str) -> Dict[int, bytes]:
         ...
 
-    async def get_element_data(self, element_id: str) -> Optional[bytes]:
+    async def get_element_data(
+        self, element_id: str, read_only: bool = True
+    ) -> Optional[bytes]:
         ...
 
     async def add_changed_elements(
-        self, changed_elements: List[str], deleted_element_ids: List[str]
+        self,
+        changed_elements: List[str],
+        deleted_element_ids: List[str],
+        unchanged_element_ids: Optional[List[str]] = None,
+        unchanged_since: int = 0,
     ) -> int:
         ...
 
     async def get_data_since(
         self, change_id: int
-    ) -> Tuple[int, Dict[str, List[bytes]], List[str]]:
+    ) -> Tuple[int, Dict[str, List[bytes]], List[str], Dict[str, Set[int]]]:
+        ...
+
+    async def add_restriction_changes(
+        self, group_ids: List[int], collections: List[str]
+    ) -> int:
+        ...
+
+    async def get_element_ids_since(self, change_id: int) -> Tuple[int, int, List[str]]:
         ...
 
     async def get_current_change_id(self) -> int:
@@ -81,6 +137,9 @@ class ElementCacheProvider(Protocol):
     async def get_lowest_change_id(self) -> int:
         ...
 
+    async def trim_change_ids(self, max_count: int, max_age: int) -> int:
+        ...
+
     async def get_schema_version(self) -> Optional[SchemaVersion]:
         ...
 
@@ -88,6 +147,34 @@ class ElementCacheProvider(Protocol):
         ...
 
 
+def get_restriction_id(group_id: int, collection: str) -> str:
+    """
+    Returns the entry of the change id cache for a changed restriction of the
+    collection for the users of the group.
+    """
+    return f"{RESTRICTION_PREFIX}{group_id}:{collection}"
+
+
+def split_restriction_id(restriction_id: str) -> Tuple[int, str]:
+    """
+    Returns the group id and the collection of a restriction id.
+    """
+    _, group_id, collection = restriction_id.split(":", 2)
+    return int(group_id), collection
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Yields lists with up to size items.
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def ensure_cache_wrapper() -> Callable[[Callable[..., Any]], Callable[..., Any]]:
     """
     Wraps a cache function to ensure, that the cache is filled.
@@ -121,26 +208,54 @@ def ensure_cache_wrapper() -> Callable[[Callable[..., Any]], Callable[..., Any]]
 class RedisCacheProvider:
     """
     Cache provider that loads and saves the data to redis.
+
+    Every collection is saved in its own redis hash with the key
+    `full_data:COLLECTIONSTRING`. The keys of the hashes are the ids of the elements.
+    All collections that have a hash are registered in the collections set
+    (`full_data_collections`).
     """
 
     full_data_cache_key: str = "full_data"
+    collections_cache_key: str = "full_data_collections"
     change_id_cache_key: str = "change_id"
+    change_id_counter_key: str = "change_id_counter"
+    change_id_times_key: str = "change_id_times"
     schema_cache_key: str = "schema"
     cache_ready_key: str = "cache_ready"
 
     # All lua-scripts used by this provider. Every entry is a Tuple (str, bool) with the
     # script and an ensure_cache-indicator. If the indicator is True, a short ensure_cache-script
-    # will be prepended to the script which raises a CacheReset, if the full data cache is empty.
-    # This requires the full_data_cache_key to be the first key given in `keys`!
+    # will be prepended to the script which raises a CacheReset, if the collections set is empty.
+    # This requires the collections_cache_key to be the first key given in `keys`!
     # All scripts are dedented and hashed for faster execution. Convention: The keys of this
     # member are the methods that needs these scripts.
+    # Scripts, that have to access the hash of a collection, that is not known in advance,
+    # get the prefix for the collection hashes (`full_data:`) as an argument.
     scripts = {
         "clear_cache": (
             "return redis.call('del', 'fake_key', unpack(redis.call('keys', ARGV[1])))",
             False,
         ),
-        "get_all_data": ("return redis.call('hgetall', KEYS[1])", True),
+        "get_all_data": (
+            # KEYS[1]: collections cache key
+            # ARGV[1]: prefix for the collection hashes
+            """
+            local all_data = {}
+            for _, collection in pairs(redis.call('smembers', KEYS[1])) do
+                local collection_data = redis.call('hgetall', ARGV[1]..collection)
+                for i = 1, #collection_data, 2 do
+                    table.insert(all_data, collection..':'..collection_data[i])
+                    table.insert(all_data, collection_data[i + 1])
+                end
+            end
+            return all_data
+            """,
+            True,
+        ),
         "get_all_data_with_max_change_id": (
+            # KEYS[1]: collections cache key
+            # KEYS[2]: change id cache key
+            # ARGV[1]: prefix for the collection hashes
             """
             local tmp = redis.call('zrevrangebyscore', KEYS[2], '+inf', '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
             local max_change_id
@@ -151,7 +266,14 @@ class RedisCacheProvider:
                 max_change_id = tmp[2]
             end
 
-            local all_data = redis.call('hgetall', KEYS[1])
+            local all_data = {}
+            for _, collection in pairs(redis.call('smembers', KEYS[1])) do
+                local collection_data = redis.call('hgetall', ARGV[1]..collection)
+                for i = 1, #collection_data, 2 do
+                    table.insert(all_data, collection..':'..collection_data[i])
+                    table.insert(all_data, collection_data[i + 1])
+                end
+            end
             table.insert(all_data, 'max_change_id')
             table.insert(all_data, max_change_id)
             return all_data
@@ -159,28 +281,29 @@ class RedisCacheProvider:
             True,
         ),
         "get_collection_data": (
-            """
-            local cursor = 0
-            local collection = {}
-            repeat
-                local result = redis.call('HSCAN', KEYS[1], cursor, 'MATCH', ARGV[1])
-                cursor = tonumber(result[1])
-                for _, v in pairs(result[2]) do
-                    table.insert(collection, v)
-                end
-            until cursor == 0
-            return collection
-            """,
+            # KEYS[1]: collections cache key
+            # KEYS[2]: hash of the collection
+            "return redis.call('hgetall', KEYS[2])",
+            True,
+        ),
+        "get_element_data": (
+            # KEYS[1]: collections cache key
+            # KEYS[2]: hash of the collection
+            # ARGV[1]: id of the element
+            "return redis.call('hget', KEYS[2], ARGV[1])",
             True,
         ),
-        "get_element_data": ("return redis.call('hget', KEYS[1], ARGV[1])", True),
         "add_changed_elements": (
-            # KEYS[1]: full data cache key
+            # KEYS[1]: collections cache key
             # KEYS[2]: change id cache key
-            # ARGV[1]: amount changed elements
-            # ARGV[2]: amount deleted elements
-            # ARGV[3..(ARGV[1]+2)]: changed_elements (element_id, element, element_id, element, ...)
-            # ARGV[(3+ARGV[1])..(ARGV[1]+ARGV[2]+2)]: deleted_elements (element_id, element_id, ...)
+            # KEYS[3]: change id counter key
+            # ARGV[1]: prefix for the collection hashes
+            # ARGV[2]: amount changed elements
+            # ARGV[3]: amount deleted elements
+            # ARGV[4..(ARGV[2]+3)]: changed_elements (element_id, element, element_id, element, ...)
+            # ARGV[(4+ARGV[2])..(ARGV[2]+ARGV[3]+3)]: deleted_elements (element_id, element_id, ...)
+            # ARGV[ARGV[2]+ARGV[3]+4]: change id, since which the following elements must be unchanged
+            # ARGV[(ARGV[2]+ARGV[3]+5)..]: unchanged element ids
             """
             -- Generate a new change_id
             local tmp = redis.call('zrevrangebyscore', KEYS[2], '+inf', '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
@@ -192,58 +315,74 @@ class RedisCacheProvider:
                 change_id = tmp[2] + 1
             end
 
-            local nc = tonumber(ARGV[1])
-            local nd = tonumber(ARGV[2])
+            local prefix = ARGV[1]
+            local nc = tonumber(ARGV[2])
+            local nd = tonumber(ARGV[3])
+
+            -- Check the unchanged elements before anything is written. If the
+            -- change ids of the elements were trimmed, they could have changed.
+            if (#ARGV > 4 + nc + nd) then
+                local since = tonumber(ARGV[4 + nc + nd])
+                local lowest_change_id = tonumber(redis.call('zscore', KEYS[2], '_config:lowest_change_id'))
+                if (lowest_change_id ~= nil and lowest_change_id > since) then
+                    return redis.error_reply("elements_changed")
+                end
+                for j = 5 + nc + nd, #ARGV do
+                    local element_change_id = redis.call('zscore', KEYS[2], ARGV[j])
+                    if (element_change_id and tonumber(element_change_id) > since) then
+                        return redis.error_reply("elements_changed")
+                    end
+                end
+            end
+            redis.call('set', KEYS[3], change_id)
 
             local i, max, batch_counter
             local change_id_data -- change_id, element_id, change_id, element_id, ...
+            local collection, id
+            local known_collections = {}
 
-            -- Add changed_elements to the cache and sorted set using batches of 1000
-            -- values in unpack() (see #5386)
-            local elements -- element_id, element, element_id, element, ...
+            -- Add changed_elements to the collection hashes and the sorted set. The
+            -- sorted set is written using batches of 1000 values in unpack() (see #5386)
             if (nc > 0) then
-                i = 3
-                max = 3 + nc
+                i = 4
+                max = 4 + nc
                 while (i < max) do
                     change_id_data = {}
-                    elements = {}
                     batch_counter = 1
                     while (i < max and batch_counter <= 1000) do
+                        collection, id = string.match(ARGV[i], "^(.+):(%d+)$")
+                        if (known_collections[collection] == nil) then
+                            redis.call('sadd', KEYS[1], collection)
+                            known_collections[collection] = true
+                        end
+                        redis.call('hset', prefix..collection, id, ARGV[i + 1])
                         change_id_data[batch_counter] = change_id
                         change_id_data[batch_counter + 1] = ARGV[i]
-                        elements[batch_counter] = ARGV[i]
-                        elements[batch_counter + 1] = ARGV[i + 1]
                         batch_counter = batch_counter + 2
                         i = i + 2
                     end
-                    if (#change_id_data > 0) then -- so is #elements > 0
-                        redis.call('hmset', KEYS[1], unpack(elements))
+                    if (#change_id_data > 0) then
                         redis.call('zadd', KEYS[2], unpack(change_id_data))
                     end
                 end
             end
 
             -- Delete deleted_element_ids and add them to sorted set
-            local element_ids -- element_id, element_id, ...
-            local element_ids_counter
             if (nd > 0) then
-                i = 3 + nc
-                max = 3 + nc + nd
+                i = 4 + nc
+                max = 4 + nc + nd
                 while (i < max) do
                     change_id_data = {}
-                    element_ids = {}
                     batch_counter = 1
-                    element_ids_counter = 1
                     while (i < max and batch_counter <= 1000) do
+                        collection, id = string.match(ARGV[i], "^(.+):(%d+)$")
+                        redis.call('hdel', prefix..collection, id)
                         change_id_data[batch_counter] = change_id
                         change_id_data[batch_counter + 1] = ARGV[i]
-                        element_ids[element_ids_counter] = ARGV[i]
                         batch_counter = batch_counter + 2
-                        element_ids_counter = element_ids_counter + 1
                         i = i + 1
                     end
-                    if (#change_id_data > 0) then -- so is #element_ids > 0
-                        redis.call('hdel', KEYS[1], unpack(element_ids))
+                    if (#change_id_data > 0) then
                         redis.call('zadd', KEYS[2], unpack(change_id_data))
                     end
                 end
@@ -252,7 +391,121 @@ class RedisCacheProvider:
             """,
             True,
         ),
+        "add_restriction_changes": (
+            # KEYS[1]: collections cache key
+            # KEYS[2]: change id cache key
+            # KEYS[3]: change id counter key
+            # ARGV: restriction ids
+            """
+            -- Generate a new change_id
+            local tmp = redis.call('zrevrangebyscore', KEYS[2], '+inf', '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
+            local change_id
+            if next(tmp) == nil then
+                -- The key does not exist
+                return redis.error_reply("cache_reset")
+            else
+                change_id = tmp[2] + 1
+            end
+            redis.call('set', KEYS[3], change_id)
+
+            local change_id_data = {}
+            for _, restriction_id in ipairs(ARGV) do
+                table.insert(change_id_data, change_id)
+                table.insert(change_id_data, restriction_id)
+            end
+            redis.call('zadd', KEYS[2], unpack(change_id_data))
+            return change_id
+            """,
+            True,
+        ),
         "get_data_since": (
+            # KEYS[1]: collections cache key
+            # KEYS[2]: change id cache key
+            # ARGV[1]: change id
+            # ARGV[2]: prefix for the collection hashes
+            """
+            -- get max change id
+            local tmp = redis.call('zrevrangebyscore', KEYS[2], '+inf', '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
+            local max_change_id
+            if next(tmp) == nil then
+                -- The key does not exist
+                return redis.error_reply("cache_reset")
+            else
+                max_change_id = tmp[2]
+            end
+
+            -- Group the ids of the changed elements by collection. Each element id
+            -- is only once in the sorted set. Restriction changes are collected.
+            -- Other entries of the change id cache, that are no element ids (like
+            -- _config:lowest_change_id) are skipped.
+            local collections = {}
+            local collection_ids = {}
+            local restrictions = {}
+            local collection, id
+            for _, element_id in ipairs(redis.call('zrangebyscore', KEYS[2], ARGV[1], max_change_id)) do
+                collection, id = string.match(element_id, "^(.+):(%d+)$")
+                if (string.sub(element_id, 1, 13) == '_restriction:') then
+                    table.insert(restrictions, element_id)
+                elseif (collection ~= nil) then
+                    if (collection_ids[collection] == nil) then
+                        collection_ids[collection] = {}
+                        table.insert(collections, collection)
+                    end
+                    table.insert(collection_ids[collection], id)
+                end
+            end
+
+            -- Load the elements of each collection with hmget using batches of
+            -- 1000 ids (see #5386). Elements, that are not in the cache, are deleted.
+            local changed = {}
+            local deleted = {}
+            local ids, elements, values, last
+            for _, collection in ipairs(collections) do
+                ids = collection_ids[collection]
+                elements = {}
+                for i = 1, #ids, 1000 do
+                    last = math.min(i + 999, #ids)
+                    values = redis.call('hmget', ARGV[2]..collection, unpack(ids, i, last))
+                    for j = 1, last - i + 1 do
+                        if values[j] then
+                            table.insert(elements, values[j])
+                        else
+                            table.insert(deleted, collection..':'..ids[i + j - 1])
+                        end
+                    end
+                end
+                if (#elements > 0) then
+                    table.insert(changed, collection)
+                    table.insert(changed, #elements)
+                    for _, element in ipairs(elements) do
+                        table.insert(changed, element)
+                    end
+                end
+            end
+
+            -- The result is the max change id, the amount of deleted element ids,
+            -- the deleted element ids, the amount of restriction changes, the
+            -- restriction changes and then for each collection with changed
+            -- elements the collection, the amount of elements and the elements.
+            local result = {max_change_id, #deleted}
+            for _, element_id in ipairs(deleted) do
+                table.insert(result, element_id)
+            end
+            table.insert(result, #restrictions)
+            for _, restriction_id in ipairs(restrictions) do
+                table.insert(result, restriction_id)
+            end
+            for _, value in ipairs(changed) do
+                table.insert(result, value)
+            end
+            return result
+            """,
+            True,
+        ),
+        "get_element_ids_since": (
+            # KEYS[1]: collections cache key
+            # KEYS[2]: change id cache key
+            # ARGV[1]: change id
             """
             -- get max change id
             local tmp = redis.call('zrevrangebyscore', KEYS[2], '+inf', '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
@@ -263,20 +516,91 @@ class RedisCacheProvider:
             else
                 max_change_id = tmp[2]
             end
+            local lowest_change_id = redis.call('zscore', KEYS[2], '_config:lowest_change_id')
+
+            -- The first two values are the max and the lowest change id, followed by
+            -- all element ids changed since the given change id.
+            local result = {max_change_id, lowest_change_id}
+            for _, element_id in pairs(redis.call('zrangebyscore', KEYS[2], ARGV[1], max_change_id)) do
+                table.insert(result, element_id)
+            end
+            return result
+            """,
+            True,
+        ),
+        "trim_change_ids": (
+            # KEYS[1]: collections cache key
+            # KEYS[2]: change id cache key
+            # KEYS[3]: change id times key
+            # ARGV[1]: amount of element ids to keep, 0 to keep all
+            # ARGV[2]: age in seconds of element ids to keep, 0 to keep all
+            # ARGV[3]: current time in seconds
+            """
+            local tmp = redis.call('zrevrangebyscore', KEYS[2], '+inf', '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
+            local max_change_id
+            if next(tmp) == nil then
+                -- The key does not exist
+                return redis.error_reply("cache_reset")
+            else
+                max_change_id = tonumber(tmp[2])
+            end
+            local lowest_change_id = tonumber(redis.call('zscore', KEYS[2], '_config:lowest_change_id'))
+            if lowest_change_id == nil then
+                -- The cache is not (completely) built
+                return redis.error_reply("cache_reset")
+            end
+
+            -- All change ids until cutoff (included) are removed.
+            local cutoff = lowest_change_id - 1
+            local max_count = tonumber(ARGV[1])
+            local max_age = tonumber(ARGV[2])
+            local now = tonumber(ARGV[3])
+
+            if (max_count > 0) then
+                -- Find the element entry before the newest max_count element
+                -- entries. Special entries like _config:lowest_change_id and
+                -- the restrictions (all start with _) are not counted.
+                local count = 0
+                local offset = 0
+                local found = false
+                while not found do
+                    local entries = redis.call('zrevrange', KEYS[2], offset, offset + 999, 'WITHSCORES')
+                    if next(entries) == nil then
+                        break
+                    end
+                    for i = 1, #entries, 2 do
+                        if string.sub(entries[i], 1, 1) ~= '_' then
+                            count = count + 1
+                            if count > max_count then
+                                cutoff = math.max(cutoff, tonumber(entries[i + 1]))
+                                found = true
+                                break
+                            end
+                        end
+                    end
+                    offset = offset + 1000
+                end
+            end
+
+            if (max_age > 0) then
+                -- Remember the max change id of this time. All change ids, that were
+                -- the max change id before now - max_age, are too old.
+                redis.call('zadd', KEYS[3], now, max_change_id)
+                tmp = redis.call('zrevrangebyscore', KEYS[3], now - max_age, '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
+                if next(tmp) ~= nil then
+                    cutoff = math.max(cutoff, tonumber(tmp[1]))
+                    redis.call('zremrangebyscore', KEYS[3], '-inf', '(' .. tmp[2])
+                end
+            end
 
-            -- Get change ids of changed elements
-            local element_ids = redis.call('zrangebyscore', KEYS[2], ARGV[1], max_change_id)
-
-            -- Save elements in array. First is the max_change_id with the key "max_change_id"
-            -- Than rotate element_id and element_json. This is ocnverted into a dict in python code.
-            local elements = {}
-            table.insert(elements, 'max_change_id')
-            table.insert(elements, max_change_id)
-            for _, element_id in pairs(element_ids) do
-              table.insert(elements, element_id)
-              table.insert(elements, redis.call('hget', KEYS[1], element_id))
+            -- The max change id is always kept, so new change ids follow it.
+            cutoff = math.min(cutoff, max_change_id - 1)
+            if (cutoff >= lowest_change_id) then
+                redis.call('zremrangebyscore', KEYS[2], '-inf', cutoff)
+                lowest_change_id = cutoff + 1
+                redis.call('zadd', KEYS[2], lowest_change_id, '_config:lowest_change_id')
             end
-            return elements
+            return lowest_change_id
             """,
             True,
         ),
@@ -285,9 +609,10 @@ class RedisCacheProvider:
     def __init__(self, ensure_cache: Callable[[], Coroutine[Any, Any, None]]) -> None:
         self._ensure_cache = ensure_cache
 
-        # hash all scripts and remove indentation.
-        for key in self.scripts.keys():
-            script, add_ensure_cache = self.scripts[key]
+        # hash all scripts and remove indentation. The scripts of the class are
+        # not changed, so every instance prepends the ensure_cache-script once.
+        scripts = {}
+        for key, (script, add_ensure_cache) in type(self).scripts.items():
             script = dedent(script)
             if add_ensure_cache:
                 script = (
@@ -302,7 +627,13 @@ class RedisCacheProvider:
                     )
                     + script
                 )
-            self.scripts[key] = (script, add_ensure_cache)
+            scripts[key] = (script, add_ensure_cache)
+        self.scripts = scripts
+        # The highest change id, that reads have to include (written by this
+        # worker or seen in the main redis), and the highest change id the read
+        # only redis is known to have.
+        self.written_change_id = 0
+        self.replica_change_id = 0
         self._script_hashes = {
             key: hashlib.sha1(script.encode()).hexdigest()
             for key, (script, _) in self.scripts.items()
@@ -311,6 +642,12 @@ class RedisCacheProvider:
     async def ensure_cache(self) -> None:
         await self._ensure_cache()
 
+    def get_collection_cache_key(self, collection: str) -> str:
+        """
+        Returns the key of the redis hash for the given collection.
+        """
+        return f"{self.full_data_cache_key}:{collection}"
+
     async def clear_cache(self) -> None:
         """
         Deleted all cache entries created with this element cache.
@@ -321,34 +658,98 @@ class RedisCacheProvider:
         self, data: Dict[str, str], default_change_id: int
     ) -> None:
         """
-        Deletes the full_data_cache and write new data in it. Clears the change id key.
+        Deletes all collection hashes and write new data in it. Clears the change id key.
         """
         async with get_connection() as redis:
+            collections = await redis.smembers(self.collections_cache_key)
             tr = redis.multi_exec()
             tr.delete(self.cache_ready_key)
             tr.delete(self.change_id_cache_key)
+            tr.delete(self.change_id_times_key)
+            tr.set(self.change_id_counter_key, default_change_id)
+            # Remove the single full_data hash of older versions.
             tr.delete(self.full_data_cache_key)
-            tr.hmset_dict(self.full_data_cache_key, data)
+            tr.delete(self.collections_cache_key)
+            for collection in collections:
+                tr.delete(self.get_collection_cache_key(collection.decode()))
+            self._write_full_data(tr, data)
             tr.zadd(
                 self.change_id_cache_key, default_change_id, "_config:lowest_change_id"
             )
             await tr.execute()
+        self.written_change_id = default_change_id
+        self.replica_change_id = 0
 
     async def add_to_full_data(self, data: Dict[str, str]) -> None:
         async with get_connection() as redis:
-            await redis.hmset_dict(self.full_data_cache_key, data)
+            tr = redis.multi_exec()
+            self._write_full_data(tr, data)
+            await tr.execute()
+
+    def _write_full_data(self, tr: Any, data: Dict[str, str]) -> None:
+        """
+        Adds the commands to write the data into the collection hashes and to
+        register the collections to the given transaction.
+        """
+        collection_data: Dict[str, Dict[int, str]] = defaultdict(dict)
+        for element_id, element in data.items():
+            collection, id = split_element_id(element_id)
+            collection_data[collection][id] = element
+
+        for collection, elements in collection_data.items():
+            tr.hmset_dict(self.get_collection_cache_key(collection), elements)
+        if collection_data:
+            tr.sadd(self.collections_cache_key, *collection_data.keys())
 
     async def data_exists(self) -> bool:
         """
         Returns True, when there is data in the cache.
+
+        A cache written with an older storage layout has no collections set and
+        counts as not existing.
+        """
+        async with get_connection(read_only=False) as redis:
+            return (await redis.get(self.cache_ready_key)) is not None and bool(
+                await redis.exists(self.collections_cache_key)
+            )
+
+    def require_change_id(self, change_id: int) -> None:
+        """
+        Element data read afterwards has to contain all changes until the
+        change id, e.g. because it was seen in the main redis.
+        """
+        self.written_change_id = max(self.written_change_id, change_id)
+
+    async def read_from_replica(self) -> bool:
+        """
+        Returns True, if reads of element data can be done on the read only
+        redis.
+
+        This is the case, if the read only redis has all changes written by
+        this worker or required with require_change_id. Else the replica lags
+        behind and the reads are done on the main redis, so a request never
+        misses its own changes or caches an old element. The change id
+        counter of the replica is only requested, if the required change id
+        was raised since the last time the replica was up to date.
+
+        The change ids, the schema version and whether the cache exists are
+        always read from the main redis.
         """
+        if not use_read_only_redis:
+            return False
+        if self.replica_change_id >= self.written_change_id:
+            return True
         async with get_connection(read_only=True) as redis:
-            return (await redis.get(self.cache_ready_key)) is not None
-            # return await redis.exists(self.full_data_cache_key) and bool(
-            #    await redis.zrangebyscore(
-            #        self.change_id_cache_key, withscores=True, count=1, offset=0
-            #    )
-            # )
+            counter = await redis.get(self.change_id_counter_key)
+        if counter is not None:
+            self.replica_change_id = max(self.replica_change_id, int(counter))
+        if self.replica_change_id >= self.written_change_id:
+            return True
+        logger.debug(
+            "Read from the main redis, the read only redis lags "
+            f"{self.written_change_id - self.replica_change_id} change ids behind."
+        )
+        return False
 
     async def set_cache_ready(self) -> None:
         async with get_connection(read_only=False) as redis:
@@ -360,7 +761,12 @@ class RedisCacheProvider:
         Returns all data from the full_data_cache in a mapping from element_id to the element.
         """
         return await aioredis.util.wait_make_dict(
-            self.eval("get_all_data", keys=[self.full_data_cache_key], read_only=True)
+            self.eval(
+                "get_all_data",
+                keys=[self.collections_cache_key],
+                args=[f"{self.full_data_cache_key}:"],
+                read_only=True,
+            )
         )
 
     @ensure_cache_wrapper()
@@ -372,7 +778,8 @@ class RedisCacheProvider:
         all_data = await aioredis.util.wait_make_dict(
             self.eval(
                 "get_all_data_with_max_change_id",
-                keys=[self.full_data_cache_key, self.change_id_cache_key],
+                keys=[self.collections_cache_key, self.change_id_cache_key],
+                args=[f"{self.full_data_cache_key}:"],
                 read_only=True,
             )
         )
@@ -387,96 +794,301 @@ class RedisCacheProvider:
         """
         response = await self.eval(
             "get_collection_data",
-            [self.full_data_cache_key],
-            [f"{collection}:*"],
+            [self.collections_cache_key, self.get_collection_cache_key(collection)],
             read_only=True,
         )
 
         collection_data = {}
         for i in range(0, len(response), 2):
-            _, id = split_element_id(response[i])
-            collection_data[id] = response[i + 1]
+            collection_data[int(response[i])] = response[i + 1]
 
         return collection_data
 
     @ensure_cache_wrapper()
-    async def get_element_data(self, element_id: str) -> Optional[bytes]:
+    async def get_element_data(
+        self, element_id: str, read_only: bool = True
+    ) -> Optional[bytes]:
         """
         Returns one element from the cache. Returns None, when the element does not exist.
+
+        With read_only=False, the element is always read from the main redis.
         """
+        collection, id = split_element_id(element_id)
         return await self.eval(
-            "get_element_data", [self.full_data_cache_key], [element_id], read_only=True
+            "get_element_data",
+            [self.collections_cache_key, self.get_collection_cache_key(collection)],
+            [id],
+            read_only=read_only,
         )
 
     @ensure_cache_wrapper()
     async def add_changed_elements(
-        self, changed_elements: List[str], deleted_element_ids: List[str]
+        self,
+        changed_elements: List[str],
+        deleted_element_ids: List[str],
+        unchanged_element_ids: Optional[List[str]] = None,
+        unchanged_since: int = 0,
     ) -> int:
         """
-        Modified the full_data_cache to insert the changed_elements and removes the
+        Modified the collection hashes to insert the changed_elements and removes the
         deleted_element_ids (in this order). Generates a new change_id and inserts all
         element_ids (changed and deleted) with the change_id into the change_id_cache.
         The newly generated change_id is returned.
+
+        If one of the unchanged_element_ids was changed after the change id
+        unchanged_since, nothing is written and ElementsChanged is raised.
+
+        If REDIS_PIPELINED_WRITES is set, the elements are written with a
+        transaction instead of a lua script.
+        """
+        if REDIS_PIPELINED_WRITES:
+            change_id = await self.add_changed_elements_pipelined(
+                changed_elements,
+                deleted_element_ids,
+                unchanged_element_ids,
+                unchanged_since,
+            )
+        else:
+            change_id = await self.add_changed_elements_script(
+                changed_elements,
+                deleted_element_ids,
+                unchanged_element_ids,
+                unchanged_since,
+            )
+        self.written_change_id = max(self.written_change_id, change_id)
+        return change_id
+
+    async def add_changed_elements_script(
+        self,
+        changed_elements: List[str],
+        deleted_element_ids: List[str],
+        unchanged_element_ids: Optional[List[str]] = None,
+        unchanged_since: int = 0,
+    ) -> int:
         """
+        Writes the changed elements with the lua script add_changed_elements.
+        """
+        unchanged_args: List[Any] = []
+        if unchanged_element_ids:
+            unchanged_args = [unchanged_since, *unchanged_element_ids]
         return int(
             await self.eval(
                 "add_changed_elements",
-                keys=[self.full_data_cache_key, self.change_id_cache_key],
+                keys=[
+                    self.collections_cache_key,
+                    self.change_id_cache_key,
+                    self.change_id_counter_key,
+                ],
                 args=[
+                    f"{self.full_data_cache_key}:",
                     len(changed_elements),
                     len(deleted_element_ids),
                     *(changed_elements + deleted_element_ids),
+                    *unchanged_args,
                 ],
             )
         )
 
+    async def add_changed_elements_pipelined(
+        self,
+        changed_elements: List[str],
+        deleted_element_ids: List[str],
+        unchanged_element_ids: Optional[List[str]] = None,
+        unchanged_since: int = 0,
+    ) -> int:
+        """
+        Writes the changed elements with one MULTI/EXEC transaction of plain
+        commands. Each command gets at most REDIS_WRITE_CHUNK_SIZE elements.
+
+        The change id counter and the collections set are watched. If another
+        worker writes a change in the meantime, the transaction fails and is
+        retried with the next change id. So the change ids are written in
+        order, like with the lua script. The unchanged elements are checked
+        again on each try.
+        """
+        changed_data: Dict[str, Dict[int, str]] = defaultdict(dict)
+        for i in range(0, len(changed_elements), 2):
+            collection, id = split_element_id(changed_elements[i])
+            changed_data[collection][id] = changed_elements[i + 1]
+        deleted_ids: Dict[str, List[int]] = defaultdict(list)
+        for element_id in deleted_element_ids:
+            collection, id = split_element_id(element_id)
+            deleted_ids[collection].append(id)
+        element_ids = changed_elements[::2] + deleted_element_ids
+
+        async with get_connection() as redis:
+            while True:
+                await redis.watch(
+                    self.change_id_counter_key, self.collections_cache_key
+                )
+                change_id = await self._get_change_id_counter(redis) + 1
+                if unchanged_element_ids and await self._elements_changed(
+                    redis, unchanged_element_ids, unchanged_since
+                ):
+                    await redis.unwatch()
+                    raise ElementsChanged()
+
+                tr = redis.multi_exec()
+                tr.set(self.change_id_counter_key, change_id)
+                for collection, elements in changed_data.items():
+                    key = self.get_collection_cache_key(collection)
+                    for items in chunked(elements.items(), REDIS_WRITE_CHUNK_SIZE):
+                        tr.hmset_dict(key, dict(items))
+                if changed_data:
+                    tr.sadd(self.collections_cache_key, *changed_data.keys())
+                for collection, ids in deleted_ids.items():
+                    key = self.get_collection_cache_key(collection)
+                    for id_chunk in chunked(ids, REDIS_WRITE_CHUNK_SIZE):
+                        tr.hdel(key, *id_chunk)
+                for element_id_chunk in chunked(element_ids, REDIS_WRITE_CHUNK_SIZE):
+                    pairs: List[Any] = []
+                    for element_id in element_id_chunk:
+                        pairs.extend((change_id, element_id))
+                    tr.zadd(self.change_id_cache_key, *pairs)
+                try:
+                    await tr.execute()
+                except aioredis.errors.WatchVariableError:
+                    continue
+                return change_id
+
+    async def _elements_changed(
+        self, redis: Any, element_ids: List[str], since: int
+    ) -> bool:
+        """
+        Returns True, if one of the elements was changed after the change id
+        since or if their change ids were trimmed.
+        """
+        lowest_change_id = await redis.zscore(
+            self.change_id_cache_key, "_config:lowest_change_id"
+        )
+        if lowest_change_id is not None and lowest_change_id > since:
+            return True
+        for element_id in element_ids:
+            change_id = await redis.zscore(self.change_id_cache_key, element_id)
+            if change_id is not None and change_id > since:
+                return True
+        return False
+
+    async def _get_change_id_counter(self, redis: Any) -> int:
+        """
+        Returns the current value of the change id counter. Caches without the
+        counter use the highest change id.
+
+        Raises CacheReset, if the cache is empty.
+        """
+        if not await redis.exists(self.collections_cache_key):
+            raise CacheReset()
+        counter = await redis.get(self.change_id_counter_key)
+        if counter is not None:
+            return int(counter)
+        value = await redis.zrevrangebyscore(
+            self.change_id_cache_key, withscores=True, count=1, offset=0
+        )
+        if not value:
+            raise CacheReset()
+        return int(value[0][1])
+
     @ensure_cache_wrapper()
     async def get_data_since(
         self, change_id: int
-    ) -> Tuple[int, Dict[str, List[bytes]], List[str]]:
+    ) -> Tuple[int, Dict[str, List[bytes]], List[str], Dict[str, Set[int]]]:
         """
         Returns all elements since a change_id (included) and until the max_change_id (included).
 
-        The returend value is a two element tuple. The first value is a dict the elements where
-        the key is the collection and the value a list of (json-) encoded elements. The
-        second element is a list of element_ids, that have been deleted since the change_id.
+        The returend value is a tuple. The first value is the max change id.
+        The second value is a dict the elements where the key is the collection
+        and the value a list of (json-) encoded elements. The third element is a
+        list of element_ids, that have been deleted since the change_id. The
+        last value maps the collections, whose restriction has changed since the
+        change_id, to the ids of the affected groups.
         """
-        changed_elements: Dict[str, List[bytes]] = defaultdict(list)
-        deleted_elements: List[str] = []
+        # The lua script loads each changed element once with one hmget per
+        # collection and splits the changed and the deleted elements and the
+        # restriction changes.
+        result = await self.eval(
+            "get_data_since",
+            keys=[self.collections_cache_key, self.change_id_cache_key],
+            args=[change_id, f"{self.full_data_cache_key}:"],
+            read_only=True,
+        )
 
-        # lua script that returns gets all element_ids from change_id_cache_key
-        # and then uses each element_id on full_data or restricted_data.
-        # It returns a list where the odd values are the change_id and the
-        # even values the element as json. The function wait_make_dict creates
-        # a python dict from the returned list.
-        elements: Dict[bytes, Optional[bytes]] = await aioredis.util.wait_make_dict(
-            self.eval(
-                "get_data_since",
-                keys=[self.full_data_cache_key, self.change_id_cache_key],
-                args=[change_id],
-                read_only=True,
+        max_change_id = int(result[0])
+        deleted_count = int(result[1])
+        deleted_elements = [
+            element_id.decode() for element_id in islice(result, 2, 2 + deleted_count)
+        ]
+        index = 2 + deleted_count
+        restriction_count = int(result[index])
+        restrictions: Dict[str, Set[int]] = defaultdict(set)
+        for restriction_id in islice(result, index + 1, index + 1 + restriction_count):
+            group_id, collection = split_restriction_id(restriction_id.decode())
+            restrictions[collection].add(group_id)
+        index += 1 + restriction_count
+        changed_elements: Dict[str, List[bytes]] = {}
+        while index < len(result):
+            count = int(result[index + 1])
+            changed_elements[result[index].decode()] = list(
+                islice(result, index + 2, index + 2 + count)
+            )
+            index += 2 + count
+        return max_change_id, changed_elements, deleted_elements, dict(restrictions)
+
+    @ensure_cache_wrapper()
+    async def add_restriction_changes(
+        self, group_ids: List[int], collections: List[str]
+    ) -> int:
+        """
+        Generates a new change id and inserts an entry for each group and
+        collection with the change id into the change id cache. The elements
+        are not changed.
+
+        Users of the groups have to get all elements of the collections again
+        with their new restriction.
+        """
+        change_id = int(
+            await self.eval(
+                "add_restriction_changes",
+                keys=[
+                    self.collections_cache_key,
+                    self.change_id_cache_key,
+                    self.change_id_counter_key,
+                ],
+                args=[
+                    get_restriction_id(group_id, collection)
+                    for group_id in group_ids
+                    for collection in collections
+                ],
             )
         )
+        self.written_change_id = max(self.written_change_id, change_id)
+        return change_id
 
-        max_change_id = int(elements[b"max_change_id"].decode())  # type: ignore
-        for element_id, element_json in elements.items():
-            if element_id.startswith(b"_config") or element_id == b"max_change_id":
-                # Ignore config values from the change_id cache key
-                continue
-            if element_json is None:
-                # The element is not in the cache. It has to be deleted.
-                deleted_elements.append(element_id.decode())
-            else:
-                collection, id = split_element_id(element_id)
-                changed_elements[collection].append(element_json)
-        return max_change_id, changed_elements, deleted_elements
+    @ensure_cache_wrapper()
+    async def get_element_ids_since(self, change_id: int) -> Tuple[int, int, List[str]]:
+        """
+        Returns the max change id, the lowest change id and all element ids, that
+        have been changed or deleted since the change_id (included).
+
+        In contrast to get_data_since, no element data is loaded.
+        """
+        result = await self.eval(
+            "get_element_ids_since",
+            keys=[self.collections_cache_key, self.change_id_cache_key],
+            args=[change_id],
+        )
+        element_ids = [
+            element_id.decode()
+            for element_id in result[2:]
+            if not element_id.startswith(b"_")
+        ]
+        return int(result[0]), int(result[1]), element_ids
 
     @ensure_cache_wrapper()
     async def get_current_change_id(self) -> int:
         """
         Get the highest change_id from redis.
         """
-        async with get_connection(read_only=True) as redis:
+        async with get_connection(read_only=False) as redis:
             value = await redis.zrevrangebyscore(
                 self.change_id_cache_key, withscores=True, count=1, offset=0
             )
@@ -490,7 +1102,7 @@ class RedisCacheProvider:
         """
         Get the lowest change_id from redis.
         """
-        async with get_connection(read_only=True) as redis:
+        async with get_connection(read_only=False) as redis:
             value = await redis.zscore(
                 self.change_id_cache_key, "_config:lowest_change_id"
             )
@@ -498,9 +1110,35 @@ class RedisCacheProvider:
             raise CacheReset()
         return value
 
+    @ensure_cache_wrapper()
+    async def trim_change_ids(self, max_count: int, max_age: int) -> int:
+        """
+        Removes old element ids from the change id cache and raises the lowest
+        change id accordingly. Clients with an older change id have to load all
+        data.
+
+        The newest max_count element ids and all element ids, that were changed
+        during the last max_age seconds, are kept. Use 0 to not restrict by
+        count or age. The age is measured with the times of earlier calls of
+        this method. The highest change id is never removed.
+
+        Returns the new lowest change id.
+        """
+        return int(
+            await self.eval(
+                "trim_change_ids",
+                keys=[
+                    self.collections_cache_key,
+                    self.change_id_cache_key,
+                    self.change_id_times_key,
+                ],
+                args=[max_count, max_age, int(time())],
+            )
+        )
+
     async def get_schema_version(self) -> Optional[SchemaVersion]:
-        """ Retrieves the schema version of the cache or None, if not existent """
-        async with get_connection(read_only=True) as redis:
+        """Retrieves the schema version of the cache or None, if not existent"""
+        async with get_connection(read_only=False) as redis:
             try:
                 schema_version = await redis.hgetall(self.schema_cache_key)
             except aioredis.errors.ReplyError:
@@ -516,7 +1154,7 @@ class RedisCacheProvider:
         }
 
     async def set_schema_version(self, schema_version: SchemaVersion) -> None:
-        """ Sets the schema version for this cache. """
+        """Sets the schema version for this cache."""
         async with get_connection() as redis:
             await redis.hmset_dict(self.schema_cache_key, schema_version)
 
@@ -532,17 +1170,18 @@ class RedisCacheProvider:
         usage of redis script cache. First the hash is send to the server and if
         the script is not present there (NOSCRIPT error) the actual script will be
         send.
-        If the script uses the ensure_cache-prefix, the first key must be the full_data
+        If the script uses the ensure_cache-prefix, the first key must be the collections
         cache key. This is checked here.
         Also this method incudes the custom "CacheReset" error, which will be raised in
         python, if the lua-script returns a "cache_reset" string as an error response.
         """
         hash = self._script_hashes[script_name]
-        if self.scripts[script_name][1] and not keys[0] == self.full_data_cache_key:
+        if self.scripts[script_name][1] and not keys[0] == self.collections_cache_key:
             raise ImproperlyConfigured(
-                "A script with a ensure_cache prefix must have the full_data cache key as its first key"
+                "A script with a ensure_cache prefix must have the collections cache key as its first key"
             )
 
+        read_only = read_only and await self.read_from_replica()
         async with get_connection(read_only=read_only) as redis:
             try:
                 result = await redis.evalsha(hash, keys, args)
@@ -551,6 +1190,8 @@ class RedisCacheProvider:
                     result = await self._eval(redis, script_name, keys=keys, args=args)
                 elif str(e) == "cache_reset":
                     raise CacheReset()
+                elif str(e) == "elements_changed":
+                    raise ElementsChanged()
                 else:
                     raise e
             return result
@@ -558,12 +1199,14 @@ class RedisCacheProvider:
     async def _eval(
         self, redis: Any, script_name: str, keys: List[str] = [], args: List[Any] = []
     ) -> Any:
-        """ Do a real eval of the script (no hash used here). Catches "cache_reset". """
+        """Do a real eval of the script (no hash used here). Catches "cache_reset"."""
         try:
             return await redis.eval(self.scripts[script_name][0], keys, args)
         except aioredis.errors.ReplyError as e:
             if str(e) == "cache_reset":
                 raise CacheReset()
+            elif str(e) == "elements_changed":
+                raise ElementsChanged()
             else:
                 raise e
 
@@ -588,6 +1231,7 @@ class MemoryCacheProvider:
         self.ready = False
         self.full_data: Dict[str, str] = {}
         self.change_id_data: Dict[int, Set[str]] = {}
+        self.change_id_times: Dict[int, float] = {}
         self.locks: Dict[str, str] = {}
         self.default_change_id: int = -1
 
@@ -598,10 +1242,14 @@ class MemoryCacheProvider:
         self.set_data_dicts()
         self.ready = False
 
+    def require_change_id(self, change_id: int) -> None:
+        pass
+
     async def reset_full_cache(
         self, data: Dict[str, str], default_change_id: int
     ) -> None:
         self.change_id_data = {}
+        self.change_id_times = {}
         self.full_data = data
         self.default_change_id = default_change_id
 
@@ -632,13 +1280,28 @@ class MemoryCacheProvider:
                 out[id] = value.encode()
         return out
 
-    async def get_element_data(self, element_id: str) -> Optional[bytes]:
+    async def get_element_data(
+        self, element_id: str, read_only: bool = True
+    ) -> Optional[bytes]:
         value = self.full_data.get(element_id, None)
         return value.encode() if value is not None else None
 
     async def add_changed_elements(
-        self, changed_elements: List[str], deleted_element_ids: List[str]
+        self,
+        changed_elements: List[str],
+        deleted_element_ids: List[str],
+        unchanged_element_ids: Optional[List[str]] = None,
+        unchanged_since: int = 0,
     ) -> int:
+        if unchanged_element_ids:
+            if self.default_change_id > unchanged_since:
+                raise ElementsChanged()
+            for data_change_id, element_ids in self.change_id_data.items():
+                if data_change_id > unchanged_since and not element_ids.isdisjoint(
+                    unchanged_element_ids
+                ):
+                    raise ElementsChanged()
+
         change_id = await self.get_current_change_id() + 1
 
         for i in range(0, len(changed_elements), 2):
@@ -664,9 +1327,10 @@ class MemoryCacheProvider:
 
     async def get_data_since(
         self, change_id: int
-    ) -> Tuple[int, Dict[str, List[bytes]], List[str]]:
+    ) -> Tuple[int, Dict[str, List[bytes]], List[str], Dict[str, Set[int]]]:
         changed_elements: Dict[str, List[bytes]] = defaultdict(list)
         deleted_elements: List[str] = []
+        restrictions: Dict[str, Set[int]] = defaultdict(set)
 
         all_element_ids: Set[str] = set()
         for data_change_id, element_ids in self.change_id_data.items():
@@ -674,6 +1338,10 @@ class MemoryCacheProvider:
                 all_element_ids.update(element_ids)
 
         for element_id in all_element_ids:
+            if element_id.startswith(RESTRICTION_PREFIX):
+                group_id, collection = split_restriction_id(element_id)
+                restrictions[collection].add(group_id)
+                continue
             element_json = self.full_data.get(element_id, None)
             if element_json is None:
                 deleted_elements.append(element_id)
@@ -681,7 +1349,35 @@ class MemoryCacheProvider:
                 collection, id = split_element_id(element_id)
                 changed_elements[collection].append(element_json.encode())
         max_change_id = await self.get_current_change_id()
-        return (max_change_id, changed_elements, deleted_elements)
+        return (max_change_id, changed_elements, deleted_elements, dict(restrictions))
+
+    async def add_restriction_changes(
+        self, group_ids: List[int], collections: List[str]
+    ) -> int:
+        change_id = await self.get_current_change_id() + 1
+        self.change_id_data[change_id] = {
+            get_restriction_id(group_id, collection)
+            for group_id in group_ids
+            for collection in collections
+        }
+        return change_id
+
+    async def get_element_ids_since(self, change_id: int) -> Tuple[int, int, List[str]]:
+        element_ids: Set[str] = set()
+        for data_change_id, data_element_ids in self.change_id_data.items():
+            if data_change_id >= change_id:
+                element_ids.update(data_element_ids)
+        max_change_id = await self.get_current_change_id()
+        lowest_change_id = await self.get_lowest_change_id()
+        return (
+            max_change_id,
+            lowest_change_id,
+            [
+                element_id
+                for element_id in element_ids
+                if not element_id.startswith("_")
+            ],
+        )
 
     async def get_current_change_id(self) -> int:
         if self.change_id_data:
@@ -692,6 +1388,50 @@ class MemoryCacheProvider:
     async def get_lowest_change_id(self) -> int:
         return self.default_change_id
 
+    async def trim_change_ids(self, max_count: int, max_age: int) -> int:
+        if not self.change_id_data:
+            return self.default_change_id
+        max_change_id = max(self.change_id_data.keys())
+        cutoff = self.default_change_id - 1
+
+        if max_count > 0:
+            count = 0
+            for change_id in sorted(self.change_id_data.keys(), reverse=True):
+                # Restrictions are not counted.
+                count += sum(
+                    not element_id.startswith("_")
+                    for element_id in self.change_id_data[change_id]
+                )
+                if count > max_count:
+                    cutoff = max(cutoff, change_id)
+                    break
+
+        if max_age > 0:
+            now = time()
+            self.change_id_times[max_change_id] = now
+            too_old = [
+                change_id
+                for change_id, change_id_time in self.change_id_times.items()
+                if change_id_time <= now - max_age
+            ]
+            if too_old:
+                cutoff = max(cutoff, max(too_old))
+                self.change_id_times = {
+                    change_id: change_id_time
+                    for change_id, change_id_time in self.change_id_times.items()
+                    if change_id >= max(too_old)
+                }
+
+        cutoff = min(cutoff, max_change_id - 1)
+        if cutoff >= self.default_change_id:
+            self.change_id_data = {
+                change_id: element_ids
+                for change_id, element_ids in self.change_id_data.items()
+                if change_id > cutoff
+            }
+            self.default_change_id = cutoff + 1
+        return self.default_change_id
+
     async def get_schema_version(self) -> Optional[SchemaVersion]:
         return None
 
@@ -718,12 +1458,37 @@ class Cachable(Protocol):
         Returns all elements of the cachable.
         """
 
+    def iter_elements(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields all elements of the cachable.
+        """
+
     async def restrict_elements(
-        self, user_id: int, elements: List[Dict[str, Any]]
+        self,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Optional["PermissionContext"] = None,
     ) -> List[Dict[str, Any]]:
         """
         Converts full_data to restricted_data.
 
         elements can be an empty list, a list with some elements of the cachable or with all
         elements of the cachable.
+
+        permission_context is the permission context of the user, that should be used
+        for all permission checks.
+        """
+
+    async def is_unrestricted(
+        self, user_id: int, permission_context: Optional["PermissionContext"] = None
+    ) -> bool:
+        """
+        Returns True, if restrict_elements returns all elements unchanged for the
+        user.
+        """
+
+    def is_group_restricted(self) -> bool:
+        """
+        Returns True, if the restricted data only depends on the groups of the user
+        and not on the user itself.
         """
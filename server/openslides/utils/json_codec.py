@@ -0,0 +1,127 @@
+import json
+from typing import Any, Callable, Dict, Union
+
+from django.conf import settings
+
+from . import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec:
+    """
+    Encodes and decodes JSON with the standard library.
+
+    Subclasses use faster third party libraries. All codecs produce compact JSON
+    without whitespace.
+    """
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self.dumps(obj).encode()
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    Codec using orjson. orjson produces bytes, so dumps_bytes is the fastest
+    way to encode.
+    """
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self.orjson = orjson
+        self.options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj: Any) -> str:
+        return self.orjson.dumps(obj, option=self.options).decode()
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self.orjson.dumps(obj, option=self.options)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self.orjson.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    """
+    Codec using ujson.
+    """
+
+    name = "ujson"
+
+    def __init__(self) -> None:
+        import ujson
+
+        self.ujson = ujson
+
+    def dumps(self, obj: Any) -> str:
+        return self.ujson.dumps(obj, escape_forward_slashes=False)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self.ujson.loads(data)
+
+
+codec_classes: Dict[str, Callable[[], JsonCodec]] = {
+    "orjson": OrjsonCodec,
+    "ujson": UjsonCodec,
+    "json": JsonCodec,
+}
+
+
+def get_codec(name: str = "auto") -> JsonCodec:
+    """
+    Returns the codec with the given name. If the name is "auto", the fastest
+    installed codec is used.
+
+    Raises ImportError, if the library of the codec is not installed and
+    ValueError, if the name is unknown.
+    """
+    if name == "auto":
+        for codec_class in codec_classes.values():
+            try:
+                return codec_class()
+            except ImportError:
+                continue
+    try:
+        codec_class = codec_classes[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown JSON codec {name}. Use one of: auto, {', '.join(codec_classes)}"
+        )
+    return codec_class()
+
+
+codec = get_codec(getattr(settings, "JSON_CODEC", "auto"))
+logger.info(f"JSON codec {codec.name}")
+
+
+def dumps(obj: Any) -> str:
+    """
+    Encodes the object to a JSON string with the configured codec.
+    """
+    return codec.dumps(obj)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    Encodes the object to JSON bytes with the configured codec.
+    """
+    return codec.dumps_bytes(obj)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Decodes a JSON string or bytes with the configured codec.
+    """
+    return codec.loads(data)
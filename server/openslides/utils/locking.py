@@ -1,37 +1,79 @@
-from typing import Dict
+import asyncio
+from time import monotonic
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
 
 from typing_extensions import Protocol
 
+from . import logging
 from .redis import use_redis
 
 
 if use_redis:
     from .redis import get_connection
 
+logger = logging.getLogger(__name__)
+
+# The default time in seconds after which a lock expires, if it is not renewed.
+LOCK_TTL = 60.0
+
 
 class LockProtocol(Protocol):
-    async def set(self, lock_name: str) -> bool:
+    async def set(
+        self, lock_name: str, token: str = "1", ttl: Optional[float] = None
+    ) -> bool:
         ...
 
     async def get(self, lock_name: str) -> bool:
         ...
 
-    async def delete(self, lock_name: str) -> None:
+    async def extend(self, lock_name: str, token: str, ttl: float) -> bool:
+        ...
+
+    async def delete(self, lock_name: str, token: Optional[str] = None) -> None:
         ...
 
 
 class RedisLockProvider:
     lock_prefix = "lock_"
 
-    async def set(self, lock_name: str) -> bool:
+    # KEYS[1]: lock key
+    # ARGV[1]: token
+    # ARGV[2]: ttl in milliseconds
+    extend_script = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('pexpire', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+
+    # KEYS[1]: lock key
+    # ARGV[1]: token
+    delete_script = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    async def set(
+        self, lock_name: str, token: str = "1", ttl: Optional[float] = None
+    ) -> bool:
         """
-        Tries to sets a lock.
+        Tries to sets a lock with the token as value. If ttl is given, the lock
+        expires after ttl seconds.
 
         Returns True when the lock could be set and False, if it was already set.
         """
-        # TODO: Improve lock. See: https://redis.io/topics/distlock
         async with get_connection() as redis:
-            return await redis.setnx(f"{self.lock_prefix}{lock_name}", 1)
+            return bool(
+                await redis.set(
+                    f"{self.lock_prefix}{lock_name}",
+                    token,
+                    pexpire=int(ttl * 1000) if ttl else 0,
+                    exist=redis.SET_IF_NOT_EXIST,
+                )
+            )
 
     async def get(self, lock_name: str) -> bool:
         """
@@ -40,34 +82,75 @@ class RedisLockProvider:
         # Execute the lookup on the main redis server (no readonly) to avoid
         # eventual consistency between the master and replicas
         async with get_connection() as redis:
-            return await redis.get(f"{self.lock_prefix}{lock_name}")
+            return bool(await redis.exists(f"{self.lock_prefix}{lock_name}"))
 
-    async def delete(self, lock_name: str) -> None:
+    async def extend(self, lock_name: str, token: str, ttl: float) -> bool:
+        """
+        Sets the expiry of the lock to ttl seconds from now.
+
+        Returns False, if the lock is not held with the token anymore.
+        """
+        async with get_connection() as redis:
+            return bool(
+                await redis.eval(
+                    self.extend_script,
+                    [f"{self.lock_prefix}{lock_name}"],
+                    [token, int(ttl * 1000)],
+                )
+            )
+
+    async def delete(self, lock_name: str, token: Optional[str] = None) -> None:
         """
-        Deletes the lock. Does nothing when the lock is not set.
+        Deletes the lock. If the token is given, the lock is only deleted, if it
+        is held with this token. Does nothing when the lock is not set.
         """
         async with get_connection() as redis:
-            await redis.delete(f"{self.lock_prefix}{lock_name}")
+            if token is None:
+                await redis.delete(f"{self.lock_prefix}{lock_name}")
+            else:
+                await redis.eval(
+                    self.delete_script, [f"{self.lock_prefix}{lock_name}"], [token]
+                )
 
 
 class MemoryLockProvider:
     def __init__(self) -> None:
-        self.locks: Dict[str, str] = {}
+        # Mapping from the lock name to the token and the expiry time.
+        self.locks: Dict[str, Tuple[str, Optional[float]]] = {}
 
-    async def set(self, lock_name: str) -> bool:
-        if lock_name in self.locks:
+    def _get_token(self, lock_name: str) -> Optional[str]:
+        """
+        Returns the token of the lock or None, if it is not set or expired.
+        """
+        try:
+            token, expires = self.locks[lock_name]
+        except KeyError:
+            return None
+        if expires is not None and expires <= monotonic():
+            del self.locks[lock_name]
+            return None
+        return token
+
+    async def set(
+        self, lock_name: str, token: str = "1", ttl: Optional[float] = None
+    ) -> bool:
+        if self._get_token(lock_name) is not None:
             return False
-        self.locks[lock_name] = "1"
+        self.locks[lock_name] = (token, monotonic() + ttl if ttl else None)
         return True
 
     async def get(self, lock_name: str) -> bool:
-        return lock_name in self.locks
+        return self._get_token(lock_name) is not None
 
-    async def delete(self, lock_name: str) -> None:
-        try:
-            del self.locks[lock_name]
-        except KeyError:
-            pass
+    async def extend(self, lock_name: str, token: str, ttl: float) -> bool:
+        if self._get_token(lock_name) != token:
+            return False
+        self.locks[lock_name] = (token, monotonic() + ttl)
+        return True
+
+    async def delete(self, lock_name: str, token: Optional[str] = None) -> None:
+        if token is None or self._get_token(lock_name) == token:
+            self.locks.pop(lock_name, None)
 
 
 def load_lock_provider() -> LockProtocol:
@@ -83,3 +166,85 @@ def load_lock_provider() -> LockProtocol:
 
 
 locking = load_lock_provider()
+
+
+class Lock:
+    """
+    Lock shared by all workers with a random token and an expiry time.
+
+    While the lock is held, it is renewed every third of its ttl. So the lock
+    of a crashed worker expires after ttl seconds, but a living worker keeps
+    it as long as it needs. Waiting is done with asyncio.sleep and an
+    increasing delay, so the event loop is not blocked.
+
+    Use it as async context manager or with acquire and release.
+    """
+
+    def __init__(
+        self,
+        lock_name: str,
+        ttl: float = LOCK_TTL,
+        lock_provider: Optional[LockProtocol] = None,
+    ) -> None:
+        self.lock_name = lock_name
+        self.ttl = ttl
+        self.lock_provider = lock_provider or locking
+        self.token: Optional[str] = None
+        self.renewal: Optional[asyncio.Future] = None
+
+    async def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquires the lock. If blocking is True, waits until the lock can be
+        acquired. Else returns False, if the lock is held by someone else.
+        """
+        token = uuid4().hex
+        delay = 0.01
+        while not await self.lock_provider.set(self.lock_name, token, self.ttl):
+            if not blocking:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        self.token = token
+        self.renewal = asyncio.ensure_future(self._renew(token))
+        return True
+
+    async def _renew(self, token: str) -> None:
+        """
+        Extends the lock until it is released.
+        """
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            if not await self.lock_provider.extend(self.lock_name, token, self.ttl):
+                logger.warning(f"Lost the lock {self.lock_name}.")
+                return
+
+    async def release(self) -> None:
+        """
+        Releases the lock, if it is still held by this instance.
+        """
+        if self.renewal is not None:
+            self.renewal.cancel()
+            try:
+                await self.renewal
+            except asyncio.CancelledError:
+                pass
+            self.renewal = None
+        if self.token is not None:
+            await self.lock_provider.delete(self.lock_name, self.token)
+            self.token = None
+
+    async def wait(self) -> None:
+        """
+        Waits until the lock is released or expired without acquiring it.
+        """
+        delay = 0.01
+        while await self.lock_provider.get(self.lock_name):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    async def __aenter__(self) -> "Lock":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        await self.release()
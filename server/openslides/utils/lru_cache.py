@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Generic, Iterable, Optional, TypeVar
+
+
+KT = TypeVar("KT")
+VT = TypeVar("VT")
+
+
+class LRUCache(Generic[KT, VT]):
+    """
+    Process local dict like cache with a maximum amount of entries. If the cache
+    is full, the least recently used entry is removed.
+
+    A max_size of 0 disables the cache: Nothing is saved and every lookup misses.
+
+    All methods are thread safe.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: "OrderedDict[KT, VT]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: KT, default: Any = None) -> Optional[VT]:
+        """
+        Returns the value for the key or the default, if the key is not in the cache.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: KT, value: VT) -> None:
+        """
+        Saves the value. Removes the least recently used entry, if the cache is full.
+        """
+        if not self.max_size:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop_many(self, keys: Iterable[KT]) -> None:
+        """
+        Removes all given keys from the cache. Unknown keys are ignored.
+        """
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,12 +1,12 @@
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 from django.core.exceptions import ImproperlyConfigured
 from django.db import models
 
 from . import logging
 from .access_permissions import BaseAccessPermissions
-from .auth import UserDoesNotExist
+from .auth import PermissionContext, UserDoesNotExist
 from .autoupdate import AutoupdateElement, inform_changed_data, inform_elements
 from .rest_api import model_serializer_classes
 from .utils import convert_camel_case_to_pseudo_snake_case, get_element_id
@@ -48,6 +48,20 @@ class RESTModelMixin:
     changes.
     """
 
+    elements_chunk_size = 1000
+    """
+    Amount of instances, that are loaded from the database at once by
+    iter_elements().
+    """
+
+    sub_element_key: Optional[str] = None
+    """
+    The key of the list in the full_data of the root rest element, that contains
+    the instances of this model, e.g. "speakers". If it is set, changed
+    instances only update their entry in the cached root element. So the root
+    element is not loaded from the database again.
+    """
+
     def get_root_rest_element(self) -> models.Model:
         """
         Returns the root rest instance.
@@ -114,10 +128,7 @@ class RESTModelMixin:
 
         return_value = super().save(*args, **kwargs)  # type: ignore
         if not skip_autoupdate:
-            inform_changed_data(
-                self.get_root_rest_element(),
-                no_delete_on_restriction=no_delete_on_restriction,
-            )
+            inform_changed_data(self, no_delete_on_restriction=no_delete_on_restriction)
         return return_value
 
     def delete(self, skip_autoupdate: bool = False, *args: Any, **kwargs: Any) -> Any:
@@ -135,9 +146,23 @@ class RESTModelMixin:
         instance_pk = self.pk  # type: ignore
         return_value = super().delete(*args, **kwargs)  # type: ignore
         if not skip_autoupdate:
-            if self != self.get_root_rest_element():
+            root_rest_element = self.get_root_rest_element()
+            if self.sub_element_key is not None and self != root_rest_element:
+                # Remove the included element from the cached root element.
+                inform_elements(
+                    [
+                        AutoupdateElement(
+                            id=root_rest_element.get_rest_pk(),
+                            collection_string=root_rest_element.get_collection_string(),
+                            changed_sub_elements={
+                                self.sub_element_key: {instance_pk: None}
+                            },
+                        )
+                    ]
+                )
+            elif self != root_rest_element:
                 # The deletion of a included element is a change of the root element.
-                inform_changed_data(self.get_root_rest_element())
+                inform_changed_data(root_rest_element)
             else:
                 inform_deleted_data([(self.get_collection_string(), instance_pk)])
         return return_value
@@ -147,6 +172,18 @@ class RESTModelMixin:
         """
         Returns all elements as full_data.
         """
+        return list(cls.iter_elements(ids))
+
+    @classmethod
+    def iter_elements(cls, ids: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields all elements as full_data.
+
+        The instances are loaded ordered by the primary key in chunks of
+        elements_chunk_size. Each chunk is a new query (filtered by the last
+        primary key of the previous chunk) with its own prefetching, so only the
+        instances of one chunk are held in memory.
+        """
         do_logging = not bool(ids)
 
         if do_logging:
@@ -160,39 +197,67 @@ class RESTModelMixin:
             query = cls.objects  # type: ignore
             if ids:
                 query = query.filter(pk__in=ids)
-
-        # Build a dict from the instance id to the full_data
-        instances = query.all()
-        full_data = []
+        query = query.order_by("pk")
 
         # For logging the progress
         last_time = time.time()
-        instances_length = len(instances)
-        for i, instance in enumerate(instances):
-            # Append full data from this instance
-            full_data.append(instance.get_full_data())
+        count = 0
+        last_pk = None
+        while True:
+            chunk_query = query if last_pk is None else query.filter(pk__gt=last_pk)
+            instances = list(chunk_query[: cls.elements_chunk_size])
+            for instance in instances:
+                yield instance.get_full_data()
+            count += len(instances)
             if do_logging:
                 # log progress every 5 seconds
                 current_time = time.time()
                 if current_time > last_time + 5:
                     last_time = current_time
-                    logger.info(f"    {i+1}/{instances_length}...")
-        return full_data
+                    logger.info(f"    {count}...")
+            if len(instances) < cls.elements_chunk_size:
+                break
+            last_pk = instances[-1].pk
 
     @classmethod
     async def restrict_elements(
-        cls, user_id: int, elements: List[Dict[str, Any]]
+        cls,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Optional[PermissionContext] = None,
     ) -> List[Dict[str, Any]]:
         """
         Converts a list of elements from full_data to restricted_data.
         """
         try:
             return await cls.get_access_permissions().get_restricted_data(
-                elements, user_id
+                elements, user_id, permission_context
             )
         except UserDoesNotExist:
             return []
 
+    @classmethod
+    async def is_unrestricted(
+        cls, user_id: int, permission_context: Optional[PermissionContext] = None
+    ) -> bool:
+        """
+        Returns True, if restrict_elements returns all elements unchanged for the
+        user.
+        """
+        try:
+            return await cls.get_access_permissions().async_is_unrestricted(
+                user_id, permission_context
+            )
+        except UserDoesNotExist:
+            return False
+
+    @classmethod
+    def is_group_restricted(cls) -> bool:
+        """
+        Returns True, if the restricted data only depends on the groups of the user.
+        """
+        return cls.get_access_permissions().group_restricted
+
     def get_full_data(self) -> Dict[str, Any]:
         """
         Returns the full_data of the instance.
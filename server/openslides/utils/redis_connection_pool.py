@@ -1,18 +1,25 @@
 # type: ignore
 import asyncio
 import sys
+import threading
 import types
-from typing import Any, Dict, List, Optional
+import weakref
+from collections import deque
+from time import monotonic
+from typing import Any, Deque, Dict, List, Tuple, Union
 
-import aioredis
 from django.conf import settings
 
+import aioredis
+
 from . import logging
 
 
 logger = logging.getLogger(__name__)
 connection_pool_limit = getattr(settings, "CONNECTION_POOL_LIMIT", 100)
 logger.info(f"CONNECTION_POOL_LIMIT={connection_pool_limit}")
+connection_pool_idle_check = getattr(settings, "CONNECTION_POOL_IDLE_CHECK", 30)
+logger.info(f"CONNECTION_POOL_IDLE_CHECK={connection_pool_idle_check}")
 
 
 # Copied from https://github.com/django/channels_redis/blob/master/channels_redis/core.py
@@ -142,56 +149,192 @@ class InvalidConnection(Exception):
 
 
 class ConnectionPool(ChannelRedisConnectionPool):
-    """ Adds a trivial, soft limit for the pool """
+    """
+    Adds a soft limit for the pool and checks connections before they are
+    used, if they were idle for a while.
+
+    The pool is shared between all event loops of the process, so waiting for
+    a free connection is done with a future of the waiting loop. A returned
+    connection is handed over to the first waiter.
+    """
 
     def __init__(self, host: Any) -> None:
         self.counter = 0
+        self.counter_lock = threading.Lock()
+        self.waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        # The time, when each idle connection was returned to the pool.
+        self.released: "weakref.WeakKeyDictionary[Any, float]" = (
+            weakref.WeakKeyDictionary()
+        )
+        # The stats are changed by the event loops of all threads.
+        self.stats_lock = threading.Lock()
+        self.stats: Dict[str, Union[int, float]] = {
+            "created": 0,
+            "closed": 0,
+            "checked": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+        }
+        self.stats_time = monotonic()
         super().__init__(host)
 
     async def pop(
         self, *args: List[Any], **kwargs: Dict[str, Any]
     ) -> aioredis.commands.Redis:
-        while self.counter > connection_pool_limit:
-            await asyncio.sleep(0.1)
-        self.counter += 1
+        await self.acquire_slot()
+        try:
+            return await self.pop_ensured_connection(*args, **kwargs)
+        except BaseException:
+            self.release_slot()
+            raise
+
+    async def acquire_slot(self) -> None:
+        """
+        Waits until less than connection_pool_limit connections are in use.
+        """
+        with self.counter_lock:
+            if self.counter < connection_pool_limit:
+                self.counter += 1
+                return
+            loop = asyncio.get_event_loop()
+            waiter = loop.create_future()
+            self.waiters.append((loop, waiter))
 
-        return await self.pop_ensured_connection(*args, **kwargs)
+        start = monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self.counter_lock:
+                try:
+                    self.waiters.remove((loop, waiter))
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over and waiter.done() and not waiter.cancelled():
+                # The slot was handed over, but it is not used.
+                self.release_slot()
+            raise
+        finally:
+            self.count_stat("waits")
+            self.count_stat("wait_time", monotonic() - start)
+
+    def release_slot(self) -> None:
+        """
+        Hands the slot of a returned connection over to the next waiter.
+        """
+        with self.counter_lock:
+            while self.waiters:
+                loop, waiter = self.waiters.popleft()
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(self._wake_waiter, waiter)
+                    return
+            self.counter -= 1
+
+    def _wake_waiter(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # The waiter was cancelled in the meantime.
+            self.release_slot()
+        else:
+            waiter.set_result(None)
 
     async def pop_ensured_connection(
         self, *args: List[Any], **kwargs: Dict[str, Any]
     ) -> aioredis.commands.Redis:
-        redis: Optional[aioredis.commands.Redis] = None
-
-        while redis is None:
-            redis = await super().pop(*args, **kwargs)
-
-            try:
-                await self.try_ping(redis)
-            except InvalidConnection:
-                if redis is not None:
-                    super().conn_error(redis)
-                redis = None
-
+        """
+        Returns a connection of the pool. Connections, that were idle for more
+        than connection_pool_idle_check seconds, are checked with a PING first.
+        A connection, that failed, is closed and replaced by a new one.
+        """
+        redis = await super().pop(*args, **kwargs)
+        released = self.released.pop(redis, None)
+        if released is None:
+            self.count_stat("created")
+            return redis
+        if monotonic() - released < connection_pool_idle_check:
+            return redis
+
+        self.count_stat("checked")
+        try:
+            await self.try_ping(redis)
+        except InvalidConnection:
+            loop = self.in_use[redis]
+            super().conn_error(redis)
+            self.count_stat("closed")
+            # The other idle connections probably failed, too, so they are not
+            # used instead.
+            return await self.create_connection(loop)
         return redis
 
+    async def create_connection(
+        self, loop: asyncio.AbstractEventLoop
+    ) -> aioredis.commands.Redis:
+        """
+        Returns a new connection, that is in use.
+        """
+        if sys.version_info >= (3, 8, 0) and AIOREDIS_VERSION >= (1, 3, 1):
+            conn = await aioredis.create_redis(**self.host)
+        else:
+            conn = await aioredis.create_redis(**self.host, loop=loop)
+        self.in_use[conn] = loop
+        self.count_stat("created")
+        return conn
+
     async def try_ping(self, redis: aioredis.commands.Redis) -> None:
         try:
             pong = await redis.ping()
             if pong != b"PONG":
                 logger.info("Redis connection invalid, did not recieve PONG")
                 raise InvalidConnection()
-        except (ConnectionRefusedError, ConnectionResetError):
+        except (OSError, asyncio.TimeoutError, aioredis.RedisError):
             logger.info("Redis connection invalid, connection is bad")
             raise InvalidConnection()
 
     def push(self, conn: aioredis.commands.Redis) -> None:
+        self.released[conn] = monotonic()
         super().push(conn)
-        self.counter -= 1
+        self.release_slot()
+        self.log_stats()
 
     def conn_error(self, conn: aioredis.commands.Redis) -> None:
         super().conn_error(conn)
-        self.counter -= 1
+        self.count_stat("closed")
+        self.release_slot()
 
     def reset(self) -> None:
         super().reset()
+        self.released = weakref.WeakKeyDictionary()
         self.counter = 0
+
+    def count_stat(self, key: str, value: Union[int, float] = 1) -> None:
+        with self.stats_lock:
+            self.stats[key] += value
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Returns the amount of connections in use, idle connections and waiting
+        requests and the counters since the start of the pool.
+        """
+        with self.stats_lock:
+            stats = dict(self.stats)
+        with self.counter_lock:
+            in_use = self.counter
+            waiting = len(self.waiters)
+        return {
+            "in_use": in_use,
+            "idle": sum(len(conns) for conns in list(self.conn_map.values())),
+            "waiting": waiting,
+            **stats,
+        }
+
+    def log_stats(self) -> None:
+        """
+        Logs the stats every 60 seconds.
+        """
+        current_time = monotonic()
+        with self.stats_lock:
+            if current_time <= self.stats_time + 60:
+                return
+            self.stats_time = current_time
+        logger.debug(
+            ", ".join(f"{key}={value}" for key, value in self.get_stats().items())
+        )
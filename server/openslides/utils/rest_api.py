@@ -278,14 +278,10 @@ class ListModelMixin(_ListModelMixin):
             # The corresponding queryset does not support caching.
             response = super().list(request, *args, **kwargs)
         else:
-            # TODO
-            # This loads all data from the cache, not only the requested data.
-            # If we would use the rest api, we should add a method
-            # element_cache.get_collection_restricted_data
-            all_restricted_data = async_to_sync(element_cache.get_all_data_list)(
-                request.user.pk or 0
-            )
-            response = Response(all_restricted_data.get(collection_string, []))
+            restricted_data = async_to_sync(
+                element_cache.get_collection_restricted_data
+            )(collection_string, request.user.pk or 0)
+            response = Response(restricted_data)
         return response
 
 
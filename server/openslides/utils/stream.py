@@ -1,10 +1,9 @@
-import json
 from typing import Any
 
 from django.conf import settings
 from typing_extensions import Protocol
 
-from . import logging
+from . import json_codec, logging
 from .redis import use_redis
 
 
@@ -28,7 +27,7 @@ class Stream(Protocol):
 class RedisStream:
     async def send(self, stream_name: str, payload: Any) -> None:
         fields = {
-            "content": json.dumps(payload, separators=(",", ":")),
+            "content": json_codec.dumps(payload),
         }
         async with get_connection() as redis:
             await redis.xadd(stream_name, fields, max_len=REDIS_STREAM_MAXLEN)
@@ -1,4 +1,9 @@
+import json
+from typing import List, Optional
+from unittest.mock import patch
+
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -16,6 +21,7 @@ from openslides.motions.models import Motion, MotionBlock
 from openslides.topics.models import Topic
 from openslides.users.models import Group
 from openslides.utils.autoupdate import inform_changed_data
+from openslides.utils.cache import element_cache
 from tests.count_queries import count_queries
 from tests.test_case import TestCase
 
@@ -672,6 +678,56 @@ class Speak(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertFalse(Speaker.objects.get(pk=speaker.pk).begin_time is None)
 
+    def test_begin_speech_updates_cached_speakers(self):
+        current_speaker = Speaker.objects.add(self.user, self.list_of_speakers)
+        current_speaker.begin_speech()
+        speaker = Speaker.objects.add(
+            get_user_model().objects.get(username="admin"), self.list_of_speakers
+        )
+
+        response = self.client.put(
+            reverse("listofspeakers-speak", args=[self.list_of_speakers.pk]),
+            {"speaker": speaker.pk},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        changed_autoupdate, deleted_autoupdate = self.get_last_autoupdate()
+        list_of_speakers = ListOfSpeakers.objects.get(pk=self.list_of_speakers.pk)
+        self.assertEqual(
+            changed_autoupdate[list_of_speakers.get_element_id()],
+            json.loads(json.dumps(list_of_speakers.get_full_data())),
+        )
+
+    def test_concurrent_speakers_are_kept_in_cache(self):
+        admin = get_user_model().objects.get(username="admin")
+        get_current_element_data = element_cache.get_current_element_data
+        other_speakers: List[Optional[Speaker]] = []
+
+        async def read_and_add_other_speaker(collection, id):
+            result = await get_current_element_data(collection, id)
+            if not other_speakers:
+                # Another worker adds a speaker after the cached list of
+                # speakers was read.
+                other_speakers.append(None)
+                other_speakers[0] = await sync_to_async(Speaker.objects.add)(
+                    admin, self.list_of_speakers
+                )
+            return result
+
+        with patch.object(
+            element_cache, "get_current_element_data", read_and_add_other_speaker
+        ):
+            speaker = Speaker.objects.add(self.user, self.list_of_speakers)
+
+        list_of_speakers = async_to_sync(element_cache.get_element_data)(
+            "agenda/list-of-speakers", self.list_of_speakers.pk
+        )
+        assert list_of_speakers is not None and other_speakers[0] is not None
+        self.assertEqual(
+            {speaker["id"] for speaker in list_of_speakers["speakers"]},
+            {speaker.pk, other_speakers[0].pk},
+        )
+
     def test_begin_speech_next_speaker(self):
         speaker = Speaker.objects.add(self.user, self.list_of_speakers)
         Speaker.objects.add(
@@ -110,7 +110,7 @@ class CreateAssignmentPoll(TestCase):
         self.assignment.add_candidate(self.admin)
 
     def test_simple(self):
-        with self.assertNumQueries(40):
+        with self.assertNumQueries(38):
             response = self.client.post(
                 reverse("assignmentpoll-list"),
                 {
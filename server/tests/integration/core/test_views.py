@@ -1,13 +1,17 @@
+import datetime
 import json
+from typing import Any, Dict, List
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from openslides import __license__ as license, __url__ as url, __version__ as version
 from openslides.core.config import ConfigVariable, config
-from openslides.core.models import Projector
+from openslides.core.models import History, HistoryData, Projector
+from openslides.utils.cache import element_cache
 from openslides.utils.rest_api import ValidationError
 from tests.test_case import TestCase
 
@@ -132,6 +136,116 @@ def test_get(client):
     assert values["openslides_url"] == url
 
 
+@pytest.mark.django_db(transaction=False)
+def test_all_data(client):
+    client.login(username="admin", password="admin")
+    response = client.get(reverse("core_all_data"))
+
+    assert response.status_code == 200
+    data = json.loads(b"".join(response.streaming_content).decode())
+    change_id, all_data = async_to_sync(
+        element_cache.get_all_data_list_with_max_change_id
+    )(1)
+    assert data["all_data"]
+    assert data["to_change_id"] == change_id
+    assert data["changed"] == all_data
+
+
+@pytest.mark.django_db(transaction=False)
+def test_all_data_anonymous_disabled(client):
+    response = client.get(reverse("core_all_data"))
+
+    assert response.status_code == 403
+
+
+def add_history(element_id, user_id, minute):
+    History.objects.create(
+        element_id=element_id,
+        now=datetime.datetime(2020, 1, 1, 12, minute, tzinfo=datetime.timezone.utc),
+        information=["Object changed"],
+        user_id=user_id,
+        full_data=HistoryData.objects.create(full_data={}),
+    )
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_information_element_paginated(client):
+    client.login(username="admin", password="admin")
+    for minute in range(5):
+        add_history("motions/motion:1", 1, minute)
+    add_history("motions/motion:2", 1, 0)
+    url = reverse("core_history_information")
+
+    response = client.get(url, {"type": "element", "value": "motions/motion:1"})
+    assert len(response.json()) == 5
+
+    timestamps: List[float] = []
+    params: Dict[str, Any] = {
+        "type": "element",
+        "value": "motions/motion:1",
+        "limit": 2,
+    }
+    while True:
+        data = client.get(url, params).json()
+        timestamps.extend(entry["timestamp"] for entry in data["results"])
+        if data["cursor"] is None:
+            break
+        params["cursor"] = data["cursor"]
+    assert timestamps == [entry["timestamp"] for entry in response.json()]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_information_cursor_in_raw_query_string(client):
+    client.login(username="admin", password="admin")
+    for minute in range(3):
+        add_history("motions/motion:1", 1, minute)
+    url = reverse("core_history_information")
+    query = "type=element&value=motions/motion:1&limit=2"
+
+    data = client.get(f"{url}?{query}").json()
+    response = client.get(f"{url}?{query}&cursor={data['cursor']}")
+
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 1
+    assert response.json()["results"][0]["timestamp"] < data["results"][1]["timestamp"]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_information_invalid_cursor(client):
+    client.login(username="admin", password="admin")
+
+    response = client.get(
+        reverse("core_history_information"),
+        {"type": "element", "value": "motions/motion:1", "limit": 2, "cursor": "a_1"},
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_information_range(client):
+    client.login(username="admin", password="admin")
+    add_history("motions/motion:1", 1, 0)
+    add_history("motions/motion:2", 1, 10)
+    add_history("motions/motion:3", None, 10)
+    add_history("motions/motion:4", 1, 20)
+    start = datetime.datetime(2020, 1, 1, 12, 5, tzinfo=datetime.timezone.utc)
+
+    response = client.get(
+        reverse("core_history_information"),
+        {
+            "type": "range",
+            "from": int(start.timestamp()),
+            "to": int(start.timestamp()) + 600,
+            "user_id": 1,
+        },
+    )
+
+    assert response.status_code == 200
+    assert [entry["element_id"] for entry in response.json()] == ["motions/motion:2"]
+
+
 class ConfigViewSet(TestCase):
     """
     Tests requests to deal with config variables.
@@ -1,18 +1,26 @@
 import random
 import string
+from datetime import timedelta
 
 import pytest
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
+from django.core.management import call_command
 from django.urls import reverse
+from django.utils.timezone import now
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from openslides.core import models as core_models
 from openslides.core.config import config
-from openslides.core.models import Projector, Tag
+from openslides.core.models import History, HistorySnapshot, Projector, Tag
 from openslides.users.models import User
 from openslides.utils.auth import get_group_model
-from openslides.utils.autoupdate import inform_changed_data
+from openslides.utils.autoupdate import (
+    AutoupdateElement,
+    HistoryWriter,
+    inform_changed_data,
+)
 from tests.common_groups import GROUP_ADMIN_PK, GROUP_DELEGATE_PK
 from tests.count_queries import count_queries
 from tests.test_case import TestCase
@@ -54,6 +62,228 @@ def test_config_db_queries():
     assert count_queries(Tag.get_elements)() == 1
 
 
+@pytest.mark.django_db(transaction=False)
+def test_history_add_elements():
+    elements = [
+        AutoupdateElement(
+            id=index,
+            collection_string="core/tag",
+            full_data={"id": index, "name": f"tag{index}"},
+            information=["Object created"],
+            user_id=1,
+        )
+        for index in range(1, 11)
+    ]
+    elements.append(
+        AutoupdateElement(id=11, collection_string="core/tag", disable_history=True)
+    )
+
+    History.objects.add_elements(elements)
+
+    assert History.objects.count() == 10
+    history = History.objects.select_related("full_data").get(element_id="core/tag:3")
+    assert history.full_data.full_data == {"id": 3, "name": "tag3"}
+    assert history.information == ["Object created"]
+    assert history.user_id == 1
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_writer():
+    """
+    Tests that all queued elements are saved at once. The writer is not started
+    as thread, because it would not see the data of the test transaction.
+    """
+    writer = HistoryWriter()
+    for index in range(1, 4):
+        writer.queue.put(
+            (
+                now(),
+                [
+                    AutoupdateElement(
+                        id=index,
+                        collection_string="core/tag",
+                        full_data={"id": index, "name": f"tag{index}"},
+                    )
+                ],
+            )
+        )
+
+    writer.save_queued()
+
+    assert writer.queue.empty()
+    assert sorted(History.objects.values_list("element_id", flat=True)) == [
+        "core/tag:1",
+        "core/tag:2",
+        "core/tag:3",
+    ]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_writer_copies_queued_elements():
+    element = AutoupdateElement(
+        id=1, collection_string="core/tag", full_data={"id": 1, "name": "tag1"}
+    )
+    writer = HistoryWriter()
+    writer.put([element])
+
+    # The element cache adds this key to the full_data after the history is queued.
+    element["full_data"]["_no_delete_on_restriction"] = False  # type: ignore
+    writer.save_queued()
+
+    history = History.objects.select_related("full_data").get()
+    assert history.full_data.full_data == {"id": 1, "name": "tag1"}
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_writer_keeps_entries_of_failing_batch():
+    writer = HistoryWriter()
+    writer.put(
+        [
+            AutoupdateElement(
+                id=1, collection_string="core/tag", full_data={"id": 1, "name": "a"}
+            )
+        ]
+    )
+    # Data, that can not be encoded, can not be saved.
+    writer.queue.put(
+        (
+            now(),
+            [
+                AutoupdateElement(
+                    id=2,
+                    collection_string="core/tag",
+                    full_data={"id": 2, "name": object()},
+                )
+            ],
+        )
+    )
+    writer.save_queued()
+
+    history = History.objects.get()
+    assert history.element_id == "core/tag:1"
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_build_history():
+    History.objects.all().delete()
+
+    History.objects.build_history()
+
+    history = History.objects.select_related("full_data").get(
+        element_id="core/projector:1"
+    )
+    assert history.full_data.full_data["id"] == 1
+
+
+def add_tag_history(id, name):
+    History.objects.add_elements(
+        [
+            AutoupdateElement(
+                id=id,
+                collection_string="core/tag",
+                full_data={"id": id, "name": name} if name else None,
+            )
+        ]
+    )
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_get_dataset_with_snapshots(monkeypatch):
+    monkeypatch.setattr(core_models, "HISTORY_SNAPSHOT_INTERVAL", 2)
+    add_tag_history(1, "tag1")
+    add_tag_history(2, "tag2")
+    add_tag_history(1, None)
+
+    assert History.objects.get_dataset() == {"core/tag": {2: {"id": 2, "name": "tag2"}}}
+    snapshot = HistorySnapshot.objects.get()
+    assert snapshot.get_dataset() == {"core/tag": {2: {"id": 2, "name": "tag2"}}}
+
+    add_tag_history(3, "tag3")
+
+    assert count_queries(History.objects.get_dataset)() == 2
+    assert History.objects.get_dataset() == {
+        "core/tag": {2: {"id": 2, "name": "tag2"}, 3: {"id": 3, "name": "tag3"}}
+    }
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_get_dataset_saves_snapshot_once(monkeypatch):
+    monkeypatch.setattr(core_models, "HISTORY_SNAPSHOT_INTERVAL", 2)
+    add_tag_history(1, "tag1")
+    add_tag_history(2, "tag2")
+    dataset = History.objects.get_dataset(save_snapshot=False)
+    last_history = History.objects.order_by("pk").last()
+
+    # Another request saved the same snapshot in the meantime.
+    HistorySnapshot.objects.create_from_dataset(dataset, last_history)
+    snapshot = HistorySnapshot.objects.create_from_dataset(dataset, last_history)
+
+    assert snapshot.last_history_id == last_history.pk
+    assert HistorySnapshot.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_get_dataset_after_minutes(monkeypatch):
+    monkeypatch.setattr(core_models, "HISTORY_SNAPSHOT_INTERVAL", 0)
+    monkeypatch.setattr(core_models, "HISTORY_SNAPSHOT_MINUTES", 10)
+    add_tag_history(1, "tag1")
+    add_tag_history(2, "tag2")
+    History.objects.get_dataset()
+    assert not HistorySnapshot.objects.exists()
+
+    last_history = History.objects.order_by("pk").last()
+    last_history.now += timedelta(minutes=10)
+    last_history.save()
+    History.objects.get_dataset()
+
+    assert HistorySnapshot.objects.get().last_history_id == last_history.pk
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_get_dataset_snapshot_by_history_id():
+    for id in range(1, 4):
+        add_tag_history(id, f"tag{id}")
+    history = list(History.objects.order_by("pk"))
+    # The third entry was saved after the second one with an earlier time, e.g.
+    # by another worker writing the history asynchronously.
+    History.objects.filter(pk=history[1].pk).update(
+        now=history[2].now + timedelta(minutes=1)
+    )
+    expected = {"core/tag": {id: {"id": id, "name": f"tag{id}"} for id in range(1, 4)}}
+    assert History.objects.get_dataset(history[2].now, save_snapshot=False) == expected
+
+    history[1].refresh_from_db()
+    HistorySnapshot.objects.create_from_dataset(
+        {"core/tag": {id: {"id": id, "name": f"tag{id}"} for id in range(1, 3)}},
+        history[1],
+    )
+
+    assert History.objects.get_dataset(history[2].now) == expected
+
+
+@pytest.mark.django_db(transaction=False)
+def test_history_compact():
+    for id in range(1, 5):
+        add_tag_history(id, f"tag{id}")
+    history = list(History.objects.order_by("pk"))
+    History.objects.filter(pk__gt=history[1].pk).update(
+        now=history[1].now + timedelta(minutes=1)
+    )
+
+    call_command("compacthistory", interval=3, before=history[1].now.isoformat())
+
+    assert History.objects.count() == 2
+    assert sorted(
+        HistorySnapshot.objects.values_list("last_history_id", flat=True)
+    ) == [history[1].pk, history[2].pk]
+    assert History.objects.get_dataset() == {
+        "core/tag": {id: {"id": id, "name": f"tag{id}"} for id in range(1, 5)}
+    }
+    assert History.objects.get_dataset(history[1].now) == {
+        "core/tag": {1: {"id": 1, "name": "tag1"}, 2: {"id": 2, "name": "tag2"}}
+    }
+
+
 class ProjectorViewSet(TestCase):
     """
     Tests (currently just parts) of the ProjectorViewSet.
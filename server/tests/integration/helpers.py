@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, Dict, Iterator, List, Optional, cast
 
 from openslides.core.config import config
 from openslides.core.models import Projector
@@ -20,6 +20,14 @@ class TConfig:
     def get_collection_string(self) -> str:
         return config.get_collection_string()
 
+    def is_group_restricted(self) -> bool:
+        return False
+
+    async def is_unrestricted(
+        self, user_id: int, permission_context: Any = None
+    ) -> bool:
+        return False
+
     def get_elements(self) -> List[Dict[str, Any]]:
         elements = []
         config.key_to_id = {}
@@ -30,8 +38,14 @@ class TConfig:
             config.key_to_id[item.name] = id + 1
         return elements
 
+    def iter_elements(self) -> Iterator[Dict[str, Any]]:
+        yield from self.get_elements()
+
     async def restrict_elements(
-        self, user_id: int, elements: List[Dict[str, Any]]
+        self,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Any = None,
     ) -> List[Dict[str, Any]]:
         return elements
 
@@ -46,6 +60,14 @@ class TUser:
     def get_collection_string(self) -> str:
         return User.get_collection_string()
 
+    def is_group_restricted(self) -> bool:
+        return False
+
+    async def is_unrestricted(
+        self, user_id: int, permission_context: Any = None
+    ) -> bool:
+        return False
+
     def get_elements(self) -> List[Dict[str, Any]]:
         return [
             {
@@ -69,8 +91,14 @@ class TUser:
             }
         ]
 
+    def iter_elements(self) -> Iterator[Dict[str, Any]]:
+        yield from self.get_elements()
+
     async def restrict_elements(
-        self, user_id: int, elements: List[Dict[str, Any]]
+        self,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Any = None,
     ) -> List[Dict[str, Any]]:
         return elements
 
@@ -85,14 +113,28 @@ class TProjector:
     def get_collection_string(self) -> str:
         return Projector.get_collection_string()
 
+    def is_group_restricted(self) -> bool:
+        return False
+
+    async def is_unrestricted(
+        self, user_id: int, permission_context: Any = None
+    ) -> bool:
+        return False
+
     def get_elements(self) -> List[Dict[str, Any]]:
         return [
             {"id": 1, "elements": [{"name": "test/slide1", "id": 1}]},
             {"id": 2, "elements": [{"name": "test/slide2", "id": 1}]},
         ]
 
+    def iter_elements(self) -> Iterator[Dict[str, Any]]:
+        yield from self.get_elements()
+
     async def restrict_elements(
-        self, user_id: int, elements: List[Dict[str, Any]]
+        self,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Any = None,
     ) -> List[Dict[str, Any]]:
         return elements
 
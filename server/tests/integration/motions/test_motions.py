@@ -110,7 +110,7 @@ class CreateMotion(TestCase):
         The created motion should have an identifier and the admin user should
         be the submitter.
         """
-        with self.assertNumQueries(54):
+        with self.assertNumQueries(52):
             response = self.client.post(
                 reverse("motion-list"),
                 {
@@ -897,6 +897,90 @@ class SetState(TestCase):
         self.assertEqual(Motion.objects.get(pk=self.motion.pk).state.name, "submitted")
 
 
+class ManageMultipleState(TestCase):
+    """
+    Tests setting the states of multiple motions.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.login(username="admin", password="admin")
+        self.admin = get_user_model().objects.get(username="admin")
+        self.motions = []
+        for index in range(3):
+            motion = Motion(
+                title=f"test_title_Aigh3eek0oz{index}",
+                text="test_text_ieN4quahfae2cheu",
+            )
+            motion.save()
+            Submitter.objects.add(self.admin, motion)
+            self.motions.append(motion)
+        self.state_id_accepted = 2  # This should be the id of the state 'accepted'.
+
+    def test_set_states(self):
+        response = self.client.post(
+            reverse("motion-manage-multiple-state"),
+            {
+                "motions": [
+                    {"id": motion.pk, "state": self.state_id_accepted}
+                    for motion in self.motions
+                ]
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {"detail": "State of {0} motions successfully set.", "args": [3]},
+        )
+        for motion in Motion.objects.all():
+            self.assertEqual(motion.state.name, "accepted")
+        changed_autoupdate, deleted_autoupdate = self.get_last_autoupdate()
+        self.assertIn("users/user:1", changed_autoupdate)
+        for motion in self.motions:
+            self.assertEqual(
+                changed_autoupdate[f"motions/motion:{motion.pk}"]["state_id"],
+                self.state_id_accepted,
+            )
+
+    def test_set_state_of_other_workflow(self):
+        invalid_state_id = 6  # State 'permitted' of the second workflow
+        response = self.client.post(
+            reverse("motion-manage-multiple-state"),
+            {
+                "motions": [
+                    {"id": self.motions[0].pk, "state": self.state_id_accepted},
+                    {"id": self.motions[1].pk, "state": invalid_state_id},
+                ]
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data,
+            {
+                "detail": "You can not set the state to {0}.",
+                "args": [str(invalid_state_id)],
+            },
+        )
+        for motion in Motion.objects.all():
+            self.assertEqual(motion.state.name, "submitted")
+
+    def test_set_state_of_unknown_motion(self):
+        response = self.client.post(
+            reverse("motion-manage-multiple-state"),
+            {"motions": [{"id": 1337, "state": self.state_id_accepted}]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data, {"detail": "Motion {0} does not exist", "args": ["1337"]}
+        )
+
+
 class SetRecommendation(TestCase):
     """
     Tests setting a recommendation.
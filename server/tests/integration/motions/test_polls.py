@@ -1,6 +1,8 @@
 from decimal import Decimal
+from typing import cast
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -9,9 +11,11 @@ from rest_framework.test import APIClient
 
 from openslides.core.config import config
 from openslides.motions.models import Motion, MotionOption, MotionPoll, MotionVote
+from openslides.poll.access_permissions import BasePollAccessPermissions
 from openslides.poll.models import BasePoll
 from openslides.utils.auth import get_group_model
 from openslides.utils.autoupdate import inform_changed_data
+from openslides.utils.cache import element_cache
 from tests.common_groups import GROUP_ADMIN_PK, GROUP_DEFAULT_PK, GROUP_DELEGATE_PK
 from tests.count_queries import count_queries
 from tests.test_case import TestCase
@@ -893,7 +897,7 @@ class VoteMotionPollNamed(TestCase):
         self.assertFalse(MotionPoll.objects.get().get_votes().exists())
 
     def setup_vote_delegation(self, with_delegation=True):
-        """ user -> admin """
+        """user -> admin"""
         self.start_poll()
         self.make_admin_delegate()
         self.make_admin_present()
@@ -1158,6 +1162,54 @@ class VoteMotionPollNamedAutoupdates(TestCase):
         self.assertNoAutoupdate(vote, user=self.other_user)
         self.assertNoDeletedAutoupdate(vote, user=self.other_user)
 
+    def test_restriction_does_not_alter_full_data(self):
+        response = self.user_client.post(
+            reverse("motionpoll-vote", args=[self.poll.pk]), {"data": "A"}
+        )
+        self.assertHttpStatusVerbose(response, status.HTTP_200_OK)
+        full_data = list(
+            async_to_sync(element_cache.get_collection_data)(
+                "motions/motion-poll"
+            ).values()
+        )
+
+        restricted_data = async_to_sync(MotionPoll.restrict_elements)(
+            self.user.id, full_data
+        )
+
+        self.assertTrue(restricted_data[0]["user_has_voted"])
+        self.assertNotIn("voted_id", restricted_data[0])
+        self.assertNotIn("user_has_voted", full_data[0])
+        self.assertEqual(full_data[0]["voted_id"], [self.user.id])
+
+    def test_restriction_shares_voted_ids_per_change_id(self):
+        response = self.user_client.post(
+            reverse("motionpoll-vote", args=[self.poll.pk]), {"data": "A"}
+        )
+        self.assertHttpStatusVerbose(response, status.HTTP_200_OK)
+        change_id = async_to_sync(element_cache.get_current_change_id)()
+        full_data = list(
+            async_to_sync(element_cache.get_collection_data)(
+                "motions/motion-poll"
+            ).values()
+        )
+        access_permissions = cast(
+            BasePollAccessPermissions, MotionPoll.get_access_permissions()
+        )
+
+        for user in (self.user, self.other_user):
+            restricted_data = async_to_sync(element_cache.restrict_collection_data)(
+                "motions/motion-poll",
+                full_data,
+                user.id,
+                element_cache.get_permission_context(user.id),
+                (0, change_id),
+            )
+            self.assertEqual(restricted_data[0]["user_has_voted"], user == self.user)
+
+        self.assertEqual(access_permissions.voted_ids_change_id, change_id)
+        self.assertEqual(access_permissions.voted_ids, {self.poll.pk: {self.user.id}})
+
 
 class VoteMotionPollPseudoanonymousAutoupdates(TestCase):
     """3 important users:
@@ -1654,7 +1706,7 @@ class ResetMotionPoll(TestCase):
 
 class TestMotionPollWithVoteDelegationAutoupdate(TestCase):
     def advancedSetUp(self):
-        """ Set up user -> other_user delegation. """
+        """Set up user -> other_user delegation."""
         self.motion = Motion(
             title="test_title_dL91JqhMTiQuQLSDRItZ",
             text="test_text_R7nURdXKVEfEnnJBXJYa",
@@ -1,4 +1,5 @@
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import Permission
 from django.core import mail
 from django.urls import reverse
@@ -6,8 +7,11 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from openslides.core.config import config
+from openslides.motions.models import Motion, Submitter
 from openslides.users.models import Group, PersonalNote, User
+from openslides.utils.access_permissions import required_user
 from openslides.utils.autoupdate import inform_changed_data
+from openslides.utils.cache import element_cache
 from tests.count_queries import count_queries
 from tests.test_case import TestCase
 
@@ -33,6 +37,27 @@ def test_user_db_queries():
     assert count_queries(User.get_elements)() == 4
 
 
+@pytest.mark.django_db(transaction=False)
+def test_user_iter_elements_in_chunks(monkeypatch):
+    """
+    Tests that the users are loaded and prefetched in chunks ordered by id.
+    The 11 users (with the admin) are loaded in 3 chunks. Only the first chunk
+    contains a user with groups, so the permissions are requested once:
+    * 3 requests to get the users,
+    * 3 requests to get the groups,
+    * 3 requests to get the vote delegations and
+    * 1 request to get the permissions.
+    """
+    monkeypatch.setattr(User, "elements_chunk_size", 4)
+    for index in range(10):
+        User.objects.create(username=f"user{index}")
+
+    assert count_queries(lambda: list(User.iter_elements()))() == 10
+    assert [user["id"] for user in User.iter_elements()] == list(
+        User.objects.order_by("pk").values_list("pk", flat=True)
+    )
+
+
 @pytest.mark.django_db(transaction=False)
 def test_group_db_queries():
     """
@@ -315,7 +340,7 @@ class UserUpdate(TestCase):
         self.assertIsNone(admin.vote_delegated_to_id)
 
     def setup_vote_delegation(self):
-        """ login and setup user -> user2 delegation """
+        """login and setup user -> user2 delegation"""
         self.user, _ = self.create_user()
         self.user2, _ = self.create_user()
         self.user.vote_delegated_to = self.user2
@@ -356,7 +381,7 @@ class UserUpdate(TestCase):
         self.assertEqual(user.vote_delegated_to_id, self.user2.id)
 
     def test_update_nested_vote_delegation_1(self):
-        """ user -> user2 -> admin """
+        """user -> user2 -> admin"""
         self.setup_vote_delegation()
         response = self.client.patch(
             reverse("user-detail", args=[self.user2.pk]),
@@ -368,7 +393,7 @@ class UserUpdate(TestCase):
         self.assertIsNone(user2.vote_delegated_to_id)
 
     def test_update_nested_vote_delegation_2(self):
-        """ admin -> user -> user2 """
+        """admin -> user -> user2"""
         self.setup_vote_delegation()
         response = self.client.patch(
             reverse("user-detail", args=[self.admin.pk]),
@@ -413,7 +438,7 @@ class UserUpdate(TestCase):
         self.assertIsNone(user.vote_delegated_to_id)
 
     def test_update_vote_delegated_from_nested_1(self):
-        """ admin -> user -> user2 """
+        """admin -> user -> user2"""
         self.setup_vote_delegation()
         response = self.client.patch(
             reverse("user-detail", args=[self.user.pk]),
@@ -425,7 +450,7 @@ class UserUpdate(TestCase):
         self.assertIsNone(admin.vote_delegated_to_id)
 
     def test_update_vote_delegated_from_nested_2(self):
-        """ user -> user2 -> admin """
+        """user -> user2 -> admin"""
         self.setup_vote_delegation()
         response = self.client.patch(
             reverse("user-detail", args=[self.admin.pk]),
@@ -479,7 +504,7 @@ class UserDelete(TestCase):
         self.assertFalse(User.objects.filter(pk__in=ids).exists())
 
     def test_bulk_delete_self(self):
-        """ The own id should be excluded, so nothing should happen. """
+        """The own id should be excluded, so nothing should happen."""
         response = self.admin_client.post(
             reverse("user-bulk-delete"), {"user_ids": [1]}
         )
@@ -1096,6 +1121,44 @@ class GroupUpdate(TestCase):
             )
         )
 
+    def test_set_single_permission_changes_restrictions(self):
+        delegate = User.objects.create(username="delegate_aiy0Aec9ie")
+        delegate.groups.add(GROUP_DELEGATE_PK)
+        staff = User.objects.create(username="staff_Thahch5Ooj")
+        staff.groups.add(GROUP_STAFF_PK)
+        inform_changed_data([delegate, staff])
+        change_id = async_to_sync(element_cache.get_current_change_id)()
+
+        response = self.client.post(
+            reverse("group-set-permission", args=[GROUP_DELEGATE_PK]),
+            {"perm": "motions.can_see", "set": False},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The workflows are not written again.
+        _, element_ids = async_to_sync(self.get_element_ids_since)(change_id + 1)
+        self.assertEqual(element_ids, [f"users/group:{GROUP_DELEGATE_PK}"])
+        # The delegate can not see the workflows anymore.
+        _, changed, deleted = async_to_sync(element_cache.get_data_since)(
+            delegate.pk, change_id + 1
+        )
+        self.assertNotIn("motions/workflow", changed)
+        self.assertIn("motions/workflow:1", deleted)
+        # The restriction of the staff has not changed.
+        _, changed, deleted = async_to_sync(element_cache.get_data_since)(
+            staff.pk, change_id + 1
+        )
+        self.assertNotIn("motions/workflow", changed)
+        self.assertNotIn("motions/workflow:1", deleted)
+
+    async def get_element_ids_since(self, change_id):
+        (
+            max_change_id,
+            _,
+            element_ids,
+        ) = await element_cache.cache_provider.get_element_ids_since(change_id)
+        return max_change_id, element_ids
+
     def test_add_single_permission_wrong_permission(self):
         admin_client = APIClient()
         admin_client.login(username="admin", password="admin")
@@ -1280,3 +1343,23 @@ class PersonalNoteTest(TestCase):
         self.assertEqual(
             PersonalNote.objects.get().notes, "test_note_fof3joqmcufh32fn(/2f"
         )
+
+
+class RequiredUsers(TestCase):
+    """
+    Tests the index of the required users.
+    """
+
+    def get_required_users(self):
+        return async_to_sync(required_user.get_required_users)({"motions/motion"})
+
+    def test_required_users_follow_changes(self):
+        user = User.objects.create(username="user")
+        motion = Motion.objects.create(title="test_title_Iexah1ohquooph8ahb1O")
+        self.assertNotIn(user.id, self.get_required_users())
+
+        submitter = Submitter.objects.add(user, motion)
+        self.assertIn(user.id, self.get_required_users())
+
+        submitter.delete()
+        self.assertNotIn(user.id, self.get_required_users())
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, Iterator, List
 
 from openslides.utils.cache_providers import Cachable, MemoryCacheProvider
 
@@ -25,11 +25,25 @@ class Collection1:
     def get_collection_string(self) -> str:
         return "app/collection1"
 
+    def is_group_restricted(self) -> bool:
+        return False
+
+    async def is_unrestricted(
+        self, user_id: int, permission_context: Any = None
+    ) -> bool:
+        return False
+
     def get_elements(self) -> List[Dict[str, Any]]:
         return [{"id": 1, "value": "value1"}, {"id": 2, "value": "value2"}]
 
+    def iter_elements(self) -> Iterator[Dict[str, Any]]:
+        yield from self.get_elements()
+
     async def restrict_elements(
-        self, user_id: int, elements: List[Dict[str, Any]]
+        self,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Any = None,
     ) -> List[Dict[str, Any]]:
         return restrict_elements(elements)
 
@@ -40,11 +54,25 @@ class Collection2:
     def get_collection_string(self) -> str:
         return "app/collection2"
 
+    def is_group_restricted(self) -> bool:
+        return False
+
+    async def is_unrestricted(
+        self, user_id: int, permission_context: Any = None
+    ) -> bool:
+        return False
+
     def get_elements(self) -> List[Dict[str, Any]]:
         return [{"id": 1, "key": "value1"}, {"id": 2, "key": "value2"}]
 
+    def iter_elements(self) -> Iterator[Dict[str, Any]]:
+        yield from self.get_elements()
+
     async def restrict_elements(
-        self, user_id: int, elements: List[Dict[str, Any]]
+        self,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Any = None,
     ) -> List[Dict[str, Any]]:
         return restrict_elements(elements)
 
@@ -55,14 +83,28 @@ class PersonalizedCollection:
     def get_collection_string(self) -> str:
         return "app/personalized-collection"
 
+    def is_group_restricted(self) -> bool:
+        return False
+
+    async def is_unrestricted(
+        self, user_id: int, permission_context: Any = None
+    ) -> bool:
+        return False
+
     def get_elements(self) -> List[Dict[str, Any]]:
         return [
             {"id": 1, "key": "value1", "user_id": 1},
             {"id": 2, "key": "value2", "user_id": 2},
         ]
 
+    def iter_elements(self) -> Iterator[Dict[str, Any]]:
+        yield from self.get_elements()
+
     async def restrict_elements(
-        self, user_id: int, elements: List[Dict[str, Any]]
+        self,
+        user_id: int,
+        elements: List[Dict[str, Any]],
+        permission_context: Any = None,
     ) -> List[Dict[str, Any]]:
         return [element for element in elements if element["user_id"] == user_id]
 
@@ -0,0 +1,28 @@
+from openslides.utils.access_permissions import restricted_copy
+
+
+def test_restricted_copy_remove():
+    element = {"id": 1, "text": "text", "comments": [{"id": 1}]}
+
+    copy = restricted_copy(element, remove=("text",))
+
+    assert copy == {"id": 1, "comments": [{"id": 1}]}
+    assert element == {"id": 1, "text": "text", "comments": [{"id": 1}]}
+
+
+def test_restricted_copy_update():
+    element = {"id": 1, "text": "text", "comments": [{"id": 1}]}
+
+    copy = restricted_copy(element, update={"comments": []})
+
+    assert copy == {"id": 1, "text": "text", "comments": []}
+    assert element["comments"] == [{"id": 1}]
+
+
+def test_restricted_copy_shares_values():
+    element = {"id": 1, "paragraphs": ["a", "b"]}
+
+    copy = restricted_copy(element)
+
+    assert copy is not element
+    assert copy["paragraphs"] is element["paragraphs"]
@@ -0,0 +1,186 @@
+import threading
+import time
+
+import pytest
+
+from openslides.utils import autoupdate
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """
+    Replaces the sending of the autoupdate and returns the list of all sent
+    elements.
+    """
+    sent = []
+
+    async def send_autoupdate(cache_elements, *args):
+        sent.append(dict(cache_elements))
+        return len(sent)
+
+    monkeypatch.setattr(autoupdate, "send_autoupdate", send_autoupdate)
+    return sent
+
+
+def test_dispatcher_coalesces_bundles(sent):
+    dispatcher = autoupdate.AutoupdateDispatcher(0.1)
+    change_ids = {}
+
+    def dispatch(id):
+        change_ids[id] = dispatcher.dispatch({f"app/collection:{id}": {"id": id}})
+
+    threads = [threading.Thread(target=dispatch, args=(id,)) for id in range(1, 6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sent == [{f"app/collection:{id}": {"id": id} for id in range(1, 6)}]
+    assert change_ids == {id: 1 for id in range(1, 6)}
+
+
+def test_dispatcher_after_window(sent):
+    dispatcher = autoupdate.AutoupdateDispatcher(0)
+
+    assert dispatcher.dispatch({"app/collection:1": {"id": 1}}) == 1
+    assert dispatcher.dispatch({"app/collection:1": None}) == 2
+    assert sent == [{"app/collection:1": {"id": 1}}, {"app/collection:1": None}]
+
+
+def test_dispatcher_sends_in_order(monkeypatch):
+    sent = []
+    calls = []
+
+    async def send_autoupdate(cache_elements, *args):
+        calls.append(cache_elements)
+        if len(calls) == 1:
+            # The first autoupdate is slow, e.g. because of a large element.
+            time.sleep(0.1)
+        sent.append(dict(cache_elements))
+        return len(sent)
+
+    monkeypatch.setattr(autoupdate, "send_autoupdate", send_autoupdate)
+    dispatcher = autoupdate.AutoupdateDispatcher(0.01)
+    first = threading.Thread(
+        target=dispatcher.dispatch, args=({"app/collection:1": {"id": 1, "v": 1}},)
+    )
+    first.start()
+    time.sleep(0.05)
+
+    change_id = dispatcher.dispatch({"app/collection:1": {"id": 1, "v": 2}})
+    first.join()
+
+    assert change_id == 2
+    assert sent == [
+        {"app/collection:1": {"id": 1, "v": 1}},
+        {"app/collection:1": {"id": 1, "v": 2}},
+    ]
+
+
+def test_dispatcher_checks_elements_updated_from_cache(monkeypatch):
+    calls = []
+
+    async def send_autoupdate(cache_elements, unchanged_element_ids, unchanged_since):
+        calls.append((unchanged_element_ids, unchanged_since))
+        return 1
+
+    monkeypatch.setattr(autoupdate, "send_autoupdate", send_autoupdate)
+    dispatcher = autoupdate.AutoupdateDispatcher(0)
+
+    dispatcher.dispatch(
+        {
+            "app/collection:1": {"id": 1, "_no_delete_on_restriction": False},
+            "app/collection:2": {"id": 2, "_no_delete_on_restriction": False},
+        },
+        {"app/collection:1": {"speakers": {1: {"id": 1}}}},
+        5,
+    )
+
+    assert calls == [(["app/collection:1"], 5)]
+
+
+def test_update_sub_elements():
+    full_data = {"id": 1, "speakers": [{"id": 1, "weight": 1}, {"id": 2, "weight": 2}]}
+
+    updated = autoupdate.update_sub_elements(
+        full_data, {"speakers": {1: None, 2: {"id": 2, "weight": 1}, 3: {"id": 3}}}
+    )
+
+    assert updated == {"id": 1, "speakers": [{"id": 2, "weight": 1}, {"id": 3}]}
+    assert full_data["speakers"] == [{"id": 1, "weight": 1}, {"id": 2, "weight": 2}]
+
+
+def test_bundle_merges_sub_element_changes():
+    bundle = autoupdate.AutoupdateBundle()
+
+    bundle.add(
+        [
+            autoupdate.AutoupdateElement(
+                id=1,
+                collection_string="app/collection",
+                changed_sub_elements={"speakers": {1: {"id": 1}}},
+            ),
+            autoupdate.AutoupdateElement(
+                id=1,
+                collection_string="app/collection",
+                changed_sub_elements={"speakers": {2: None}},
+            ),
+            autoupdate.AutoupdateElement(
+                id=2, collection_string="app/collection", full_data=None
+            ),
+            autoupdate.AutoupdateElement(
+                id=2,
+                collection_string="app/collection",
+                changed_sub_elements={"speakers": {1: {"id": 1}}},
+            ),
+        ]
+    )
+
+    elements = bundle.autoupdate_elements["app/collection"]
+    assert elements[1]["changed_sub_elements"] == {"speakers": {1: {"id": 1}, 2: None}}
+    assert elements[2] == {
+        "id": 2,
+        "collection_string": "app/collection",
+        "full_data": None,
+    }
+
+
+def test_dispatcher_applies_sub_element_changes_to_pending_element(sent):
+    dispatcher = autoupdate.AutoupdateDispatcher(0.1)
+    first = threading.Thread(
+        target=dispatcher.dispatch,
+        args=(
+            {
+                "app/collection:1": {
+                    "id": 1,
+                    "speakers": [{"id": 1}],
+                    "_no_delete_on_restriction": False,
+                }
+            },
+        ),
+    )
+    first.start()
+    time.sleep(0.02)
+    # The second bundle updated the full_data from the cache, which does not
+    # contain the speaker of the first bundle yet.
+    dispatcher.dispatch(
+        {
+            "app/collection:1": {
+                "id": 1,
+                "speakers": [{"id": 2}],
+                "_no_delete_on_restriction": True,
+            }
+        },
+        {"app/collection:1": {"speakers": {2: {"id": 2}}}},
+    )
+    first.join()
+
+    assert sent == [
+        {
+            "app/collection:1": {
+                "id": 1,
+                "speakers": [{"id": 1}, {"id": 2}],
+                "_no_delete_on_restriction": True,
+            }
+        }
+    ]
@@ -1,9 +1,14 @@
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, cast
 
 import pytest
 
-from openslides.utils.cache import ChangeIdTooLowError, ElementCache
+from openslides.utils.cache import (
+    ChangeIdTooLowError,
+    ElementCache,
+    strip_no_delete_on_restriction,
+)
+from openslides.utils.cache_providers import ElementsChanged
 
 from .cache_provider import TTestCacheProvider, example_data, get_cachable_provider
 
@@ -104,6 +109,32 @@ async def test_change_elements_with_no_data_in_redis(element_cache):
     }
 
 
+@pytest.mark.asyncio
+async def test_change_elements_unchanged_since(element_cache):
+    change_id, element = await element_cache.get_current_element_data(
+        "app/collection1", 1
+    )
+    await element_cache.change_elements({"app/collection1:2": {"id": 2}})
+
+    assert element == {"id": 1, "value": "value1"}
+    assert await element_cache.change_elements(
+        {"app/collection1:1": {"id": 1, "value": "new"}},
+        ["app/collection1:1"],
+        change_id,
+    ) == (change_id + 2)
+
+    with pytest.raises(ElementsChanged):
+        await element_cache.change_elements(
+            {"app/collection1:1": {"id": 1, "value": "newer"}},
+            ["app/collection1:1"],
+            change_id,
+        )
+    assert json.loads(element_cache.cache_provider.full_data["app/collection1:1"]) == {
+        "id": 1,
+        "value": "new",
+    }
+
+
 @pytest.mark.asyncio
 async def test_get_all_data_from_db(element_cache):
     result = await element_cache.get_all_data_list()
@@ -195,6 +226,18 @@ async def test_get_data_since_change_id_data_in_redis(element_cache):
     )
 
 
+@pytest.mark.asyncio
+async def test_get_data_since_element_changed_several_times(element_cache):
+    for value in ("first", "second", "third"):
+        await element_cache.change_elements(
+            {"app/collection1:1": {"id": 1, "value": value}}
+        )
+
+    result = await element_cache.get_data_since(None, 1)
+
+    assert result == (3, {"app/collection1": [{"id": 1, "value": "third"}]}, [])
+
+
 @pytest.mark.asyncio
 async def test_get_data_since_change_id_data_in_db(element_cache):
     element_cache.cache_provider.change_id_data = {
@@ -350,3 +393,343 @@ async def test_lowest_change_id_after_updating_lowest_element(element_cache):
 
     assert first_lowest_change_id == 0
     assert second_lowest_change_id == 0  # The lowest_change_id should not change
+
+
+@pytest.mark.asyncio
+async def test_trim_change_ids_by_count(element_cache):
+    element_cache.change_id_max_count = 2
+    for id in range(1, 5):
+        await element_cache.change_elements(
+            {f"app/collection1:{id}": {"id": id, "value": "updated"}}
+        )
+    await element_cache.trim_change_ids(force=True)
+
+    assert await element_cache.get_lowest_change_id() == 3
+    assert await element_cache.get_current_change_id() == 4
+    with pytest.raises(ChangeIdTooLowError):
+        await element_cache.get_data_since(None, 2)
+    result = await element_cache.get_data_since(None, 3)
+    assert sorted(result[1]["app/collection1"], key=lambda x: x["id"]) == [
+        {"id": 3, "value": "updated"},
+        {"id": 4, "value": "updated"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_trim_change_ids_by_count_with_restrictions(element_cache):
+    element_cache.change_id_max_count = 2
+    for id in range(1, 4):
+        await element_cache.change_elements(
+            {f"app/collection1:{id}": {"id": id, "value": "updated"}}
+        )
+    await element_cache.change_restrictions([1, 2], ["app/collection1"])
+    await element_cache.trim_change_ids(force=True)
+
+    # The restrictions of change id 4 do not count as element ids.
+    assert await element_cache.get_lowest_change_id() == 2
+    assert await element_cache.get_current_change_id() == 4
+    with pytest.raises(ChangeIdTooLowError):
+        await element_cache.get_data_since(None, 1)
+
+
+@pytest.mark.asyncio
+async def test_trim_change_ids_by_age(element_cache):
+    element_cache.change_id_max_age = 10
+    await element_cache.change_elements(
+        {"app/collection1:1": {"id": 1, "value": "updated"}}
+    )
+    await element_cache.change_elements(
+        {"app/collection1:2": {"id": 2, "value": "updated"}}
+    )
+    # The change ids were written 20 seconds ago.
+    element_cache.cache_provider.change_id_times = {2: 0.0}
+    await element_cache.change_elements(
+        {"app/collection1:1": {"id": 1, "value": "updated2"}}
+    )
+    await element_cache.trim_change_ids(force=True)
+
+    # The max change id is always kept.
+    assert await element_cache.get_lowest_change_id() == 3
+    with pytest.raises(ChangeIdTooLowError):
+        await element_cache.get_data_since(None, 2)
+
+
+@pytest.mark.asyncio
+async def test_trim_change_ids_keeps_max_change_id(element_cache):
+    element_cache.change_id_max_count = 1
+    await element_cache.change_elements(
+        {
+            "app/collection1:1": {"id": 1, "value": "updated"},
+            "app/collection1:2": {"id": 2, "value": "updated"},
+        }
+    )
+    await element_cache.trim_change_ids(force=True)
+
+    assert await element_cache.get_lowest_change_id() == 1
+    assert await element_cache.get_current_change_id() == 1
+    result = await element_cache.get_data_since(None, 1)
+    assert len(result[1]["app/collection1"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_collection_restricted_data(element_cache):
+    result = await element_cache.get_collection_restricted_data("app/collection1", 1)
+
+    assert sorted(result, key=lambda x: x["id"]) == [
+        {"id": 1, "value": "restricted_value1"},
+        {"id": 2, "value": "restricted_value2"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_collection_restricted_data_personalized(element_cache):
+    result = await element_cache.get_collection_restricted_data(
+        "app/personalized-collection", 2
+    )
+
+    assert result == [{"id": 2, "key": "value2", "user_id": 2}]
+
+
+@pytest.mark.asyncio
+async def test_get_element_data_uses_local_cache(element_cache):
+    await element_cache.get_element_data("app/collection1", 1)
+    # Change the provider without informing the element cache.
+    element_cache.cache_provider.full_data[
+        "app/collection1:1"
+    ] = '{"id": 1, "value": "changed"}'
+
+    result = await element_cache.get_element_data("app/collection1", 1)
+
+    assert result == {"id": 1, "value": "value1"}
+
+
+@pytest.mark.asyncio
+async def test_local_cache_change_elements(element_cache):
+    await element_cache.get_element_data("app/collection1", 1)
+
+    await element_cache.change_elements(
+        {"app/collection1:1": {"id": 1, "value": "updated"}}
+    )
+    result = await element_cache.get_element_data("app/collection1", 1)
+
+    assert result == {"id": 1, "value": "updated"}
+
+
+@pytest.mark.asyncio
+async def test_validate_local_cache(element_cache):
+    await element_cache.validate_local_cache()
+    await element_cache.get_element_data("app/collection1", 1)
+    await element_cache.get_element_data("app/collection1", 2)
+    # Change the data like another worker does.
+    await element_cache.cache_provider.add_changed_elements(
+        ["app/collection1:1", '{"id": 1, "value": "updated"}'], []
+    )
+
+    await element_cache.validate_local_cache()
+
+    assert "app/collection1:1" not in element_cache.local_cache
+    assert "app/collection1:2" in element_cache.local_cache
+    assert element_cache.local_cache_change_id == 1
+    assert await element_cache.get_element_data("app/collection1", 1) == {
+        "id": 1,
+        "value": "updated",
+    }
+
+
+class LaggingReplicaCacheProvider(TTestCacheProvider):
+    """
+    Reads the element data from a replica with the data until replica_change_id,
+    if it has all required changes.
+    """
+
+    def set_data_dicts(self) -> None:
+        super().set_data_dicts()
+        self.replica_full_data: Dict[str, str] = {}
+        self.replica_change_id = 0
+        self.required_change_id = 0
+
+    def require_change_id(self, change_id: int) -> None:
+        self.required_change_id = max(self.required_change_id, change_id)
+
+    async def get_element_data(
+        self, element_id: str, read_only: bool = True
+    ) -> Optional[bytes]:
+        if read_only and self.replica_change_id >= self.required_change_id:
+            value = self.replica_full_data.get(element_id)
+            return value.encode() if value is not None else None
+        return await super().get_element_data(element_id, read_only)
+
+
+@pytest.fixture
+def lagging_replica_element_cache():
+    element_cache = ElementCache(
+        cache_provider_class=LaggingReplicaCacheProvider,
+        cachable_provider=get_cachable_provider(),
+        default_change_id=0,
+    )
+    element_cache.ensure_cache()
+    return element_cache
+
+
+@pytest.mark.asyncio
+async def test_validate_local_cache_with_lagging_replica(
+    lagging_replica_element_cache,
+):
+    element_cache = lagging_replica_element_cache
+    cache_provider = cast(LaggingReplicaCacheProvider, element_cache.cache_provider)
+    cache_provider.replica_full_data = dict(cache_provider.full_data)
+    await element_cache.validate_local_cache()
+    await element_cache.get_element_data("app/collection1", 1)
+    # Another worker changes the element. The replica does not have it yet.
+    await cache_provider.add_changed_elements(
+        ["app/collection1:1", '{"id": 1, "value": "updated"}'], []
+    )
+
+    await element_cache.validate_local_cache()
+
+    assert await element_cache.get_element_data("app/collection1", 1) == {
+        "id": 1,
+        "value": "updated",
+    }
+
+
+@pytest.mark.asyncio
+async def test_get_all_restricted_data_shares_permission_context(element_cache):
+    permission_contexts = []
+    for cachable in element_cache.cachables.values():
+        restricter = cachable.restrict_elements
+
+        async def restrict_elements(
+            user_id, elements, permission_context=None, restricter=restricter
+        ):
+            permission_contexts.append(permission_context)
+            return await restricter(user_id, elements, permission_context)
+
+        cachable.restrict_elements = restrict_elements
+
+    await element_cache.get_all_data_list(1)
+
+    assert len(permission_contexts) == 3
+    assert permission_contexts[0].user_id == 1
+    assert all(context is permission_contexts[0] for context in permission_contexts)
+
+
+class TPermissionContext:
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    async def get_group_profile(self):
+        return (True, (1,))
+
+
+@pytest.mark.asyncio
+async def test_restricted_cache_shared_between_group_profiles(element_cache):
+    calls = []
+    cachable = element_cache.cachables["app/collection1"]
+    restricter = cachable.restrict_elements
+
+    async def restrict_elements(user_id, elements, permission_context=None):
+        calls.append(user_id)
+        return await restricter(user_id, elements, permission_context)
+
+    cachable.restrict_elements = restrict_elements
+    cachable.is_group_restricted = lambda: True
+    element_cache.get_permission_context = TPermissionContext
+
+    _, result1 = await element_cache.get_all_data_list_with_max_change_id(1)
+    _, result2 = await element_cache.get_all_data_list_with_max_change_id(2)
+
+    assert calls == [1]
+    assert result1["app/collection1"] == result2["app/collection1"]
+
+    await element_cache.change_elements(
+        {"app/collection1:1": {"id": 1, "value": "updated"}}
+    )
+    _, result3 = await element_cache.get_all_data_list_with_max_change_id(2)
+
+    assert calls == [1, 2]
+    assert {"id": 1, "value": "restricted_updated"} in result3["app/collection1"]
+
+
+def test_strip_no_delete_on_restriction():
+    assert (
+        strip_no_delete_on_restriction(
+            b'{"id": 1, "value": "v", "_no_delete_on_restriction": false}'
+        )
+        == b'{"id": 1, "value": "v"}'
+    )
+    assert strip_no_delete_on_restriction(b'{"id": 1}') == b'{"id": 1}'
+
+
+def test_strip_no_delete_on_restriction_not_last_key():
+    result = strip_no_delete_on_restriction(
+        b'{"_no_delete_on_restriction": true, "id": 1}'
+    )
+
+    assert json.loads(result.decode()) == {"id": 1}
+
+
+@pytest.mark.asyncio
+async def test_get_restricted_collection_json(element_cache):
+    encoded_elements = [
+        b'{"id": 1, "value": "value1", "_no_delete_on_restriction": false}'
+    ]
+
+    result = await element_cache.get_restricted_collection_json(
+        "app/collection1", encoded_elements, 1, TPermissionContext(1)
+    )
+
+    assert json.loads(result.decode()) == [{"id": 1, "value": "restricted_value1"}]
+
+
+@pytest.mark.asyncio
+async def test_get_restricted_collection_json_unrestricted(element_cache):
+    async def is_unrestricted(user_id, permission_context=None):
+        return True
+
+    element_cache.cachables["app/collection1"].is_unrestricted = is_unrestricted
+    encoded_elements = [
+        b'{"id": 1, "value": "value1", "_no_delete_on_restriction": false}',
+        b'{"id": 2, "value": "value2"}',
+    ]
+
+    result = await element_cache.get_restricted_collection_json(
+        "app/collection1", encoded_elements, 1, TPermissionContext(1)
+    )
+
+    assert result == b'[{"id": 1, "value": "value1"},{"id": 2, "value": "value2"}]'
+
+
+@pytest.mark.parametrize("build_threads", [1, 2])
+def test_build_cache_in_chunks(build_threads, monkeypatch):
+    element_cache = ElementCache(
+        cache_provider_class=TTestCacheProvider,
+        cachable_provider=get_cachable_provider(),
+        default_change_id=0,
+        build_threads=build_threads,
+        build_chunk_size=1,
+    )
+    cache_provider = cast(TTestCacheProvider, element_cache.cache_provider)
+    chunks = []
+    add_to_full_data = cache_provider.add_to_full_data
+
+    async def spy_add_to_full_data(data):
+        chunks.append(data)
+        await add_to_full_data(data)
+
+    monkeypatch.setattr(cache_provider, "add_to_full_data", spy_add_to_full_data)
+
+    element_cache.ensure_cache()
+
+    assert all(len(chunk) == 1 for chunk in chunks)
+    assert len(chunks) == 6
+    assert decode_dict(cache_provider.full_data) == decode_dict(
+        {
+            "app/collection1:1": '{"id": 1, "value": "value1"}',
+            "app/collection1:2": '{"id": 2, "value": "value2"}',
+            "app/collection2:1": '{"id": 1, "key": "value1"}',
+            "app/collection2:2": '{"id": 2, "key": "value2"}',
+            "app/personalized-collection:1": '{"id": 1, "key": "value1", "user_id": 1}',
+            "app/personalized-collection:2": '{"id": 2, "key": "value2", "user_id": 2}',
+        }
+    )
@@ -0,0 +1,35 @@
+import pytest
+
+from openslides.utils.json_codec import codec_classes, get_codec
+
+
+def installed_codecs():
+    codecs = []
+    for name in codec_classes:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+@pytest.mark.parametrize("codec", installed_codecs(), ids=lambda codec: codec.name)
+def test_codec_round_trip(codec):
+    data = {"id": 1, "text": "<p>ä/ö</p>", "values": [1, 2.5, None, True]}
+
+    assert codec.loads(codec.dumps(data)) == data
+    assert codec.loads(codec.dumps_bytes(data)) == data
+
+
+@pytest.mark.parametrize("codec", installed_codecs(), ids=lambda codec: codec.name)
+def test_codec_compact(codec):
+    assert codec.dumps({"a": [1, 2]}) == '{"a":[1,2]}'
+
+
+def test_get_codec_auto():
+    assert get_codec("auto").name in codec_classes
+
+
+def test_get_codec_unknown():
+    with pytest.raises(ValueError):
+        get_codec("unknown")
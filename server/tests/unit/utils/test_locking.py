@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from openslides.utils.locking import Lock, MemoryLockProvider
+
+
+@pytest.fixture
+def lock_provider():
+    return MemoryLockProvider()
+
+
+@pytest.mark.asyncio
+async def test_lock(lock_provider):
+    lock = Lock("test", lock_provider=lock_provider)
+    other_lock = Lock("test", lock_provider=lock_provider)
+
+    assert await lock.acquire(blocking=False)
+    assert not await other_lock.acquire(blocking=False)
+    await lock.release()
+    assert await other_lock.acquire(blocking=False)
+    await other_lock.release()
+    assert not await lock_provider.get("test")
+
+
+@pytest.mark.asyncio
+async def test_lock_expires(lock_provider):
+    await lock_provider.set("test", "crashed_worker", ttl=0.01)
+    await asyncio.sleep(0.02)
+
+    async with Lock("test", lock_provider=lock_provider):
+        assert await lock_provider.get("test")
+
+
+@pytest.mark.asyncio
+async def test_lock_is_renewed(lock_provider):
+    lock = Lock("test", ttl=0.03, lock_provider=lock_provider)
+    await lock.acquire()
+    await asyncio.sleep(0.1)
+
+    assert not await Lock("test", lock_provider=lock_provider).acquire(blocking=False)
+    await lock.release()
+
+
+@pytest.mark.asyncio
+async def test_lock_release_keeps_lock_of_others(lock_provider):
+    lock = Lock("test", ttl=0.01, lock_provider=lock_provider)
+    await lock.acquire()
+    assert lock.renewal is not None
+    lock.renewal.cancel()
+    await asyncio.sleep(0.02)
+    await lock_provider.set("test", "other_worker")
+
+    await lock.release()
+
+    assert await lock_provider.get("test")
+
+
+@pytest.mark.asyncio
+async def test_lock_wait(lock_provider):
+    lock = Lock("test", lock_provider=lock_provider)
+    await lock.acquire()
+
+    async def release():
+        await asyncio.sleep(0.05)
+        await lock.release()
+
+    asyncio.ensure_future(release())
+    await Lock("test", lock_provider=lock_provider).wait()
+
+    assert not await lock_provider.get("test")